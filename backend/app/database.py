@@ -1,17 +1,138 @@
-"""Supabase database connection."""
+"""Database connections (Supabase/PostgREST or direct PostgreSQL)."""
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from typing import Optional
+from typing import Any, Optional
+from app.request_metrics import record_query
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Storage backend: "supabase" (PostgREST over HTTPS, the default) or
+# "postgres" (direct connections to DATABASE_URL, e.g. self-hosted or an
+# on-site server with the same migrations applied)
+storage_backend: str = os.getenv("STORAGE_BACKEND", "supabase").lower()
+
 # Supabase connection
 supabase_url: Optional[str] = os.getenv("SUPABASE_URL")
 supabase_key: Optional[str] = os.getenv("SUPABASE_ANON_KEY")
 
-if not supabase_url or not supabase_key:
-    raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+# Direct PostgreSQL connection (STORAGE_BACKEND=postgres)
+database_url: Optional[str] = os.getenv("DATABASE_URL")
+
+# Concurrency and latency limits for database calls
+# DB_MAX_CONCURRENCY: max database calls in flight per worker (thread pool
+#   size, and the most connections the PostgreSQL pool opens)
+# DB_QUERY_TIMEOUT: seconds before a single call is abandoned
+db_max_concurrency: int = int(os.getenv("DB_MAX_CONCURRENCY", "32"))
+db_query_timeout: float = float(os.getenv("DB_QUERY_TIMEOUT", "10"))
+
+# Clients are created on first use (or by the startup warm-up), not on
+# import: importing the app needs no credentials and no network, and the
+# supabase package alone is about a third of the app's import time
+_supabase: Any = None
+_pg_pool: Any = None
+_clients_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=db_max_concurrency, thread_name_prefix="db")
+
+
+def check_config() -> None:
+    """Raise ValueError if the selected backend is not configured."""
+    if storage_backend not in ("supabase", "postgres"):
+        raise ValueError("STORAGE_BACKEND must be 'supabase' or 'postgres'")
+    if storage_backend == "supabase" and (not supabase_url or not supabase_key):
+        raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+    if storage_backend == "postgres" and not database_url:
+        raise ValueError("DATABASE_URL must be set when STORAGE_BACKEND=postgres")
+
+
+def get_supabase() -> Any:
+    """
+    The PostgREST client, created once and shared by every worker thread
+    (its httpx connection pool keeps connections to Supabase open).
+    """
+    global _supabase
+    if _supabase is None:
+        with _clients_lock:
+            if _supabase is None:
+                check_config()
+                from supabase import create_client
+                from supabase.lib.client_options import ClientOptions
+                client = create_client(
+                    supabase_url,
+                    supabase_key,
+                    options=ClientOptions(postgrest_client_timeout=db_query_timeout),
+                )
+                client.postgrest  # Creates the HTTP session up front
+                _supabase = client
+    return _supabase
+
+
+def get_pg_pool() -> Any:
+    """
+    The PostgreSQL connection pool (STORAGE_BACKEND=postgres). Connections
+    are opened on demand, one per busy worker thread at most, and kept for
+    reuse; statement_timeout stops queries run_query has given up on
+    (needs psycopg2: pip install psycopg2-binary).
+    """
+    global _pg_pool
+    if _pg_pool is None:
+        with _clients_lock:
+            if _pg_pool is None:
+                check_config()
+                from psycopg2.pool import ThreadedConnectionPool
+                _pg_pool = ThreadedConnectionPool(
+                    0,
+                    db_max_concurrency,
+                    database_url,
+                    options=f"-c statement_timeout={int(db_query_timeout * 1000)}",
+                )
+    return _pg_pool
+
+
+def connect() -> None:
+    """Create the selected backend's client (blocking; imports the driver)."""
+    if storage_backend == "postgres":
+        get_pg_pool()
+    else:
+        get_supabase()
+
+
+def close() -> None:
+    """Close the clients' connections; they are recreated on next use."""
+    global _supabase, _pg_pool
+    with _clients_lock:
+        if _supabase is not None:
+            _supabase.postgrest.aclose()  # Synchronous despite the name
+            _supabase = None
+        if _pg_pool is not None:
+            _pg_pool.closeall()
+            _pg_pool = None
+
+
+async def open_database() -> None:
+    """Create the client on a database thread, off the event loop."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_executor, connect)
+
 
-supabase: Client = create_client(supabase_url, supabase_key)
+async def run_query(query: Any) -> Any:
+    """
+    Execute a query (a PostgREST builder or a SqlQuery) off the event loop.
+    The blocking .execute() call runs on a bounded thread pool so one slow
+    round trip no longer stalls every other request on the worker.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(_executor, query.execute),
+            timeout=db_query_timeout,
+        )
+    finally:
+        # Counted per request for Server-Timing and /metrics
+        record_query(time.perf_counter() - started)
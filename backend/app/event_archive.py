@@ -0,0 +1,101 @@
+"""Archived event history: monthly files written by scripts/events_archive.py."""
+import csv
+import gzip
+import io
+import os
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+# Directory the archival job writes to and GET /events/export reads
+# archived months from (both must run on the same host or share the volume)
+events_archive_dir: str = os.getenv("EVENTS_ARCHIVE_DIR", "archive/events")
+
+# Parquet archives need pyarrow (pip install pyarrow); csv.gz needs nothing
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Columns of events, in table order (the archive files use the same order)
+EVENT_COLUMNS = [
+    "event_id", "client_event_id", "event_type", "box_id", "location_id", "timestamp",
+    "user_id", "mode", "source_type", "source_id", "raw_qr_value", "warning",
+    "exception_type", "reversed",
+]
+
+# Rows handed to the export stream per read from an archive file
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_path(file_name: str) -> str:
+    return os.path.join(events_archive_dir, file_name)
+
+
+def parse_csv_row(row: dict) -> dict:
+    """Turn a row of a COPY ... CSV archive into what the API returns for a live event."""
+    event = {column: (row.get(column) or None) for column in EVENT_COLUMNS}
+    event["reversed"] = event["reversed"] in ("t", "true")
+    if event["timestamp"]:
+        event["timestamp"] = event["timestamp"].replace(" ", "T")
+    return event
+
+
+def parse_parquet_row(row: dict) -> dict:
+    event = {column: row.get(column) for column in EVENT_COLUMNS}
+    if isinstance(event["timestamp"], datetime):
+        event["timestamp"] = event["timestamp"].isoformat()
+    event["reversed"] = bool(event["reversed"])
+    return event
+
+
+def in_range(rows: Iterator[dict], start: datetime, end: datetime) -> Iterator[List[dict]]:
+    """Batch the rows of a time-ordered stream with a timestamp in [start, end)."""
+    batch = []
+    for row in rows:
+        timestamp = datetime.fromisoformat(row["timestamp"])
+        if timestamp < start:
+            continue
+        if timestamp >= end:
+            break
+        batch.append(row)
+        if len(batch) == ARCHIVE_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_archive(archive: dict, start: datetime, end: datetime) -> Iterator[List[dict]]:
+    """
+    Yield the events of one archive file (an event_archives row) with a
+    timestamp in [start, end), in batches, in the order they were written
+    (timestamp, event_id).
+    """
+    path = archive_path(archive["file_name"])
+    if archive["format"] == "parquet":
+        if pq is None:
+            raise RuntimeError("Reading Parquet archives requires pyarrow")
+        parquet_file = pq.ParquetFile(path)
+        rows = (parse_parquet_row(row) for batch in parquet_file.iter_batches() for row in batch.to_pylist())
+        yield from in_range(rows, start, end)
+        return
+    
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        yield from in_range((parse_csv_row(row) for row in csv.DictReader(f)), start, end)
+
+
+def missing_archive(archives: List[dict]) -> Optional[dict]:
+    """The first archive whose file is not on this host, if any."""
+    for archive in archives:
+        if not os.path.exists(archive_path(archive["file_name"])):
+            return archive
+    return None
+
+
+def csv_lines(rows: List[dict]) -> str:
+    """Encode rows as CSV lines in EVENT_COLUMNS order."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row.get(column) is None else row[column] for column in EVENT_COLUMNS])
+    return buffer.getvalue()
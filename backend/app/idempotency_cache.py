@@ -0,0 +1,168 @@
+"""Idempotency cache: answers retried scans (same client_event_id) without the database."""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+from app.utils.ttl_cache import TTLCache, MISSING
+
+# Phones retry a scan within seconds to minutes; entries expire after
+# IDEMPOTENCY_CACHE_TTL seconds. Only scans the database has committed are
+# cached, and record_scan stays the source of truth (the unique
+# client_event_id), so an expired or evicted entry just costs one round trip.
+idempotency_cache_ttl: float = float(os.getenv("IDEMPOTENCY_CACHE_TTL", "600"))
+idempotency_cache_size: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "20000"))
+# Optional SQLite file shared by the workers on one host, so a retry that
+# lands on a different worker is answered from cache as well
+idempotency_cache_path: Optional[str] = os.getenv("IDEMPOTENCY_CACHE_PATH") or None
+
+# Same answer record_scan gives for a client_event_id it has already stored
+DUPLICATE_MESSAGE = "Event already processed"
+
+# Expired rows are purged from the shared store every this many writes
+SHARED_PURGE_EVERY = 1000
+
+idempotency_cache = TTLCache(idempotency_cache_size, idempotency_cache_ttl)
+
+
+class SharedStore:
+    """Best-effort key/value store in a local SQLite file (WAL, short timeouts)."""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.errors = 0
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=0.05, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            row = self._conn.execute(
+                "SELECT value FROM idempotency WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        if row is None:
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict) -> None:
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO idempotency (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), time.time() + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % SHARED_PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM idempotency WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {"path": self.path, "hits": self.hits, "errors": self.errors}
+
+
+shared_store: Optional[SharedStore] = None
+if idempotency_cache_path:
+    try:
+        shared_store = SharedStore(idempotency_cache_path, idempotency_cache_ttl)
+    except sqlite3.Error as e:
+        print(f"Idempotency cache: shared store disabled ({e})")
+
+# client_event_id -> future of the scan currently being recorded, so
+# concurrent retries wait for the first attempt instead of racing it
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def duplicate_response(scan: dict) -> dict:
+    """The answer for a retry of a recorded scan (what record_scan returns for duplicates)."""
+    return {
+        "success": True,
+        "message": DUPLICATE_MESSAGE,
+        "event_id": str(scan["event_id"]),
+        "warning": None,
+        "exception_type": scan.get("exception_type"),
+        "is_duplicate": True,
+        "changed": False,
+        "box_id": scan["box_id"],
+        "product": scan.get("product"),
+        "lot_code": scan.get("lot_code"),
+    }
+
+
+def lookup(client_event_id: str) -> Optional[dict]:
+    """Get the duplicate answer for a client_event_id, or None if it is not cached."""
+    response = idempotency_cache.get(client_event_id)
+    if response is not MISSING:
+        return response
+    if shared_store is not None:
+        response = shared_store.get(client_event_id)
+        if response is not None:
+            idempotency_cache.set(client_event_id, response)
+            return response
+    return None
+
+
+def remember(client_event_id: str, scan: dict) -> None:
+    """Cache a scan the database has committed (new or duplicate)."""
+    if not scan or not scan.get("success") or not scan.get("event_id"):
+        return
+    response = duplicate_response(scan)
+    idempotency_cache.set(client_event_id, response)
+    if shared_store is not None:
+        shared_store.set(client_event_id, response)
+
+
+def remember_many(scans: Iterable[dict]) -> None:
+    """Cache committed scans from a batch (each carries its client_event_id)."""
+    for scan in scans:
+        if scan.get("client_event_id"):
+            remember(str(scan["client_event_id"]), scan)
+
+
+async def record_once(client_event_id: str, record: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Record a scan unless it is a known retry. Cached retries are answered
+    from memory; a retry arriving while the first attempt is still in
+    flight waits for it. Anything else goes to record().
+    """
+    cached = lookup(client_event_id)
+    if cached is not None:
+        return cached
+    
+    pending = _inflight.get(client_event_id)
+    if pending is not None:
+        scan = await asyncio.shield(pending)
+        if scan and scan.get("success"):
+            return duplicate_response(scan)
+        # The first attempt failed or was rejected: evaluate this one on its own
+        return await record()
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight[client_event_id] = future
+    scan = None
+    try:
+        scan = await record()
+        remember(client_event_id, scan)
+        return scan
+    finally:
+        # Waiters see None on errors and retry themselves
+        future.set_result(scan)
+        del _inflight[client_event_id]
+
+
+def idempotency_cache_stats() -> dict:
+    stats = idempotency_cache.stats()
+    stats["in_flight"] = len(_inflight)
+    if shared_store is not None:
+        stats["shared"] = shared_store.stats()
+    return stats
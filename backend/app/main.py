@@ -1,9 +1,62 @@
 """FastAPI application entry point."""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import products, boxes, locations, events, exceptions, inventory, stats
+from app.database import check_config, open_database, close as close_database
+from app.routers import products, boxes, locations, events, exceptions, inventory, stats, stream, search
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.reference_cache import cache_stats, preload as preload_reference_cache
+from app.utils.label_renderer import label_cache_stats, shutdown_pool as shutdown_label_pool
+from app.idempotency_cache import idempotency_cache_stats
+from app.request_metrics import RequestMetricsMiddleware, render_metrics
+from app.routers.stats import stats_today_flight
+from app.routers.locations import locations_flight
+from app.routers.products import products_flight
 
-app = FastAPI(title="Phone Inventory Location API", version="1.0.0")
+# After startup, create the database client and preload the reference cache
+# in the background, so the first requests find both ready (0 disables)
+startup_warm_up: bool = os.getenv("STARTUP_WARM_UP", "1").lower() not in ("0", "false", "no")
+
+# Add a Server-Timing header to every response (database time and round
+# trips, time until the response started); 0 disables the header, /metrics
+# is always collected
+server_timing: bool = os.getenv("SERVER_TIMING", "1").lower() not in ("0", "false", "no")
+
+warm_up_state = {"done": False, "seconds": None, "error": None}
+
+
+async def warm_up() -> None:
+    started = time.perf_counter()
+    try:
+        await open_database()
+        await preload_reference_cache()
+    except Exception as e:
+        # Requests create the client and fill the caches on demand instead
+        warm_up_state["error"] = str(e)
+        print(f"Warm-up failed: {e}")
+    warm_up_state["done"] = True
+    warm_up_state["seconds"] = round(time.perf_counter() - started, 3)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail fast on missing credentials; connecting is left to the warm-up so
+    # the server starts accepting requests right away
+    check_config()
+    warm_up_task: Optional[asyncio.Task] = asyncio.create_task(warm_up()) if startup_warm_up else None
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    shutdown_label_pool()
+    close_database()
+
+
+app = FastAPI(title="Phone Inventory Location API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -12,8 +65,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "Server-Timing"],  # Cursor pagination, timings
 )
 
+# Per-request database round trips and latency (Server-Timing, /metrics)
+app.add_middleware(RequestMetricsMiddleware, server_timing=server_timing)
+
 # Include routers
 app.include_router(products.router)
 app.include_router(boxes.router)
@@ -22,6 +79,8 @@ app.include_router(events.router)
 app.include_router(exceptions.router)
 app.include_router(inventory.router)
 app.include_router(stats.router)
+app.include_router(stream.router)
+app.include_router(search.router)
 
 
 @app.get("/")
@@ -31,4 +90,25 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    return {"status": "healthy", "warm_up": warm_up_state}
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters for the in-process caches."""
+    return {
+        **cache_stats(),
+        "labels": label_cache_stats(),
+        "idempotency": idempotency_cache_stats(),
+        "reads": {
+            "stats_today": stats_today_flight.stats(),
+            "locations": locations_flight.stats(),
+            "products": products_flight.stats(),
+        },
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, latency and database metrics of this worker in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,6 +1,6 @@
 """Pydantic models for request/response validation."""
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from uuid import UUID
 
@@ -26,6 +26,17 @@ class BoxCreate(BaseModel):
     lot_code: Optional[str] = None
 
 
+class BoxBulkCreate(BaseModel):
+    product_id: UUID
+    lot_code: Optional[str] = None
+    count: int = Field(..., ge=1, le=1000)
+
+
+class BoxLabelsRequest(BaseModel):
+    box_ids: List[str] = Field(..., min_length=1, max_length=2000)
+    format: str = Field(default="pdf", pattern="^(pdf|png)$")
+
+
 class BoxResponse(BaseModel):
     box_id: str
     qr_value: str
@@ -57,6 +68,22 @@ class EventResponse(BaseModel):
     lot_code: Optional[str] = None
 
 
+class EventBatchResult(BaseModel):
+    client_event_id: UUID
+    success: bool
+    message: Optional[str] = None
+    error: Optional[str] = None  # Set when the scan was rejected
+    status_code: Optional[int] = None
+    event_id: Optional[UUID] = None
+    warning: Optional[str] = None
+    exception_type: Optional[str] = None
+    is_duplicate: bool = False
+    changed: Optional[bool] = None
+    box_id: Optional[str] = None
+    product: Optional[dict] = None
+    lot_code: Optional[str] = None
+
+
 # Location Models
 class LocationCreate(BaseModel):
     zone: str
@@ -65,6 +92,26 @@ class LocationCreate(BaseModel):
     shelf: str
 
 
+class LocationRange(BaseModel):
+    """Every combination of the given aisles, racks and shelves in one zone."""
+    zone: str
+    aisles: str  # e.g. "A-F", "1-12" or "A,C,E"
+    racks: str  # e.g. "1-20"
+    shelves: str  # e.g. "1-5"
+
+
+class LocationBulkCreate(BaseModel):
+    locations: Optional[List[LocationCreate]] = None
+    range: Optional[LocationRange] = None
+
+
+class LocationBulkResult(BaseModel):
+    requested: int
+    created: int
+    existing: int
+    created_codes: List[str]
+
+
 class LocationResponse(BaseModel):
     location_id: UUID
     location_code: str
@@ -86,6 +133,11 @@ class InventoryItem(BaseModel):
     lot_code: Optional[str] = None
 
 
+class InventoryRebuild(BaseModel):
+    # Full rebuilds run from scripts/inventory_rebuild.py
+    box_ids: List[str] = Field(..., min_length=1, max_length=2000)
+
+
 # Box Details Models
 class BoxDetailsResponse(BaseModel):
     box_id: str
@@ -0,0 +1,141 @@
+"""Read-through cache for reference data (products, locations and the warehouse time zone)."""
+import asyncio
+import os
+from typing import Dict, Iterable, Optional
+from app.repositories import repositories
+from app.utils.ttl_cache import TTLCache, MISSING
+
+# Products and locations change rarely; entries expire after
+# REFERENCE_CACHE_TTL seconds and are also dropped on POST /products and
+# POST /locations
+reference_cache_ttl: float = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+reference_cache_size: int = int(os.getenv("REFERENCE_CACHE_SIZE", "10000"))
+
+products_cache = TTLCache(reference_cache_size, reference_cache_ttl)
+# Keyed by ("id", location_id) and ("code", location_code)
+locations_cache = TTLCache(reference_cache_size, reference_cache_ttl)
+# stats_settings.time_zone; changed with scripts/daily_stats.py, picked up
+# within REFERENCE_CACHE_TTL
+settings_cache = TTLCache(1, reference_cache_ttl)
+
+
+def _cache_location(location: dict) -> None:
+    locations_cache.set(("id", location["location_id"]), location)
+    locations_cache.set(("code", location["location_code"]), location)
+
+
+async def get_products(product_ids: Iterable) -> Dict[str, dict]:
+    """Get products by ID; cache misses are fetched with one query."""
+    products = {}
+    missing = []
+    for product_id in set(str(product_id) for product_id in product_ids if product_id):
+        product = products_cache.get(product_id)
+        if product is MISSING:
+            missing.append(product_id)
+        else:
+            products[product_id] = product
+    
+    if missing:
+        for product in await repositories.products.get_many(missing):
+            products_cache.set(product["product_id"], product)
+            products[product["product_id"]] = product
+    
+    return products
+
+
+async def get_product(product_id) -> Optional[dict]:
+    """Get one product by ID."""
+    return (await get_products([product_id])).get(str(product_id))
+
+
+async def get_locations(location_ids: Iterable) -> Dict[str, dict]:
+    """Get locations by ID; cache misses are fetched with one query."""
+    locations = {}
+    missing = []
+    for location_id in set(str(location_id) for location_id in location_ids if location_id):
+        location = locations_cache.get(("id", location_id))
+        if location is MISSING:
+            missing.append(location_id)
+        else:
+            locations[location_id] = location
+    
+    if missing:
+        for location in await repositories.locations.get_many(missing):
+            _cache_location(location)
+            locations[location["location_id"]] = location
+    
+    return locations
+
+
+async def get_location(location_id) -> Optional[dict]:
+    """Get one location by ID."""
+    return (await get_locations([location_id])).get(str(location_id))
+
+
+async def get_location_by_code(location_code: str) -> Optional[dict]:
+    """Get one location by its location_code."""
+    location = locations_cache.get(("code", location_code))
+    if location is not MISSING:
+        return location
+    
+    location = await repositories.locations.get_by_code(location_code)
+    if not location:
+        return None
+    
+    _cache_location(location)
+    return location
+
+
+async def get_receiving_location_id() -> Optional[str]:
+    """Get the RECEIVING system location_id."""
+    location = await get_location_by_code("RECEIVING")
+    return location["location_id"] if location else None
+
+
+async def get_time_zone() -> str:
+    """Get the IANA time zone local days are counted in (migration 019)."""
+    time_zone = settings_cache.get("time_zone")
+    if time_zone is not MISSING:
+        return time_zone
+    
+    time_zone = await repositories.counters.time_zone() or "UTC"
+    settings_cache.set("time_zone", time_zone)
+    return time_zone
+
+
+async def preload() -> None:
+    """
+    Fill the caches at startup: RECEIVING and the time zone, then as many
+    locations and products as fit, so the first scans and dashboards skip
+    these lookups.
+    """
+    # Each location takes two entries (by ID and by code)
+    _, _, locations, products = await asyncio.gather(
+        get_receiving_location_id(),
+        get_time_zone(),
+        repositories.locations.list(reference_cache_size // 2),
+        repositories.products.list(reference_cache_size)
+    )
+    for location in locations:
+        _cache_location(location)
+    for product in products:
+        products_cache.set(product["product_id"], product)
+
+
+def invalidate_products() -> None:
+    """Drop cached products (called after products change)."""
+    products_cache.clear()
+
+
+def invalidate_locations() -> None:
+    """Drop cached locations (called after locations change)."""
+    locations_cache.clear()
+
+
+def cache_stats() -> dict:
+    """Get hit/miss counters for each reference cache."""
+    return {
+        "products": products_cache.stats(),
+        "locations": locations_cache.stats(),
+        "settings": settings_cache.stats(),
+    }
@@ -0,0 +1,14 @@
+"""
+Data access for the routers: one repository per entity (products, boxes,
+locations, events, inventory_state and counters), implemented for the
+backend STORAGE_BACKEND selects.
+"""
+from app.database import storage_backend
+from app.repositories.base import UNIQUE_VIOLATION, Repositories, StorageError
+
+if storage_backend == "postgres":
+    from app.repositories.postgres_backend import create_repositories
+else:
+    from app.repositories.supabase_backend import create_repositories
+
+repositories: Repositories = create_repositories()
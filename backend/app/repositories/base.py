@@ -0,0 +1,217 @@
+"""Repository interfaces: what the routers need from storage, independent of the backend."""
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+# (sort value, unique id) of the last row of the previous page
+Position = Optional[Tuple[Any, Any]]
+
+# PostgreSQL unique_violation
+UNIQUE_VIOLATION = "23505"
+
+
+class StorageError(Exception):
+    """A database error, with its PostgreSQL SQLSTATE code when the backend reports one."""
+
+    def __init__(self, message: str, code: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+
+
+class ProductRepository(ABC):
+
+    @abstractmethod
+    async def create(self, product: dict) -> Optional[dict]:
+        """Insert a product (brand, name, size) and return the stored row."""
+
+    @abstractmethod
+    async def list(self, limit: Optional[int] = None) -> List[dict]:
+        """Get products ordered by brand and name."""
+
+    @abstractmethod
+    async def get_many(self, product_ids: List[str]) -> List[dict]:
+        """Get the products with the given IDs (unknown IDs are left out)."""
+
+    @abstractmethod
+    async def search(self, query: str, limit: int) -> List[dict]:
+        """Best-matching products (search_products, migration 015)."""
+
+    @abstractmethod
+    async def search_catalog(self, query: str, limit: int) -> dict:
+        """Products, boxes and lots matching query (search_catalog, migration 015)."""
+
+    @abstractmethod
+    async def stock(self, product_id: Optional[str] = None, lot_code: Optional[str] = None) -> dict:
+        """Stock per product with lot and location breakdowns (product_stock_report, migration 021)."""
+
+
+class LocationRepository(ABC):
+
+    @abstractmethod
+    async def list(self, limit: Optional[int] = None) -> List[dict]:
+        """Get locations ordered by zone and aisle."""
+
+    @abstractmethod
+    async def get_many(self, location_ids: List[str]) -> List[dict]:
+        """Get the locations with the given IDs (unknown IDs are left out)."""
+
+    @abstractmethod
+    async def get_by_code(self, location_code: str) -> Optional[dict]:
+        """Get one location by its location_code."""
+
+    @abstractmethod
+    async def create(self, location: dict) -> Optional[dict]:
+        """
+        Insert a location and return the stored row. Raises StorageError
+        with code UNIQUE_VIOLATION if the location_code is taken.
+        """
+
+    @abstractmethod
+    async def create_missing(self, locations: List[dict]) -> List[dict]:
+        """Insert the locations whose location_code is new; return only the inserted rows."""
+
+    @abstractmethod
+    async def occupancy(self, zone: Optional[str], aisle: Optional[str], include_empty: bool) -> dict:
+        """Per-location box counts and their totals (location_occupancy_report, migration 020)."""
+
+
+class BoxRepository(ABC):
+
+    @abstractmethod
+    async def create_many(self, boxes: List[dict]) -> List[dict]:
+        """Insert boxes (box_id, product_id, lot_code) and return the stored rows."""
+
+    @abstractmethod
+    async def get_many(self, box_ids: List[str]) -> List[dict]:
+        """Get the boxes with the given IDs (unknown IDs are left out)."""
+
+    @abstractmethod
+    async def get_with_state(self, box_id: str) -> Optional[dict]:
+        """Get one box with its inventory_state row (or None) under "inventory_state"."""
+
+    @abstractmethod
+    async def search(self, query: str, limit: int) -> List[dict]:
+        """Boxes whose ID contains query, prefix and suffix matches first (search_boxes, migration 018)."""
+
+    @abstractmethod
+    async def search_lots(self, query: str, limit: int) -> List[dict]:
+        """Lot codes starting with query (search_lots, migration 015)."""
+
+
+class EventRepository(ABC):
+
+    @abstractmethod
+    async def feed(self, after: Position, limit: int, exceptions_only: bool = False) -> List[dict]:
+        """Non-reversed events, newest first, after a (timestamp, event_id) position."""
+
+    @abstractmethod
+    async def exceptions(self, after: Position, limit: int, exception_type: Optional[str] = None) -> List[dict]:
+        """
+        Events with an exception_type, newest first, each with its box's
+        product_id under "boxes".
+        """
+
+    @abstractmethod
+    async def box_timeline(self, box_id: str, after: Position, limit: int) -> List[dict]:
+        """A box's events newest first, before a (timestamp, event_id) position."""
+
+    @abstractmethod
+    async def recent(self, limit: int) -> List[dict]:
+        """The latest non-reversed events, each with its box's product_id and lot_code under "boxes"."""
+
+    @abstractmethod
+    async def received_times(self, box_ids: List[str]) -> Dict[str, str]:
+        """Timestamp of the first non-reversed IN event of each box."""
+
+    @abstractmethod
+    async def record_scan(self, scan: dict) -> dict:
+        """Record one scan in one transaction (record_scan, migration 004)."""
+
+    @abstractmethod
+    async def record_scans(self, scans: List[dict]) -> Optional[List[dict]]:
+        """Record an ordered batch of scans (record_scans, migration 005)."""
+
+    @abstractmethod
+    async def undo(self, event_id: str) -> dict:
+        """Reverse an event and re-project its box (undo_event, migration 011)."""
+
+    @abstractmethod
+    async def exception_summary(
+        self,
+        range_start: str,
+        range_end: str,
+        exception_type: Optional[str] = None
+    ) -> dict:
+        """Exception counts grouped by type, local day, product and source (migrations 008, 019)."""
+
+    @abstractmethod
+    async def archives(self, range_start: str, range_end: str) -> List[dict]:
+        """event_archives rows overlapping [range_start, range_end), oldest first."""
+
+    @abstractmethod
+    async def export(self, range_start: str, range_end: str, after: Position, limit: int) -> List[dict]:
+        """Events (reversed included) in [range_start, range_end) in time order (export_events, migration 017)."""
+
+
+class InventoryRepository(ABC):
+
+    @abstractmethod
+    async def search(self, filters: Dict[str, Any], after: Position, limit: Optional[int]) -> List[dict]:
+        """
+        inventory_view rows, newest first (search_inventory, migration 018).
+        filters holds the search_inventory parameters without the p_ prefix.
+        """
+
+    @abstractmethod
+    async def count_in_stock(self, location_id: str) -> int:
+        """Number of IN_STOCK boxes at a location."""
+
+    @abstractmethod
+    async def oldest_in_stock(self, location_id: str, limit: int) -> List[dict]:
+        """
+        IN_STOCK boxes at a location, longest waiting first, each with its
+        product_id and lot_code under "boxes".
+        """
+
+    @abstractmethod
+    async def latest_in_stock(self, location_id: str, limit: int) -> List[dict]:
+        """IN_STOCK boxes at a location (box_id, last_event_time), most recently moved first."""
+
+    @abstractmethod
+    async def rebuild(self, box_ids: List[str]) -> dict:
+        """Rebuild inventory_state for the given boxes from the events log (rebuild_inventory_state, migration 011)."""
+
+
+class CounterRepository(ABC):
+
+    @abstractmethod
+    async def daily_stats(self, day: date) -> dict:
+        """One local day's counters from the daily_stats rollup (migrations 010, 019)."""
+
+    @abstractmethod
+    async def time_zone(self) -> Optional[str]:
+        """The IANA time zone local days are counted in (stats_settings, migration 019)."""
+
+    @abstractmethod
+    async def reserve_box_ids(self, day: date, block_size: int) -> Optional[int]:
+        """Reserve block_size sequence numbers for day; return the last one (migration 012)."""
+
+
+class Repositories:
+    """The repositories of one storage backend."""
+
+    def __init__(
+        self,
+        products: ProductRepository,
+        locations: LocationRepository,
+        boxes: BoxRepository,
+        events: EventRepository,
+        inventory: InventoryRepository,
+        counters: CounterRepository
+    ):
+        self.products = products
+        self.locations = locations
+        self.boxes = boxes
+        self.events = events
+        self.inventory = inventory
+        self.counters = counters
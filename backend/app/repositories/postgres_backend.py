@@ -0,0 +1,343 @@
+"""
+Repositories backed by PostgreSQL directly (STORAGE_BACKEND=postgres).
+
+Statements run on the psycopg2 pool from app.database through run_query,
+like PostgREST calls. Rows are built with row_to_json, so they have the
+same shape (ISO timestamps, string UUIDs, embedded objects) as the
+Supabase backend returns. The rules live in the same SQL functions, so
+the database needs the migrations in supabase/migrations applied.
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence
+import psycopg2
+from psycopg2.extras import Json
+from app.database import get_pg_pool, run_query
+from app.repositories.base import (
+    Position, StorageError, Repositories, ProductRepository, LocationRepository, BoxRepository,
+    EventRepository, InventoryRepository, CounterRepository
+)
+
+
+class SqlResult:
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class SqlQuery:
+    """
+    One statement on the PostgreSQL pool, run in its own transaction.
+    Shaped like a PostgREST builder (execute() returns a result with .data)
+    so run_query executes both. With single=True, data is the first column
+    of the first row; otherwise it is the first column of every row.
+    """
+
+    def __init__(self, sql: str, params: Sequence = (), single: bool = False):
+        self.sql = sql
+        self.params = params
+        self.single = single
+
+    def execute(self) -> SqlResult:
+        pool = get_pg_pool()
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(self.sql, self.params)
+                data = cur.fetchone()[0] if self.single else [row[0] for row in cur.fetchall()]
+            conn.commit()
+            return SqlResult(data)
+        except psycopg2.Error as e:
+            if not conn.closed:
+                conn.rollback()
+            raise StorageError(str(e).strip(), code=e.pgcode) from e
+        finally:
+            # Broken connections are dropped instead of going back to the pool
+            pool.putconn(conn, close=bool(conn.closed))
+
+
+async def fetch_rows(sql: str, *params: Any) -> List[dict]:
+    """Rows of a SELECT (or DML ... RETURNING) as dicts, in the statement's order."""
+    result = await run_query(SqlQuery(f"WITH t AS ({sql}) SELECT row_to_json(t) FROM t", params))
+    return result.data
+
+
+async def fetch_one(sql: str, *params: Any) -> Optional[dict]:
+    rows = await fetch_rows(sql, *params)
+    return rows[0] if rows else None
+
+
+async def fetch_value(sql: str, *params: Any) -> Any:
+    """The single value of a SELECT (JSON/JSONB values are decoded)."""
+    result = await run_query(SqlQuery(sql, params, single=True))
+    return result.data
+
+
+def call(function: str, params: Dict[str, Any]) -> tuple:
+    """Named-argument call of a SQL function: ("f(p_a => %s, ...)", values)."""
+    arguments = ", ".join(f"{name} => %s" for name in params)
+    return f"{function}({arguments})", tuple(params.values())
+
+
+async def call_value(function: str, params: Dict[str, Any]) -> Any:
+    sql, values = call(function, params)
+    return await fetch_value(f"SELECT {sql}", *values)
+
+
+async def call_rows(function: str, params: Dict[str, Any]) -> List[dict]:
+    sql, values = call(function, params)
+    return await fetch_rows(f"SELECT * FROM {sql}", *values)
+
+
+def insert_rows(table: str, columns: List[str], on_conflict: str = "") -> str:
+    """INSERT of a JSON array of rows (one parameter), returning the inserted rows."""
+    column_list = ", ".join(columns)
+    return (
+        f"INSERT INTO {table} ({column_list}) "
+        f"SELECT {column_list} FROM json_populate_recordset(NULL::{table}, %s) "
+        f"{on_conflict} RETURNING *"
+    )
+
+
+def keyset(after: Position, descending: bool = True) -> tuple:
+    """Condition and values restricting a (timestamp, event_id) ordered read to rows after the cursor."""
+    if not after:
+        return "TRUE", ()
+    op = "<" if descending else ">"
+    return f"(timestamp, event_id) {op} (%s::timestamp, %s::uuid)", tuple(after)
+
+
+class PostgresProductRepository(ProductRepository):
+
+    async def create(self, product: dict) -> Optional[dict]:
+        return await fetch_one(insert_rows("products", ["brand", "name", "size"]), Json([product]))
+
+    async def list(self, limit: Optional[int] = None) -> List[dict]:
+        return await fetch_rows("SELECT * FROM products ORDER BY brand, name LIMIT %s", limit)
+
+    async def get_many(self, product_ids: List[str]) -> List[dict]:
+        return await fetch_rows("SELECT * FROM products WHERE product_id = ANY(%s::uuid[])", list(product_ids))
+
+    async def search(self, query: str, limit: int) -> List[dict]:
+        return await call_rows("search_products", {"p_query": query, "p_limit": limit})
+
+    async def search_catalog(self, query: str, limit: int) -> dict:
+        return await call_value("search_catalog", {"p_query": query, "p_limit": limit})
+
+    async def stock(self, product_id: Optional[str] = None, lot_code: Optional[str] = None) -> dict:
+        return await call_value("product_stock_report", {
+            "p_product_id": product_id,
+            "p_lot_code": lot_code
+        })
+
+
+class PostgresLocationRepository(LocationRepository):
+
+    COLUMNS = ["location_code", "zone", "aisle", "rack", "shelf", "is_system_location"]
+
+    async def list(self, limit: Optional[int] = None) -> List[dict]:
+        return await fetch_rows("SELECT * FROM locations ORDER BY zone, aisle LIMIT %s", limit)
+
+    async def get_many(self, location_ids: List[str]) -> List[dict]:
+        return await fetch_rows("SELECT * FROM locations WHERE location_id = ANY(%s::uuid[])", list(location_ids))
+
+    async def get_by_code(self, location_code: str) -> Optional[dict]:
+        return await fetch_one("SELECT * FROM locations WHERE location_code = %s LIMIT 1", location_code)
+
+    async def create(self, location: dict) -> Optional[dict]:
+        return await fetch_one(insert_rows("locations", self.COLUMNS), Json([location]))
+
+    async def create_missing(self, locations: List[dict]) -> List[dict]:
+        return await fetch_rows(
+            insert_rows("locations", self.COLUMNS, "ON CONFLICT (location_code) DO NOTHING"),
+            Json(locations)
+        )
+
+    async def occupancy(self, zone: Optional[str], aisle: Optional[str], include_empty: bool) -> dict:
+        return await call_value("location_occupancy_report", {
+            "p_zone": zone,
+            "p_aisle": aisle,
+            "p_include_empty": include_empty
+        })
+
+
+class PostgresBoxRepository(BoxRepository):
+
+    async def create_many(self, boxes: List[dict]) -> List[dict]:
+        return await fetch_rows(insert_rows("boxes", ["box_id", "product_id", "lot_code"]), Json(boxes))
+
+    async def get_many(self, box_ids: List[str]) -> List[dict]:
+        return await fetch_rows("SELECT * FROM boxes WHERE box_id = ANY(%s)", list(box_ids))
+
+    async def get_with_state(self, box_id: str) -> Optional[dict]:
+        return await fetch_one("""
+            SELECT b.*, (SELECT row_to_json(s) FROM inventory_state s WHERE s.box_id = b.box_id) AS inventory_state
+            FROM boxes b
+            WHERE b.box_id = %s
+        """, box_id)
+
+    async def search(self, query: str, limit: int) -> List[dict]:
+        return await call_rows("search_boxes", {"p_query": query, "p_limit": limit})
+
+    async def search_lots(self, query: str, limit: int) -> List[dict]:
+        return await call_rows("search_lots", {"p_query": query, "p_limit": limit})
+
+
+class PostgresEventRepository(EventRepository):
+
+    async def feed(self, after: Position, limit: int, exceptions_only: bool = False) -> List[dict]:
+        condition, values = keyset(after)
+        exceptions = "AND exception_type IS NOT NULL" if exceptions_only else ""
+        return await fetch_rows(f"""
+            SELECT * FROM events
+            WHERE reversed = FALSE {exceptions} AND {condition}
+            ORDER BY timestamp DESC, event_id DESC
+            LIMIT %s
+        """, *values, limit)
+
+    async def exceptions(self, after: Position, limit: int, exception_type: Optional[str] = None) -> List[dict]:
+        condition, values = keyset(after)
+        if exception_type:
+            condition += " AND exception_type = %s"
+            values += (exception_type,)
+        return await fetch_rows(f"""
+            SELECT e.*, json_build_object('product_id', b.product_id) AS boxes
+            FROM (
+                SELECT * FROM events
+                WHERE exception_type IS NOT NULL AND {condition}
+                ORDER BY timestamp DESC, event_id DESC
+                LIMIT %s
+            ) e
+            LEFT JOIN boxes b ON b.box_id = e.box_id
+            ORDER BY e.timestamp DESC, e.event_id DESC
+        """, *values, limit)
+
+    async def box_timeline(self, box_id: str, after: Position, limit: int) -> List[dict]:
+        condition, values = keyset(after)
+        return await fetch_rows(f"""
+            SELECT * FROM events
+            WHERE box_id = %s AND {condition}
+            ORDER BY timestamp DESC, event_id DESC
+            LIMIT %s
+        """, box_id, *values, limit)
+
+    async def recent(self, limit: int) -> List[dict]:
+        return await fetch_rows("""
+            SELECT e.event_id, e.timestamp, e.event_type, e.box_id, e.location_id,
+                   json_build_object('product_id', b.product_id, 'lot_code', b.lot_code) AS boxes
+            FROM (
+                SELECT * FROM events
+                WHERE reversed = FALSE
+                ORDER BY timestamp DESC, event_id DESC
+                LIMIT %s
+            ) e
+            LEFT JOIN boxes b ON b.box_id = e.box_id
+            ORDER BY e.timestamp DESC, e.event_id DESC
+        """, limit)
+
+    async def received_times(self, box_ids: List[str]) -> Dict[str, str]:
+        rows = await fetch_rows("""
+            SELECT box_id, MIN(timestamp) AS timestamp FROM events
+            WHERE event_type = 'IN' AND reversed = FALSE AND box_id = ANY(%s)
+            GROUP BY box_id
+        """, list(box_ids))
+        return {row["box_id"]: row["timestamp"] for row in rows}
+
+    async def record_scan(self, scan: dict) -> dict:
+        return await call_value("record_scan", {f"p_{key}": value for key, value in scan.items()})
+
+    async def record_scans(self, scans: List[dict]) -> Optional[List[dict]]:
+        return await call_value("record_scans", {"p_scans": Json(scans)})
+
+    async def undo(self, event_id: str) -> dict:
+        return await call_value("undo_event", {"p_event_id": event_id})
+
+    async def exception_summary(
+        self,
+        range_start: str,
+        range_end: str,
+        exception_type: Optional[str] = None
+    ) -> dict:
+        return await call_value("exception_summary", {
+            "p_from": range_start,
+            "p_to": range_end,
+            "p_exception_type": exception_type
+        })
+
+    async def archives(self, range_start: str, range_end: str) -> List[dict]:
+        return await fetch_rows(
+            "SELECT * FROM event_archives WHERE range_start < %s AND range_end > %s ORDER BY range_start",
+            range_end, range_start
+        )
+
+    async def export(self, range_start: str, range_end: str, after: Position, limit: int) -> List[dict]:
+        return await call_rows("export_events", {
+            "p_from": range_start,
+            "p_to": range_end,
+            "p_after_time": after[0] if after else None,
+            "p_after_event_id": after[1] if after else None,
+            "p_limit": limit
+        })
+
+
+class PostgresInventoryRepository(InventoryRepository):
+
+    async def search(self, filters: Dict[str, Any], after: Position, limit: Optional[int]) -> List[dict]:
+        return await call_rows("search_inventory", {
+            **{f"p_{key}": value for key, value in filters.items()},
+            "p_after_time": after[0] if after else None,
+            "p_after_box_id": after[1] if after else None,
+            "p_limit": limit
+        })
+
+    async def count_in_stock(self, location_id: str) -> int:
+        return await fetch_value(
+            "SELECT COUNT(*) FROM inventory_state WHERE status = 'IN_STOCK' AND current_location_id = %s",
+            location_id
+        )
+
+    async def oldest_in_stock(self, location_id: str, limit: int) -> List[dict]:
+        return await fetch_rows("""
+            SELECT s.box_id, s.last_event_time,
+                   json_build_object('product_id', b.product_id, 'lot_code', b.lot_code) AS boxes
+            FROM inventory_state s
+            LEFT JOIN boxes b ON b.box_id = s.box_id
+            WHERE s.status = 'IN_STOCK' AND s.current_location_id = %s
+            ORDER BY s.last_event_time
+            LIMIT %s
+        """, location_id, limit)
+
+    async def latest_in_stock(self, location_id: str, limit: int) -> List[dict]:
+        return await fetch_rows("""
+            SELECT box_id, last_event_time FROM inventory_state
+            WHERE status = 'IN_STOCK' AND current_location_id = %s
+            ORDER BY last_event_time DESC
+            LIMIT %s
+        """, location_id, limit)
+
+    async def rebuild(self, box_ids: List[str]) -> dict:
+        return await fetch_value("SELECT rebuild_inventory_state(%s::varchar[])", box_ids)
+
+
+class PostgresCounterRepository(CounterRepository):
+
+    async def daily_stats(self, day: date) -> dict:
+        return await call_value("get_daily_stats", {"p_day": day.isoformat()}) or {}
+
+    async def time_zone(self) -> Optional[str]:
+        return await fetch_value("SELECT time_zone FROM stats_settings")
+
+    async def reserve_box_ids(self, day: date, block_size: int) -> Optional[int]:
+        return await call_value("reserve_box_id_block", {
+            "target_date": str(day),
+            "p_block_size": block_size
+        })
+
+
+def create_repositories() -> Repositories:
+    return Repositories(
+        products=PostgresProductRepository(),
+        locations=PostgresLocationRepository(),
+        boxes=PostgresBoxRepository(),
+        events=PostgresEventRepository(),
+        inventory=PostgresInventoryRepository(),
+        counters=PostgresCounterRepository()
+    )
@@ -0,0 +1,291 @@
+"""Repositories backed by Supabase: PostgREST table queries and RPCs over HTTP."""
+import asyncio
+from datetime import date
+from typing import Any, Dict, List, Optional
+from app.database import get_supabase, run_query
+from app.repositories.base import (
+    Position, StorageError, Repositories, ProductRepository, LocationRepository, BoxRepository,
+    EventRepository, InventoryRepository, CounterRepository
+)
+from app.utils.pagination import apply_keyset_filter
+
+# IDs per in_() lookup and rows per bulk upsert (keeps PostgREST URLs and
+# request bodies short)
+LOOKUP_CHUNK = 200
+UPSERT_CHUNK = 500
+
+
+async def execute(query: Any) -> Any:
+    """Run a PostgREST query, reporting API errors as StorageError."""
+    # Loaded with the client (see get_supabase), not when the app is imported
+    from postgrest.exceptions import APIError
+    try:
+        return await run_query(query)
+    except APIError as e:
+        raise StorageError(str(e), code=e.code) from e
+
+
+async def rpc_value(name: str, params: dict) -> Any:
+    """Call a function returning a single value (PostgREST may wrap it in a list)."""
+    result = await execute(get_supabase().rpc(name, params))
+    return result.data[0] if isinstance(result.data, (list, tuple)) else result.data
+
+
+async def rpc_rows(name: str, params: dict) -> List[dict]:
+    """Call a set-returning function."""
+    result = await execute(get_supabase().rpc(name, params))
+    return result.data or []
+
+
+async def select_in(table: str, columns: str, column: str, values: List[str]) -> List[dict]:
+    """Rows whose column is in values, looked up in chunks queried concurrently."""
+    results = await asyncio.gather(*[
+        execute(get_supabase().table(table).select(columns).in_(column, values[i:i + LOOKUP_CHUNK]))
+        for i in range(0, len(values), LOOKUP_CHUNK)
+    ])
+    return [row for result in results for row in result.data or []]
+
+
+class SupabaseProductRepository(ProductRepository):
+
+    async def create(self, product: dict) -> Optional[dict]:
+        result = await execute(get_supabase().table("products").insert(product))
+        return result.data[0] if result.data else None
+
+    async def list(self, limit: Optional[int] = None) -> List[dict]:
+        query = get_supabase().table("products").select("*").order("brand", desc=False).order("name", desc=False)
+        if limit:
+            query = query.limit(limit)
+        result = await execute(query)
+        return result.data or []
+
+    async def get_many(self, product_ids: List[str]) -> List[dict]:
+        return await select_in("products", "*", "product_id", product_ids)
+
+    async def search(self, query: str, limit: int) -> List[dict]:
+        return await rpc_rows("search_products", {"p_query": query, "p_limit": limit})
+
+    async def search_catalog(self, query: str, limit: int) -> dict:
+        return await rpc_value("search_catalog", {"p_query": query, "p_limit": limit})
+
+    async def stock(self, product_id: Optional[str] = None, lot_code: Optional[str] = None) -> dict:
+        return await rpc_value("product_stock_report", {
+            "p_product_id": product_id,
+            "p_lot_code": lot_code
+        })
+
+
+class SupabaseLocationRepository(LocationRepository):
+
+    async def list(self, limit: Optional[int] = None) -> List[dict]:
+        query = get_supabase().table("locations").select("*").order("zone", desc=False).order("aisle", desc=False)
+        if limit:
+            query = query.limit(limit)
+        result = await execute(query)
+        return result.data or []
+
+    async def get_many(self, location_ids: List[str]) -> List[dict]:
+        return await select_in("locations", "*", "location_id", location_ids)
+
+    async def get_by_code(self, location_code: str) -> Optional[dict]:
+        result = await execute(get_supabase().table("locations").select("*").eq("location_code", location_code).limit(1))
+        return result.data[0] if result.data else None
+
+    async def create(self, location: dict) -> Optional[dict]:
+        result = await execute(get_supabase().table("locations").insert(location))
+        return result.data[0] if result.data else None
+
+    async def create_missing(self, locations: List[dict]) -> List[dict]:
+        # Only inserted rows come back from an ignore-duplicates upsert
+        results = await asyncio.gather(*[
+            execute(get_supabase().table("locations").upsert(
+                locations[i:i + UPSERT_CHUNK],
+                on_conflict="location_code",
+                ignore_duplicates=True
+            ))
+            for i in range(0, len(locations), UPSERT_CHUNK)
+        ])
+        return [row for result in results for row in result.data or []]
+
+    async def occupancy(self, zone: Optional[str], aisle: Optional[str], include_empty: bool) -> dict:
+        return await rpc_value("location_occupancy_report", {
+            "p_zone": zone,
+            "p_aisle": aisle,
+            "p_include_empty": include_empty
+        })
+
+
+class SupabaseBoxRepository(BoxRepository):
+
+    async def create_many(self, boxes: List[dict]) -> List[dict]:
+        result = await execute(get_supabase().table("boxes").insert(boxes))
+        return result.data or []
+
+    async def get_many(self, box_ids: List[str]) -> List[dict]:
+        return await select_in("boxes", "*", "box_id", box_ids)
+
+    async def get_with_state(self, box_id: str) -> Optional[dict]:
+        result = await execute(get_supabase().table("boxes").select("*, inventory_state(*)").eq("box_id", box_id))
+        if not result.data:
+            return None
+        box = result.data[0]
+        # One-to-one embed; older PostgREST returns a list
+        state = box.get("inventory_state")
+        if isinstance(state, list):
+            box["inventory_state"] = state[0] if state else None
+        return box
+
+    async def search(self, query: str, limit: int) -> List[dict]:
+        return await rpc_rows("search_boxes", {"p_query": query, "p_limit": limit})
+
+    async def search_lots(self, query: str, limit: int) -> List[dict]:
+        return await rpc_rows("search_lots", {"p_query": query, "p_limit": limit})
+
+
+class SupabaseEventRepository(EventRepository):
+
+    async def feed(self, after: Position, limit: int, exceptions_only: bool = False) -> List[dict]:
+        query = get_supabase().table("events").select("*").eq("reversed", False)
+        if exceptions_only:
+            query = query.not_.is_("exception_type", "null")
+        query = apply_keyset_filter(query, "timestamp", "event_id", after)
+        query = query.order("timestamp", desc=True).order("event_id", desc=True).limit(limit)
+        result = await execute(query)
+        return result.data or []
+
+    async def exceptions(self, after: Position, limit: int, exception_type: Optional[str] = None) -> List[dict]:
+        query = get_supabase().table("events").select("*, boxes(product_id)").not_.is_("exception_type", "null")
+        if exception_type:
+            query = query.eq("exception_type", exception_type)
+        query = apply_keyset_filter(query, "timestamp", "event_id", after)
+        query = query.order("timestamp", desc=True).order("event_id", desc=True).limit(limit)
+        result = await execute(query)
+        return result.data or []
+
+    async def box_timeline(self, box_id: str, after: Position, limit: int) -> List[dict]:
+        query = get_supabase().table("events").select("*").eq("box_id", box_id)
+        query = apply_keyset_filter(query, "timestamp", "event_id", after)
+        query = query.order("timestamp", desc=True).order("event_id", desc=True).limit(limit)
+        result = await execute(query)
+        return result.data or []
+
+    async def recent(self, limit: int) -> List[dict]:
+        result = await execute(
+            get_supabase().table("events").select("event_id, timestamp, event_type, box_id, location_id, boxes(product_id, lot_code)")
+            .eq("reversed", False).order("timestamp", desc=True).limit(limit)
+        )
+        return result.data or []
+
+    async def received_times(self, box_ids: List[str]) -> Dict[str, str]:
+        result = await execute(
+            get_supabase().table("events").select("box_id, timestamp").eq("event_type", "IN").in_("box_id", box_ids)
+            .eq("reversed", False).order("timestamp", desc=False)
+        )
+        received = {}
+        for event in result.data or []:
+            # Take the first (oldest) IN event per box
+            received.setdefault(event["box_id"], event["timestamp"])
+        return received
+
+    async def record_scan(self, scan: dict) -> dict:
+        return await rpc_value("record_scan", {f"p_{key}": value for key, value in scan.items()})
+
+    async def record_scans(self, scans: List[dict]) -> Optional[List[dict]]:
+        result = await execute(get_supabase().rpc("record_scans", {"p_scans": scans}))
+        return result.data
+
+    async def undo(self, event_id: str) -> dict:
+        return await rpc_value("undo_event", {"p_event_id": event_id})
+
+    async def exception_summary(
+        self,
+        range_start: str,
+        range_end: str,
+        exception_type: Optional[str] = None
+    ) -> dict:
+        return await rpc_value("exception_summary", {
+            "p_from": range_start,
+            "p_to": range_end,
+            "p_exception_type": exception_type
+        })
+
+    async def archives(self, range_start: str, range_end: str) -> List[dict]:
+        result = await execute(
+            get_supabase().table("event_archives").select("*")
+            .lt("range_start", range_end).gt("range_end", range_start)
+            .order("range_start")
+        )
+        return result.data or []
+
+    async def export(self, range_start: str, range_end: str, after: Position, limit: int) -> List[dict]:
+        return await rpc_rows("export_events", {
+            "p_from": range_start,
+            "p_to": range_end,
+            "p_after_time": after[0] if after else None,
+            "p_after_event_id": after[1] if after else None,
+            "p_limit": limit
+        })
+
+
+class SupabaseInventoryRepository(InventoryRepository):
+
+    async def search(self, filters: Dict[str, Any], after: Position, limit: Optional[int]) -> List[dict]:
+        return await rpc_rows("search_inventory", {
+            **{f"p_{key}": value for key, value in filters.items()},
+            "p_after_time": after[0] if after else None,
+            "p_after_box_id": after[1] if after else None,
+            "p_limit": limit
+        })
+
+    async def count_in_stock(self, location_id: str) -> int:
+        result = await execute(
+            get_supabase().table("inventory_state").select("box_id", count="exact")
+            .eq("status", "IN_STOCK").eq("current_location_id", location_id).limit(1)
+        )
+        return result.count if result.count is not None else 0
+
+    async def oldest_in_stock(self, location_id: str, limit: int) -> List[dict]:
+        result = await execute(
+            get_supabase().table("inventory_state").select("box_id, last_event_time, boxes(product_id, lot_code)")
+            .eq("status", "IN_STOCK").eq("current_location_id", location_id)
+            .order("last_event_time", desc=False).limit(limit)
+        )
+        return result.data or []
+
+    async def latest_in_stock(self, location_id: str, limit: int) -> List[dict]:
+        result = await execute(
+            get_supabase().table("inventory_state").select("box_id, last_event_time")
+            .eq("status", "IN_STOCK").eq("current_location_id", location_id)
+            .order("last_event_time", desc=True).limit(limit)
+        )
+        return result.data or []
+
+    async def rebuild(self, box_ids: List[str]) -> dict:
+        return await rpc_value("rebuild_inventory_state", {"p_box_ids": box_ids})
+
+
+class SupabaseCounterRepository(CounterRepository):
+
+    async def daily_stats(self, day: date) -> dict:
+        return await rpc_value("get_daily_stats", {"p_day": day.isoformat()}) or {}
+
+    async def time_zone(self) -> Optional[str]:
+        result = await execute(get_supabase().table("stats_settings").select("time_zone").limit(1))
+        return result.data[0]["time_zone"] if result.data else None
+
+    async def reserve_box_ids(self, day: date, block_size: int) -> Optional[int]:
+        return await rpc_value("reserve_box_id_block", {
+            "target_date": str(day),
+            "p_block_size": block_size
+        })
+
+
+def create_repositories() -> Repositories:
+    return Repositories(
+        products=SupabaseProductRepository(),
+        locations=SupabaseLocationRepository(),
+        boxes=SupabaseBoxRepository(),
+        events=SupabaseEventRepository(),
+        inventory=SupabaseInventoryRepository(),
+        counters=SupabaseCounterRepository()
+    )
@@ -0,0 +1,177 @@
+"""Per-request database and latency metrics: Server-Timing headers and Prometheus /metrics."""
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Histogram bucket upper bounds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Route label of requests that matched no route (keeps 404 probes from
+# creating a series per path)
+UNMATCHED_ROUTE = "unmatched"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class RequestTimings:
+    """Database work done on behalf of one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# The request being served; database calls made by its task (and by tasks
+# it starts) are added to it
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+class Counter:
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(labels)} {format_number(value)}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [count per bucket (not cumulative), +Inf count, sum]
+        self.series: Dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += 1
+        series[2] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (bucket_counts, count, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', format_number(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_number(total)}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+requests_total = Counter("http_requests_total", "Requests by route and status code.")
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time from request to the end of the response body.", DURATION_BUCKETS
+)
+request_queries = Histogram("http_request_db_queries", "Database round trips per request.", QUERY_BUCKETS)
+request_db_time = Histogram("http_request_db_seconds", "Cumulative database time per request.", DURATION_BUCKETS)
+response_bytes = Histogram("http_response_bytes", "Response body size.", BYTES_BUCKETS)
+db_queries_total = Counter("db_queries_total", "Database round trips, including those outside requests.")
+db_query_seconds_total = Counter("db_query_seconds_total", "Time spent waiting on database round trips.")
+
+METRICS = (
+    requests_total, request_duration, request_queries, request_db_time, response_bytes,
+    db_queries_total, db_query_seconds_total,
+)
+
+
+def record_query(seconds: float) -> None:
+    """Count one database round trip (called by run_query, on the event loop)."""
+    db_queries_total.inc()
+    db_query_seconds_total.inc(amount=seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.queries += 1
+        timings.db_seconds += seconds
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format (this worker only)."""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def server_timing_header(timings: RequestTimings, handler_seconds: float) -> bytes:
+    return (
+        f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.queries} queries", '
+        f"app;dur={handler_seconds * 1000:.1f}"
+    ).encode()
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording each HTTP request's database round trips,
+    database time, response size and duration per route. Server-Timing
+    reports the work done before the response started; for streamed
+    responses (NDJSON, export, live feed) the histograms also include what
+    happens while the body is sent.
+    """
+
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+        body_bytes = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, body_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(timings, time.perf_counter() - started)))
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _current.reset(token)
+            # The router stores the matched route in the (shared) scope
+            route = scope.get("route")
+            labels = (("method", scope["method"]), ("route", getattr(route, "path", None) or UNMATCHED_ROUTE))
+            requests_total.inc(labels + (("status", str(status)),))
+            request_duration.observe(labels, time.perf_counter() - started)
+            request_queries.observe(labels, timings.queries)
+            request_db_time.observe(labels, timings.db_seconds)
+            response_bytes.observe(labels, body_bytes)
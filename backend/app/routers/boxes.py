@@ -1,37 +1,43 @@
 """Boxes router."""
-from fastapi import APIRouter, HTTPException
-from uuid import UUID
-from app.models import BoxCreate, BoxResponse
-from app.database import supabase
-from app.utils.box_id_generator import generate_box_id
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.models import BoxCreate, BoxBulkCreate, BoxLabelsRequest, BoxResponse
+from app.repositories import repositories
+from app.utils.box_id_generator import generate_box_id, generate_box_ids
+from app.reference_cache import get_product, get_products, get_location, get_locations
+from app.utils.label_renderer import render_labels, sheets_pdf, sheets_png
+from app.utils.pagination import encode_cursor, decode_cursor, split_page
 
 router = APIRouter(prefix="/boxes", tags=["boxes"])
 
+# Upper bound on labels rendered by one /boxes/labels request
+MAX_LABELS = 2000
+
 
 @router.post("", response_model=BoxResponse)
 async def create_box(box: BoxCreate):
     """Generate a box label with race-safe box_id."""
     try:
         # Generate unique box_id
-        box_id = generate_box_id()
+        box_id = await generate_box_id()
         
         # Insert box
-        result = supabase.table("boxes").insert({
+        created = await repositories.boxes.create_many([{
             "box_id": box_id,
             "product_id": str(box.product_id),
             "lot_code": box.lot_code
-        }).execute()
+        }])
         
-        if not result.data:
+        if not created:
             raise HTTPException(status_code=500, detail="Failed to create box")
         
         # Get product info
-        product_result = supabase.table("products").select("*").eq("product_id", str(box.product_id)).execute()
-        if not product_result.data:
+        product = await get_product(box.product_id)
+        if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        product = product_result.data[0]
-        
         return BoxResponse(
             box_id=box_id,
             qr_value=f"BOX:{box_id}",
@@ -49,55 +55,193 @@ async def create_box(box: BoxCreate):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/bulk", response_model=List[BoxResponse])
+async def create_boxes_bulk(request: BoxBulkCreate):
+    """
+    Generate count box labels for one product and lot (e.g. a pallet).
+    IDs come from a locally reserved block and all boxes are written with
+    one insert.
+    """
+    try:
+        # Get product info (also validates product_id before reserving IDs)
+        product = await get_product(request.product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        box_ids = await generate_box_ids(request.count)
+        
+        # Insert boxes
+        created = await repositories.boxes.create_many([
+            {
+                "box_id": box_id,
+                "product_id": str(request.product_id),
+                "lot_code": request.lot_code
+            }
+            for box_id in box_ids
+        ])
+        
+        if len(created) != len(box_ids):
+            raise HTTPException(status_code=500, detail="Failed to create boxes")
+        
+        product_info = {
+            "brand": product["brand"],
+            "name": product["name"],
+            "size": product.get("size")
+        }
+        return [
+            BoxResponse(
+                box_id=box_id,
+                qr_value=f"BOX:{box_id}",
+                product=product_info,
+                lot_code=request.lot_code
+            )
+            for box_id in box_ids
+        ]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def labels_response(box_ids: List[str], format: str) -> StreamingResponse:
+    """Look up boxes, render their labels and stream the sheet(s)."""
+    box_ids = list(dict.fromkeys(box_id[4:] if box_id.startswith("BOX:") else box_id for box_id in box_ids))
+    if not box_ids:
+        raise HTTPException(status_code=400, detail="No box_ids given")
+    if len(box_ids) > MAX_LABELS:
+        raise HTTPException(status_code=400, detail=f"Too many labels (max {MAX_LABELS})")
+    
+    boxes_dict = {box["box_id"]: box for box in await repositories.boxes.get_many(box_ids)}
+    
+    missing = [box_id for box_id in box_ids if box_id not in boxes_dict]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Box not found: {', '.join(missing[:10])}")
+    
+    products_dict = await get_products(box["product_id"] for box in boxes_dict.values())
+    labels = []
+    for box_id in box_ids:
+        box = boxes_dict[box_id]
+        product = products_dict.get(box["product_id"], {})
+        product_line = " ".join(part for part in (product.get("brand"), product.get("name"), product.get("size")) if part)
+        labels.append((box_id, product_line, box.get("lot_code")))
+    
+    label_pngs = await render_labels(labels)
+    
+    # Sheet layout and encoding are CPU-bound; keep them off the event loop
+    loop = asyncio.get_running_loop()
+    if format == "pdf":
+        content = await loop.run_in_executor(None, sheets_pdf, label_pngs)
+        media_type, filename = "application/pdf", "labels.pdf"
+    else:
+        content = await loop.run_in_executor(None, sheets_png, label_pngs)
+        if content.startswith(b"PK"):
+            media_type, filename = "application/zip", "labels.zip"
+        else:
+            media_type, filename = "image/png", "labels.png"
+
+    def chunks():
+        for i in range(0, len(content), 64 * 1024):
+            yield content[i:i + 64 * 1024]
+    
+    return StreamingResponse(
+        chunks(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/labels")
+async def get_box_labels(
+    box_ids: str,  # Comma-separated box IDs
+    format: str = Query("pdf", pattern="^(pdf|png)$")
+):
+    """
+    Render QR label sheets (A4, 3x10) for the given boxes as a PDF, or as
+    PNG (one sheet) / ZIP of PNG pages. Use POST /boxes/labels for long lists.
+    """
+    try:
+        return await labels_response([box_id.strip() for box_id in box_ids.split(",") if box_id.strip()], format)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/labels")
+async def create_box_labels(request: BoxLabelsRequest):
+    """Render QR label sheets for a list of boxes (same output as GET /boxes/labels)."""
+    try:
+        return await labels_response(request.box_ids, request.format)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def fetch_box_events(box_id: str, position, page_size: int):
+    """One page of a box's events, newest first, with locations resolved in bulk."""
+    rows = await repositories.events.box_timeline(box_id, position, page_size + 1)
+    events_page, next_position = split_page(rows, page_size, "timestamp", "event_id")
+    
+    # Enrich events with location info
+    locations_dict = await get_locations(event.get("location_id") for event in events_page)
+    enriched_events = []
+    for event in events_page:
+        event_data = event.copy()
+        if event.get("location_id") in locations_dict:
+            event_data["locations"] = locations_dict[event["location_id"]]
+        enriched_events.append(event_data)
+    
+    return enriched_events, next_position
+
+
 @router.get("/{box_id}")
-async def get_box(box_id: str):
-    """Get box details with product info and event history."""
+async def get_box(
+    box_id: str,
+    since: Optional[str] = None,  # next_since from the previous response
+    limit: int = Query(100, ge=1, le=1000)  # Events per page
+):
+    """
+    Get box details with product info and a page of its event history.
+    Events are newest first; pass next_since back as since to get the older
+    events before them, as /events pages back through the log. The box is read in one query (inventory state
+    embedded) alongside the events page, and products/locations come from
+    the reference cache, so the cost does not grow with the box's history.
+    """
     try:
         # Strip prefix if present
         if box_id.startswith("BOX:"):
             box_id = box_id[4:]
         
-        # Get box
-        box_result = supabase.table("boxes").select("*").eq("box_id", box_id).execute()
+        after = decode_cursor(since)
         
-        if not box_result.data:
-            raise HTTPException(status_code=404, detail="Box not found")
+        # Box with its inventory state, and the events page, in parallel
+        box_data, (events_page, next_position) = await asyncio.gather(
+            repositories.boxes.get_with_state(box_id),
+            fetch_box_events(box_id, after, limit)
+        )
         
-        box_data = box_result.data[0]
+        if not box_data:
+            raise HTTPException(status_code=404, detail="Box not found")
         
         # Get product
-        product_result = supabase.table("products").select("*").eq("product_id", box_data["product_id"]).execute()
-        if not product_result.data:
+        product = await get_product(box_data["product_id"])
+        if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        product = product_result.data[0]
+        inv_data = box_data.get("inventory_state")
         
-        # Get inventory state
-        inv_result = supabase.table("inventory_state").select("*").eq("box_id", box_id).execute()
         status = "OUT_OF_WAREHOUSE"
         current_location = None
         
-        if inv_result.data:
-            inv_data = inv_result.data[0]
+        if inv_data:
             status = inv_data["status"]
             if inv_data.get("current_location_id"):
                 # Get location
-                loc_result = supabase.table("locations").select("*").eq("location_id", inv_data["current_location_id"]).execute()
-                if loc_result.data:
-                    current_location = loc_result.data[0]
-        
-        # Get events
-        events_result = supabase.table("events").select("*").eq("box_id", box_id).order("timestamp", desc=False).execute()
-        
-        # Enrich events with location info
-        enriched_events = []
-        for event in events_result.data:
-            event_data = event.copy()
-            if event.get("location_id"):
-                loc_result = supabase.table("locations").select("*").eq("location_id", event["location_id"]).execute()
-                if loc_result.data:
-                    event_data["locations"] = loc_result.data[0]
-            enriched_events.append(event_data)
+                current_location = await get_location(inv_data["current_location_id"])
         
         return {
             "box_id": box_id,
@@ -109,7 +253,8 @@ async def get_box(box_id: str):
             "lot_code": box_data.get("lot_code"),
             "status": status,
             "current_location": current_location,
-            "events": enriched_events
+            "events": events_page,
+            "next_since": encode_cursor(*next_position) if next_position else None
         }
     
     except HTTPException:
@@ -1,136 +1,209 @@
 """Events router."""
-from fastapi import APIRouter, HTTPException
-from typing import Optional
-from app.models import EventCreate, EventResponse
-from app.database import supabase
-from app.rules_engine import validate_rules, get_receiving_location_id
-from datetime import datetime, timezone
+import asyncio
+import json
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.models import EventCreate, EventResponse, EventBatchResult
+from app.repositories import repositories
+from app.rules_engine import validate_static_rules
+from app.reference_cache import get_products, get_locations
+from app.stream_hub import hub
+from app.idempotency_cache import lookup as lookup_recorded_scan, record_once, remember_many
+from app.event_archive import EVENT_COLUMNS, csv_lines, missing_archive, read_archive
+from app.utils.local_time import parse_local_date, local_day_bounds_utc
+from app.utils.pagination import (
+    STREAM_PAGE_SIZE, decode_cursor, split_page, page_response, ndjson_response
+)
 from uuid import UUID
 
 router = APIRouter(prefix="/events", tags=["events"])
 
+# Upper bound on scans accepted by one POST /events/batch call
+MAX_BATCH_SIZE = 1000
+
+
+def strip_scan_prefixes(event: EventCreate) -> tuple:
+    """Strip BOX:/LOC: QR prefixes, returning (box_id, location_code)."""
+    box_id = event.box_id
+    if box_id.startswith("BOX:"):
+        box_id = box_id[4:]
+    
+    location_code = event.location_code
+    if location_code and location_code.startswith("LOC:"):
+        location_code = location_code[4:]
+    
+    return box_id, location_code
+
+
+def publish_scan(scan: dict, event_type: str, location_code: Optional[str]) -> None:
+    """Push a newly recorded scan to /stream subscribers."""
+    hub.publish("event_created", {
+        "event_id": scan["event_id"],
+        "event_type": event_type,
+        "box_id": scan["box_id"],
+        "location_code": location_code,
+        "exception_type": scan.get("exception_type"),
+        "warning": scan.get("warning"),
+        "product": scan.get("product"),
+        "lot_code": scan.get("lot_code")
+    })
+
+
+async def enrich_events(events_page: List[dict]) -> List[dict]:
+    """Attach product and location info to a page of events."""
+    # Batch fetch all boxes, products, and locations to avoid N+1 queries
+    box_ids = list(set(event["box_id"] for event in events_page))
+    location_ids = list(set(event.get("location_id") for event in events_page if event.get("location_id")))
+    
+    # Fetch all boxes at once
+    boxes_dict = {}
+    if box_ids:
+        boxes_dict = {box["box_id"]: box for box in await repositories.boxes.get_many(box_ids)}
+    
+    # Products and locations come from the reference cache
+    products_dict = await get_products(box.get("product_id") for box in boxes_dict.values())
+    locations_dict = await get_locations(location_ids)
+    
+    # Build events list with batched data
+    events = []
+    for event in events_page:
+        # Get box and product from dictionaries
+        box_data = boxes_dict.get(event["box_id"])
+        product = None
+        if box_data:
+            product = products_dict.get(box_data.get("product_id"))
+        
+        # Get location from dictionary
+        location = None
+        if event.get("location_id"):
+            location = locations_dict.get(event["location_id"])
+        
+        events.append({
+            "event_id": event["event_id"],
+            "timestamp": event["timestamp"],
+            "box_id": event["box_id"],
+            "event_type": event["event_type"],
+            "mode": event.get("mode"),
+            "exception_type": event.get("exception_type"),
+            "warning": event.get("warning"),
+            "product": {
+                "brand": product["brand"],
+                "name": product["name"],
+                "size": product.get("size")
+            } if product else None,
+            "locations": {
+                "location_code": location["location_code"]
+            } if location else None
+        })
+    
+    return events
+
 
 @router.get("")
-async def get_events(limit: int = 100, show_exceptions_only: bool = False):
-    """Get all events (or exceptions only) with product and location info."""
+async def get_events(
+    limit: Optional[int] = Query(None, ge=1),  # Page size (default 100); caps the total for ndjson
+    show_exceptions_only: bool = False,
+    cursor: Optional[str] = None,  # X-Next-Cursor from the previous page
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Get all events (or exceptions only) with product and location info.
+    Pages are keyed on (timestamp, event_id), newest first; the cursor for the
+    next page is returned in the X-Next-Cursor header. format=ndjson streams
+    rows page by page instead.
+    """
     try:
-        # Build base query - don't filter by reversed in SQL since column might not exist
-        query = supabase.table("events").select("*")
-        
-        # Filter by exceptions if requested
-        if show_exceptions_only:
-            query = query.not_.is_("exception_type", "null")
-        
-        # Get more events than needed to account for duplicates and reversed events
-        query = query.order("timestamp", desc=True).limit(limit * 3)  # Get extra in case we filter some out
-        
-        result = query.execute()
-        
-        # Filter out reversed events in Python (handles case where column doesn't exist)
-        if result.data:
-            # Only filter if the column exists in the data
-            filtered_data = []
-            for event in result.data:
-                # If reversed column exists and is True, skip it
-                if "reversed" in event and event.get("reversed", False):
-                    continue
-                filtered_data.append(event)
-            result.data = filtered_data
-        
-        if not result.data:
-            return []
-        
-        # Filter duplicate events: if multiple events have the same client_event_id,
-        # only keep the first one (oldest timestamp) - that's the actual scan
-        # Events are ordered DESC (newest first), so we process in reverse to find the first
-        events_by_client_id = {}
-        for event in reversed(result.data):  # Process oldest first
-            client_event_id = event.get("client_event_id")
-            if client_event_id:
-                # Keep the first (oldest) event we encounter for each client_event_id
-                if client_event_id not in events_by_client_id:
-                    events_by_client_id[client_event_id] = event
-        
-        # Build list: include first event for each client_event_id, and all events without client_event_id
-        unique_event_ids = set()
-        unique_events = []
-        for event in result.data:  # Process in original order (newest first) for display
-            if len(unique_events) >= limit:
-                break  # Stop once we have enough unique events
-            
-            client_event_id = event.get("client_event_id")
-            if client_event_id:
-                # Only include if this is the first event for this client_event_id
-                first_event = events_by_client_id.get(client_event_id)
-                if first_event and event["event_id"] == first_event["event_id"]:
-                    unique_events.append(event)
-                    unique_event_ids.add(event["event_id"])
-            else:
-                # Events without client_event_id are included (legacy events)
-                if event["event_id"] not in unique_event_ids:
-                    unique_events.append(event)
-                    unique_event_ids.add(event["event_id"])
-        
-        # Batch fetch all boxes, products, and locations to avoid N+1 queries
-        box_ids = list(set(event["box_id"] for event in unique_events))
-        location_ids = list(set(event.get("location_id") for event in unique_events if event.get("location_id")))
-        
-        # Fetch all boxes at once
-        boxes_dict = {}
-        if box_ids:
-            boxes_result = supabase.table("boxes").select("*").in_("box_id", box_ids).execute()
-            if boxes_result.data:
-                boxes_dict = {box["box_id"]: box for box in boxes_result.data}
-        
-        # Fetch all products at once
-        product_ids = list(set(box.get("product_id") for box in boxes_dict.values() if box.get("product_id")))
-        products_dict = {}
-        if product_ids:
-            products_result = supabase.table("products").select("*").in_("product_id", product_ids).execute()
-            if products_result.data:
-                products_dict = {product["product_id"]: product for product in products_result.data}
+        after = decode_cursor(cursor)
+
+        async def fetch_page(position, page_size):
+            rows = await repositories.events.feed(position, page_size + 1, exceptions_only=show_exceptions_only)
+            events_page, next_position = split_page(rows, page_size, "timestamp", "event_id")
+            return await enrich_events(events_page), next_position
         
-        # Fetch all locations at once
-        locations_dict = {}
-        if location_ids:
-            locations_result = supabase.table("locations").select("*").in_("location_id", location_ids).execute()
-            if locations_result.data:
-                locations_dict = {loc["location_id"]: loc for loc in locations_result.data}
+        if format == "ndjson":
+            return ndjson_response(fetch_page, after, limit)
         
-        # Build events list with batched data
-        events = []
-        for event in unique_events:
-            # Get box and product from dictionaries
-            box_data = boxes_dict.get(event["box_id"])
-            product = None
-            if box_data:
-                product = products_dict.get(box_data.get("product_id"))
+        events, next_position = await fetch_page(after, limit or 100)
+        return page_response(events, next_position)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/export")
+async def export_events(
+    date_from: str,  # ISO date string (YYYY-MM-DD)
+    date_to: str,  # ISO date string (YYYY-MM-DD), inclusive
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")
+):
+    """
+    Export every event of a date range (reversed ones included) in time
+    order. Months archived out of the database are read back from their
+    archive files, the rest is streamed from the database page by page.
+    """
+    try:
+        from_day = parse_local_date(date_from)
+        to_day = parse_local_date(date_to)
+        if from_day > to_day:
+            raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+        
+        range_start, range_end = await local_day_bounds_utc(from_day, to_day)
+        start = datetime.fromisoformat(range_start).replace(tzinfo=None)
+        end = datetime.fromisoformat(range_end).replace(tzinfo=None)
+        
+        archives = await repositories.events.archives(start.isoformat(), end.isoformat())
+        missing = missing_archive(archives)
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Archive file {missing['file_name']} is not available on this server"
+            )
+        # Everything before the last archived month is in files
+        live_start = max([start] + [datetime.fromisoformat(a["range_end"]) for a in archives])
+
+        def encode(rows: List[dict]) -> str:
+            if format == "csv":
+                return csv_lines(rows)
+            return "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+        async def generate():
+            if format == "csv":
+                yield ",".join(EVENT_COLUMNS) + "\n"
             
-            # Get location from dictionary
-            location = None
-            if event.get("location_id"):
-                location = locations_dict.get(event["location_id"])
+            loop = asyncio.get_running_loop()
+            for archive in archives:
+                batches = read_archive(archive, start, end)
+                while True:
+                    rows = await loop.run_in_executor(None, next, batches, None)
+                    if rows is None:
+                        break
+                    yield encode(rows)
             
-            events.append({
-                "event_id": event["event_id"],
-                "timestamp": event["timestamp"],
-                "box_id": event["box_id"],
-                "event_type": event["event_type"],
-                "mode": event.get("mode"),
-                "exception_type": event.get("exception_type"),
-                "warning": event.get("warning"),
-                "product": {
-                    "brand": product["brand"],
-                    "name": product["name"],
-                    "size": product.get("size")
-                } if product else None,
-                "locations": {
-                    "location_code": location["location_code"]
-                } if location else None
-            })
-        
-        return events
+            after = None
+            while live_start < end:
+                rows = await repositories.events.export(live_start.isoformat(), end.isoformat(), after, STREAM_PAGE_SIZE)
+                if rows:
+                    yield encode(rows)
+                if len(rows) < STREAM_PAGE_SIZE:
+                    break
+                after = (rows[-1]["timestamp"], rows[-1]["event_id"])
+        
+        media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+        filename = f"events-{from_day.isoformat()}-{to_day.isoformat()}.{format}"
+        return StreamingResponse(
+            generate(),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
     
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -141,147 +214,48 @@ async def get_events(limit: int = 100, show_exceptions_only: bool = False):
 async def create_event(event: EventCreate):
     """Create an event (IN/OUT/MOVE) with rules validation."""
     try:
-        # Check idempotency
-        existing = supabase.table("events").select("*").eq("client_event_id", str(event.client_event_id)).execute()
-        if existing.data:
-            existing_event = existing.data[0]
-            # Get product info for response
-            box_result = supabase.table("boxes").select("*, products(*)").eq("box_id", existing_event["box_id"]).execute()
-            if box_result.data:
-                box_data = box_result.data[0]
-                product = box_data["products"]
-                return EventResponse(
-                    event_id=UUID(existing_event["event_id"]),
-                    success=True,
-                    message="Event already processed",
-                    warning=None,
-                    exception_type=existing_event.get("exception_type"),
-                    is_duplicate=True,
-                    changed=False,
-                    box_id=existing_event["box_id"],
-                    product={
-                        "brand": product["brand"],
-                        "name": product["name"],
-                        "size": product.get("size")
-                    },
-                    lot_code=box_data.get("lot_code")
-                )
-        
-        # Strip prefixes
-        box_id = event.box_id
-        if box_id.startswith("BOX:"):
-            box_id = box_id[4:]
-        
-        location_code = event.location_code
-        if location_code and location_code.startswith("LOC:"):
-            location_code = location_code[4:]
+        box_id, location_code = strip_scan_prefixes(event)
         
-        # Get location_id if location_code provided
-        location_id = None
-        if location_code:
-            loc_result = supabase.table("locations").select("location_id").eq("location_code", location_code).execute()
-            if loc_result.data:
-                location_id = loc_result.data[0]["location_id"]
-            else:
-                raise HTTPException(status_code=400, detail=f"Location not found: {location_code}")
-        
-        # Validate rules
-        is_valid, error_msg, exception_type = validate_rules(event.mode, event.event_type, box_id, location_code)
+        # Validate T1/T2 before touching the database
+        is_valid, error_msg = validate_static_rules(event.mode, event.event_type, location_code)
         if not is_valid:
             raise HTTPException(status_code=400, detail=error_msg)
         
-        # Determine location for IN events (RECEIVING if not set)
-        if event.event_type == "IN" and not location_id:
-            receiving_loc_id = get_receiving_location_id()
-            if receiving_loc_id:
-                location_id = receiving_loc_id
-        
-        # Create event
-        event_data = {
-            "client_event_id": str(event.client_event_id),
-            "event_type": event.event_type,
-            "box_id": box_id,
-            "location_id": location_id,
-            "mode": event.mode,
-            "source_type": event.source_type,
-            "source_id": event.source_id,
-            "exception_type": exception_type,
-            "warning": f"Box was never received (no IN event found)" if exception_type == "OUT_WITHOUT_IN" else None
-        }
-        
-        result = supabase.table("events").insert(event_data).execute()
+        # Idempotency, T3, event insert and inventory_state upsert in one transaction
+        async def record():
+            return await repositories.events.record_scan({
+                "client_event_id": str(event.client_event_id),
+                "event_type": event.event_type,
+                "box_id": box_id,
+                "location_code": location_code,
+                "mode": event.mode,
+                "source_type": event.source_type,
+                "source_id": event.source_id
+            })
         
-        if not result.data:
+        # Retried scans are answered from the idempotency cache when possible
+        scan = await record_once(str(event.client_event_id), record)
+        if not scan:
             raise HTTPException(status_code=500, detail="Failed to create event")
         
-        created_event = result.data[0]
-        
-        # Update inventory_state
-        inv_data = {
-            "box_id": box_id,
-            "status": "IN_STOCK" if event.event_type == "IN" else "OUT_OF_WAREHOUSE",
-            "last_event_time": datetime.now(timezone.utc).isoformat(),
-            "last_event_type": event.event_type
-        }
-        
-        if event.event_type == "IN":
-            if location_id:
-                inv_data["current_location_id"] = location_id
-        elif event.event_type == "OUT":
-            inv_data["current_location_id"] = None
-        elif event.event_type == "MOVE":
-            # Check if box is already at this location
-            current_inv = supabase.table("inventory_state").select("current_location_id").eq("box_id", box_id).execute()
-            current_location_id = current_inv.data[0].get("current_location_id") if current_inv.data else None
-            
-            changed = True
-            message = "Event created successfully"
-            if location_id and str(current_location_id) == str(location_id):
-                # Box is already at this location
-                changed = False
-                message = "Box already at this location"
-            
-            if location_id:
-                inv_data["current_location_id"] = location_id
-            inv_data["status"] = "IN_STOCK"  # MOVE keeps status as IN_STOCK
-        
-        # Upsert inventory_state
-        supabase.table("inventory_state").upsert(inv_data).execute()
-        
-        # Get product info for response
-        box_result = supabase.table("boxes").select("*").eq("box_id", box_id).execute()
-        if not box_result.data:
-            raise HTTPException(status_code=404, detail="Box not found")
-        
-        box_data = box_result.data[0]
+        if not scan.get("success"):
+            raise HTTPException(status_code=scan.get("status_code", 400), detail=scan.get("error"))
         
-        # Get product
-        product_result = supabase.table("products").select("*").eq("product_id", box_data["product_id"]).execute()
-        if not product_result.data:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
-        product = product_result.data[0]
-        
-        # Determine changed and message for non-MOVE events
-        if event.event_type != "MOVE":
-            changed = True
-            message = "Event created successfully"
+        if not scan.get("is_duplicate"):
+            publish_scan(scan, event.event_type, location_code)
+            hub.notify_stats_changed()
         
         return EventResponse(
-            event_id=UUID(created_event["event_id"]),
+            event_id=UUID(scan["event_id"]),
             success=True,
-            message=message,
-            warning=created_event.get("warning"),
-            exception_type=exception_type,
-            is_duplicate=False,
-            changed=changed,
-            box_id=box_id,
-            product={
-                "brand": product["brand"],
-                "name": product["name"],
-                "size": product.get("size")
-            },
-            lot_code=box_data.get("lot_code")
+            message=scan["message"],
+            warning=scan.get("warning"),
+            exception_type=scan.get("exception_type"),
+            is_duplicate=scan.get("is_duplicate", False),
+            changed=scan.get("changed", True),
+            box_id=scan["box_id"],
+            product=scan["product"],
+            lot_code=scan.get("lot_code")
         )
     
     except HTTPException:
@@ -293,100 +267,92 @@ async def create_event(event: EventCreate):
         raise HTTPException(status_code=400, detail=error_str)
 
 
-@router.post("/{event_id}/undo")
-async def undo_event(event_id: UUID):
-    """Undo an event by marking it as reversed and recomputing inventory_state."""
+@router.post("/batch", response_model=List[EventBatchResult])
+async def create_events_batch(events: List[EventCreate]):
+    """
+    Record an ordered batch of buffered scans (offline phone queues, stations).
+    Scans are deduplicated on client_event_id and rules are applied in order
+    per box; each item gets its own result instead of failing the whole batch.
+    """
+    if len(events) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {MAX_BATCH_SIZE} events)")
+    
+    if not events:
+        return []
+    
     try:
-        # Check if event exists
-        event_result = supabase.table("events").select("*").eq("event_id", str(event_id)).execute()
-        if not event_result.data:
-            raise HTTPException(status_code=404, detail="Event not found")
-        
-        event = event_result.data[0]
-        box_id = event["box_id"]
-        
-        # Check if already reversed
-        if event.get("reversed", False):
-            raise HTTPException(status_code=400, detail="Event already reversed")
-        
-        # Mark event as reversed
-        supabase.table("events").update({"reversed": True}).eq("event_id", str(event_id)).execute()
-        
-        # Query latest non-reversed event for this box
-        latest_result = supabase.table("events").select("*").eq("box_id", box_id).eq("reversed", False).order("timestamp", desc=True).limit(1).execute()
-        
-        if latest_result.data and len(latest_result.data) > 0:
-            # Apply latest event's state
-            latest_event = latest_result.data[0]
-            inv_data = {
-                "box_id": box_id,
-                "status": "IN_STOCK" if latest_event["event_type"] == "IN" else "OUT_OF_WAREHOUSE",
-                "last_event_time": latest_event["timestamp"],
-                "last_event_type": latest_event["event_type"]
-            }
-            
-            if latest_event["event_type"] == "IN":
-                if latest_event.get("location_id"):
-                    inv_data["current_location_id"] = latest_event["location_id"]
-            elif latest_event["event_type"] == "OUT":
-                inv_data["current_location_id"] = None
-            elif latest_event["event_type"] == "MOVE":
-                if latest_event.get("location_id"):
-                    inv_data["current_location_id"] = latest_event["location_id"]
-                inv_data["status"] = "IN_STOCK"  # MOVE keeps status as IN_STOCK
-        else:
-            # No events remain - clear inventory_state
-            inv_data = {
+        # Scans already recorded are answered from the idempotency cache; they
+        # would be no-ops in record_scans, so leaving them out changes nothing
+        cached = {}
+        scans = []
+        for event in events:
+            key = str(event.client_event_id)
+            recorded = lookup_recorded_scan(key)
+            if recorded is not None:
+                cached[key] = {**recorded, "client_event_id": key}
+                continue
+            box_id, location_code = strip_scan_prefixes(event)
+            scans.append({
+                "client_event_id": str(event.client_event_id),
+                "event_type": event.event_type,
                 "box_id": box_id,
-                "status": "OUT_OF_WAREHOUSE",
-                "current_location_id": None,
-                "last_event_time": None,
-                "last_event_type": None
-            }
-        
-        # Update inventory_state
-        supabase.table("inventory_state").upsert(inv_data).execute()
-        
-        # Get updated box details for response
-        box_result = supabase.table("boxes").select("*").eq("box_id", box_id).execute()
-        if not box_result.data:
-            raise HTTPException(status_code=404, detail="Box not found")
-        
-        box_data = box_result.data[0]
-        
-        # Get product
-        product_result = supabase.table("products").select("*").eq("product_id", box_data["product_id"]).execute()
-        if not product_result.data:
-            raise HTTPException(status_code=404, detail="Product not found")
+                "location_code": location_code,
+                "mode": event.mode,
+                "source_type": event.source_type,
+                "source_id": event.source_id
+            })
         
-        product = product_result.data[0]
+        results = []
+        if scans:
+            results = await repositories.events.record_scans(scans)
+            
+            if results is None:
+                raise HTTPException(status_code=500, detail="Failed to record batch")
+            remember_many(results)
+        
+        recorded = [
+            (item, scan) for item, scan in zip(results, scans)
+            if item.get("success") and not item.get("is_duplicate")
+        ]
+        for item, scan in recorded:
+            publish_scan(item, scan["event_type"], scan["location_code"])
+        if recorded:
+            hub.notify_stats_changed()
+        
+        # Back into request order
+        fresh = iter(results)
+        return [
+            EventBatchResult(**(cached[str(event.client_event_id)] if str(event.client_event_id) in cached else next(fresh)))
+            for event in events
+        ]
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{event_id}/undo")
+async def undo_event(event_id: UUID):
+    """
+    Undo an event by marking it as reversed and re-projecting the box's
+    inventory_state from its remaining events (undo_event, migration 011).
+    """
+    try:
+        undo = await repositories.events.undo(str(event_id))
         
-        # Get current location if present
-        location = None
-        if inv_data.get("current_location_id"):
-            loc_result = supabase.table("locations").select("*").eq("location_id", inv_data["current_location_id"]).execute()
-            if loc_result.data:
-                location = loc_result.data[0]
+        if not undo.get("success"):
+            raise HTTPException(status_code=undo.get("status_code", 400), detail=undo.get("error"))
         
-        # Get inventory_state for status
-        inv_state_result = supabase.table("inventory_state").select("*").eq("box_id", box_id).execute()
-        status = "OUT_OF_WAREHOUSE"
-        if inv_state_result.data:
-            status = inv_state_result.data[0]["status"]
+        hub.publish("event_undone", {
+            "event_id": str(event_id),
+            "box_id": undo["box_id"],
+            "status": undo.get("status"),
+            "current_location": undo.get("current_location")
+        })
+        hub.notify_stats_changed()
         
-        return {
-            "success": True,
-            "message": "Event undone successfully",
-            "box_id": box_id,
-            "product": {
-                "brand": product["brand"],
-                "name": product["name"],
-                "size": product.get("size")
-            },
-            "lot_code": box_data.get("lot_code"),
-            "status": status,
-            "current_location": location
-        }
+        return undo
     
     except HTTPException:
         raise
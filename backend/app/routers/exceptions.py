@@ -1,51 +1,99 @@
 """Exceptions router."""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import List, Optional
-from app.database import supabase
+from datetime import timedelta
+from app.repositories import repositories
+from app.reference_cache import get_products
+from app.utils.local_time import get_local_today, local_day_bounds_utc, parse_local_date
+from app.utils.pagination import decode_cursor, split_page, page_response, ndjson_response
 
 router = APIRouter(prefix="/exceptions", tags=["exceptions"])
 
 
+async def enrich_exceptions(events_page: List[dict]) -> List[dict]:
+    """Attach product info to a page of exception events (fetched with their box)."""
+    # Products for the whole page in one pass (usually straight from the cache)
+    products_dict = await get_products(
+        (event.get("boxes") or {}).get("product_id") for event in events_page
+    )
+    
+    exceptions = []
+    for event in events_page:
+        product = products_dict.get((event.get("boxes") or {}).get("product_id"))
+        
+        exceptions.append({
+            "event_id": event["event_id"],
+            "timestamp": event["timestamp"],
+            "box_id": event["box_id"],
+            "event_type": event["event_type"],
+            "exception_type": event["exception_type"],
+            "warning": event.get("warning"),
+            "product": {
+                "brand": product["brand"],
+                "name": product["name"],
+                "size": product.get("size")
+            } if product else None
+        })
+    
+    return exceptions
+
+
 @router.get("")
-async def get_exceptions(exception_type: Optional[str] = None, limit: int = 100):
-    """Get events with exceptions/warnings."""
+async def get_exceptions(
+    exception_type: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),  # Page size (default 100); caps the total for ndjson
+    cursor: Optional[str] = None,  # X-Next-Cursor from the previous page
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Get events with exceptions/warnings.
+    Pages are keyed on (timestamp, event_id), newest first; the cursor for the
+    next page is returned in the X-Next-Cursor header. format=ndjson streams
+    rows page by page instead.
+    """
     try:
-        query = supabase.table("events").select("*").not_.is_("exception_type", "null")
-        
-        if exception_type:
-            query = query.eq("exception_type", exception_type)
+        after = decode_cursor(cursor)
+
+        async def fetch_page(position, page_size):
+            rows = await repositories.events.exceptions(position, page_size + 1, exception_type)
+            events_page, next_position = split_page(rows, page_size, "timestamp", "event_id")
+            return await enrich_exceptions(events_page), next_position
         
-        query = query.order("timestamp", desc=True).limit(limit)
+        if format == "ndjson":
+            return ndjson_response(fetch_page, after, limit)
         
-        result = query.execute()
+        exceptions, next_position = await fetch_page(after, limit or 100)
+        return page_response(exceptions, next_position)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/summary")
+async def get_exceptions_summary(
+    date_from: Optional[str] = None,  # ISO date string (YYYY-MM-DD), default 29 days ago
+    date_to: Optional[str] = None,  # ISO date string (YYYY-MM-DD), default today
+    exception_type: Optional[str] = None
+):
+    """Get exception counts grouped by type, day, product and source (one aggregated query)."""
+    try:
+        to_day = parse_local_date(date_to) if date_to else await get_local_today()
+        from_day = parse_local_date(date_from) if date_from else to_day - timedelta(days=29)
+        if from_day > to_day:
+            raise HTTPException(status_code=400, detail="date_from must not be after date_to")
         
-        exceptions = []
-        for event in result.data:
-            # Get box and product
-            box_result = supabase.table("boxes").select("*").eq("box_id", event["box_id"]).execute()
-            product = None
-            
-            if box_result.data:
-                box_data = box_result.data[0]
-                product_result = supabase.table("products").select("*").eq("product_id", box_data["product_id"]).execute()
-                if product_result.data:
-                    product = product_result.data[0]
-            
-            exceptions.append({
-                "event_id": event["event_id"],
-                "timestamp": event["timestamp"],
-                "box_id": event["box_id"],
-                "event_type": event["event_type"],
-                "exception_type": event["exception_type"],
-                "warning": event.get("warning"),
-                "product": {
-                    "brand": product["brand"],
-                    "name": product["name"],
-                    "size": product.get("size")
-                } if product else None
-            })
+        range_start, range_end = await local_day_bounds_utc(from_day, to_day)
         
-        return exceptions
+        summary = await repositories.events.exception_summary(range_start, range_end, exception_type)
+        return {
+            "date_from": from_day.isoformat(),
+            "date_to": to_day.isoformat(),
+            **(summary or {})
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
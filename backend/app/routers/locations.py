@@ -1,19 +1,86 @@
 """Locations router."""
+import os
+import re
 from fastapi import APIRouter, HTTPException
 from typing import List, Optional
-from app.models import LocationCreate, LocationResponse
-from app.database import supabase
+from app.models import LocationCreate, LocationResponse, LocationBulkCreate, LocationBulkResult, LocationRange
+from app.repositories import repositories, StorageError, UNIQUE_VIOLATION
+from app.reference_cache import get_location, get_products, invalidate_locations
+from app.utils.ttl_cache import TTLCache, MISSING
+from app.utils.single_flight import SingleFlight
 from uuid import UUID
 
 router = APIRouter(prefix="/locations", tags=["locations"])
 
+# Upper bound on locations created by one POST /locations/bulk call
+MAX_BULK_LOCATIONS = 20000
+
+# Warehouse-wide occupancy is polled by floor maps; serve repeats from memory
+# for a few seconds (keyed by filters)
+occupancy_cache_ttl: float = float(os.getenv("OCCUPANCY_CACHE_TTL", "5"))
+occupancy_cache = TTLCache(256, occupancy_cache_ttl)
+
+# Every phone loads the full location list when it starts; concurrent
+# requests share one query
+locations_flight = SingleFlight()
+
+
+def location_code_for(location: LocationCreate) -> str:
+    """Generate location_code: {ZONE}{AISLE}-{RACK}-{SHELF}"""
+    return f"{location.zone}{location.aisle}-{location.rack}-{location.shelf}"
+
+
+def expand_range_part(spec: str) -> List[str]:
+    """
+    Expand "A-F", "1-20", "01-12" or comma lists of those ("1-3,7") into
+    values, keeping zero padding from the range start.
+    """
+    values = []
+    for part in (p.strip() for p in spec.split(",")):
+        if not part:
+            continue
+        match = re.fullmatch(r"(\w+)\s*-\s*(\w+)", part)
+        if not match:
+            values.append(part)
+            continue
+        start, end = match.groups()
+        if start.isdigit() and end.isdigit():
+            width = len(start) if start.startswith("0") else 0
+            if int(end) < int(start):
+                raise HTTPException(status_code=400, detail=f"Invalid range '{part}'")
+            values.extend(str(n).zfill(width) for n in range(int(start), int(end) + 1))
+        elif len(start) == 1 and len(end) == 1 and start.isalpha() and end.isalpha() and start.isupper() == end.isupper():
+            if ord(end) < ord(start):
+                raise HTTPException(status_code=400, detail=f"Invalid range '{part}'")
+            values.extend(chr(c) for c in range(ord(start), ord(end) + 1))
+        else:
+            raise HTTPException(status_code=400, detail=f"Invalid range '{part}'")
+    return values
+
+
+def expand_location_range(spec: LocationRange) -> List[LocationCreate]:
+    aisles = expand_range_part(spec.aisles)
+    racks = expand_range_part(spec.racks)
+    shelves = expand_range_part(spec.shelves)
+    if len(aisles) * len(racks) * len(shelves) > MAX_BULK_LOCATIONS:
+        raise HTTPException(status_code=400, detail=f"Too many locations (max {MAX_BULK_LOCATIONS})")
+    return [
+        LocationCreate(zone=spec.zone, aisle=aisle, rack=rack, shelf=shelf)
+        for aisle in aisles
+        for rack in racks
+        for shelf in shelves
+    ]
+
+
+async def list_locations() -> List[LocationResponse]:
+    return [LocationResponse(**item) for item in await repositories.locations.list()]
+
 
 @router.get("", response_model=List[LocationResponse])
 async def get_locations():
     """Get all locations."""
     try:
-        result = supabase.table("locations").select("*").order("zone", desc=False).order("aisle", desc=False).execute()
-        return [LocationResponse(**item) for item in result.data]
+        return await locations_flight.run("all", list_locations)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -23,31 +90,115 @@ async def get_locations():
 async def create_location(location: LocationCreate):
     """Create a new location."""
     try:
-        # Generate location_code: {ZONE}{AISLE}-{RACK}-{SHELF}
-        location_code = f"{location.zone}{location.aisle}-{location.rack}-{location.shelf}"
+        location_code = location_code_for(location)
         
         # Check if system location
         is_system = False
         
         # Insert location
-        result = supabase.table("locations").insert({
+        created = await repositories.locations.create({
             "location_code": location_code,
             "zone": location.zone,
             "aisle": location.aisle,
             "rack": location.rack,
             "shelf": location.shelf,
             "is_system_location": is_system
-        }).execute()
+        })
         
-        if not result.data:
+        if not created:
             raise HTTPException(status_code=500, detail="Failed to create location")
         
-        return LocationResponse(**result.data[0])
+        invalidate_locations()
+        occupancy_cache.clear()
+        locations_flight.clear()
+        
+        return LocationResponse(**created)
     
-    except Exception as e:
-        if "duplicate key" in str(e).lower():
+    except HTTPException:
+        raise
+    except StorageError as e:
+        if e.code == UNIQUE_VIOLATION:
             raise HTTPException(status_code=400, detail="Location code already exists")
         raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/bulk", response_model=LocationBulkResult)
+async def create_locations_bulk(request: LocationBulkCreate):
+    """
+    Create many locations at once, from a list and/or a range spec
+    (e.g. zone A, aisles A-F x racks 1-20 x shelves 1-5). Rows are upserted
+    in chunks with ON CONFLICT DO NOTHING, so existing location codes are
+    left untouched and counted as existing.
+    """
+    try:
+        locations = list(request.locations or [])
+        if request.range:
+            locations.extend(expand_location_range(request.range))
+        
+        # One row per location_code
+        rows = {}
+        for location in locations:
+            location_code = location_code_for(location)
+            rows.setdefault(location_code, {
+                "location_code": location_code,
+                "zone": location.zone,
+                "aisle": location.aisle,
+                "rack": location.rack,
+                "shelf": location.shelf,
+                "is_system_location": False
+            })
+        
+        if not rows:
+            raise HTTPException(status_code=400, detail="No locations given")
+        if len(rows) > MAX_BULK_LOCATIONS:
+            raise HTTPException(status_code=400, detail=f"Too many locations (max {MAX_BULK_LOCATIONS})")
+        
+        created = await repositories.locations.create_missing(list(rows.values()))
+        created_codes = [row["location_code"] for row in created]
+        
+        if created_codes:
+            invalidate_locations()
+            occupancy_cache.clear()
+            locations_flight.clear()
+        
+        return LocationBulkResult(
+            requested=len(rows),
+            created=len(created_codes),
+            existing=len(rows) - len(created_codes),
+            created_codes=created_codes
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/occupancy")
+async def get_all_locations_occupancy(
+    zone: Optional[str] = None,
+    aisle: Optional[str] = None,
+    include_empty: bool = True
+):
+    """
+    Get box count, distinct product count and oldest arrival for every
+    location (optionally one zone/aisle) from one grouped query, with the
+    totals computed in the database (location_occupancy_report, migration 020).
+    """
+    try:
+        cache_key = (zone, aisle, include_empty)
+        occupancy = occupancy_cache.get(cache_key)
+        if occupancy is not MISSING:
+            return occupancy
+        
+        occupancy = await repositories.locations.occupancy(zone, aisle, include_empty)
+        occupancy_cache.set(cache_key, occupancy)
+        return occupancy
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{location_id}/occupancy")
@@ -55,35 +206,29 @@ async def get_location_occupancy(location_id: UUID):
     """Get occupancy information for a location (boxes currently at this location)."""
     try:
         # Get location details
-        location_result = supabase.table("locations").select("*").eq("location_id", str(location_id)).execute()
-        if not location_result.data:
+        location = await get_location(location_id)
+        if not location:
             raise HTTPException(status_code=404, detail="Location not found")
         
-        location = location_result.data[0]
-        
         # Get boxes currently at this location (status=IN_STOCK and current_location_id matches)
-        inventory_result = supabase.table("inventory_state").select("box_id, last_event_time").eq("status", "IN_STOCK").eq("current_location_id", str(location_id)).order("last_event_time", desc=True).limit(10).execute()
+        inventory_rows = await repositories.inventory.latest_in_stock(str(location_id), 10)
         
         active_box_count = 0
         boxes = []
         
-        if inventory_result.data:
-            active_box_count = len(inventory_result.data)
-            box_ids = [item["box_id"] for item in inventory_result.data]
+        if inventory_rows:
+            active_box_count = len(inventory_rows)
+            box_ids = [item["box_id"] for item in inventory_rows]
             
             # Get box details
-            boxes_result = supabase.table("boxes").select("box_id, product_id, lot_code").in_("box_id", box_ids).execute()
-            boxes_dict = {box["box_id"]: box for box in boxes_result.data} if boxes_result.data else {}
+            boxes_dict = {box["box_id"]: box for box in await repositories.boxes.get_many(box_ids)}
             
             # Get product details
             product_ids = list(set(box.get("product_id") for box in boxes_dict.values() if box.get("product_id")))
-            products_dict = {}
-            if product_ids:
-                products_result = supabase.table("products").select("product_id, brand, name, size").in_("product_id", product_ids).execute()
-                products_dict = {p["product_id"]: p for p in products_result.data} if products_result.data else {}
+            products_dict = await get_products(product_ids)
             
             # Build boxes list
-            for inv_item in inventory_result.data:
+            for inv_item in inventory_rows:
                 box_id = inv_item["box_id"]
                 box_info = boxes_dict.get(box_id, {})
                 product = products_dict.get(box_info.get("product_id"), {})
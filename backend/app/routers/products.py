@@ -1,38 +1,83 @@
 """Products router."""
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
 from app.models import ProductCreate, ProductResponse
-from app.database import supabase
+from app.repositories import repositories
+from app.reference_cache import invalidate_products
+from app.routers.search import MAX_SEARCH_LIMIT
+from app.utils.single_flight import SingleFlight
 from uuid import UUID
 
 router = APIRouter(prefix="/products", tags=["products"])
 
+# Phones load the product list when they start; concurrent identical
+# requests (same search and limit) share one query
+products_flight = SingleFlight()
+
 
 @router.post("", response_model=ProductResponse)
 async def create_product(product: ProductCreate):
     """Create a new product."""
     try:
-        result = supabase.table("products").insert({
+        created = await repositories.products.create({
             "brand": product.brand,
             "name": product.name,
             "size": product.size
-        }).execute()
+        })
         
-        if not result.data:
+        if not created:
             raise HTTPException(status_code=500, detail="Failed to create product")
         
-        return ProductResponse(**result.data[0])
+        invalidate_products()
+        products_flight.clear()
+        
+        return ProductResponse(**created)
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+async def list_products(query: str, limit: Optional[int]) -> List[ProductResponse]:
+    if query:
+        rows = await repositories.products.search(query, limit or 10)
+    else:
+        rows = await repositories.products.list(limit)
+    return [ProductResponse(**item) for item in rows]
+
+
 @router.get("", response_model=List[ProductResponse])
-async def get_products():
-    """Get all products."""
+async def get_products(
+    search: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_SEARCH_LIMIT)
+):
+    """
+    Get all products, ordered by brand and name. With search, get the best
+    matches instead (every word a prefix of brand, name or size; ranked by
+    search_products, migration 015), at most limit (default 10).
+    """
+    try:
+        query = search.strip() if search else ""
+        return await products_flight.run((query, limit), lambda: list_products(query, limit))
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/stock")
+async def get_product_stock(product_id: Optional[UUID] = None, lot_code: Optional[str] = None):
+    """
+    Get IN_STOCK box counts per product, broken down by lot_code and by
+    location. The product_stock projection (migration 014) is kept current
+    by the database on every IN, OUT, MOVE and undo; product_stock_report
+    (migration 021) groups it and returns the whole response in one value.
+    """
     try:
-        result = supabase.table("products").select("*").order("brand", desc=False).order("name", desc=False).execute()
-        return [ProductResponse(**item) for item in result.data]
+        stock = await repositories.products.stock(str(product_id) if product_id else None, lot_code)
+        if product_id and not stock["products"]:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return stock
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,55 @@
+"""Search router (typeahead over products, boxes and lots)."""
+from fastapi import APIRouter, HTTPException, Query
+from app.repositories import repositories
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+# Upper bound on results per kind
+MAX_SEARCH_LIMIT = 50
+
+
+@router.get("")
+async def search(q: str = "", limit: int = Query(10, ge=1, le=MAX_SEARCH_LIMIT)):
+    """
+    Typeahead: ranked products (every word a prefix of brand, name or size),
+    boxes (box ID prefix, suffix or substring, BOX: QR prefix allowed) and
+    lots (lot code prefix) for q, from one indexed query (search_catalog,
+    migrations 015 and 018).
+    """
+    try:
+        query = q.strip()
+        if not query:
+            return {"products": [], "boxes": [], "lots": []}
+        
+        return await repositories.products.search_catalog(query, limit)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/boxes")
+async def search_boxes(q: str = "", limit: int = Query(10, ge=1, le=MAX_SEARCH_LIMIT)):
+    """Boxes whose ID contains q; exact, then prefix, then suffix, then other substring matches."""
+    try:
+        query = q.strip()
+        if not query:
+            return []
+        
+        return await repositories.boxes.search(query, limit)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/lots")
+async def search_lots(q: str = "", limit: int = Query(10, ge=1, le=MAX_SEARCH_LIMIT)):
+    """Lot codes starting with q (case-insensitive), per product, with IN_STOCK box counts."""
+    try:
+        query = q.strip()
+        if not query:
+            return []
+        
+        return await repositories.boxes.search_lots(query, limit)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,127 @@
+"""Live feed router (Server-Sent Events)."""
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from app.stream_hub import hub
+from app.routers.stats import get_stats_counters
+
+router = APIRouter(prefix="/stream", tags=["stream"])
+
+# Keep-alive comment interval, so proxies don't close idle connections
+stream_heartbeat_seconds: float = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+# Bursts of scans within this window produce one stats-delta
+stream_stats_debounce: float = float(os.getenv("STREAM_STATS_DEBOUNCE", "1"))
+# Stats are also refreshed this often while clients are connected, which
+# picks up changes made through other workers
+stream_stats_interval: float = float(os.getenv("STREAM_STATS_INTERVAL", "30"))
+
+_stats_task: Optional[asyncio.Task] = None
+_last_stats: Optional[dict] = None
+_last_stats_at: float = 0.0
+
+
+async def refresh_stats() -> dict:
+    """
+    Recompute today's counters and publish them: a stats_delta if any
+    changed, otherwise a stats snapshot so clients know they are in sync.
+    """
+    global _last_stats, _last_stats_at
+    counters = await get_stats_counters()
+    if _last_stats is not None:
+        changes = {
+            key: value - _last_stats.get(key, 0)
+            for key, value in counters.items()
+            if value != _last_stats.get(key, 0)
+        }
+        if changes:
+            hub.publish("stats_delta", {"changes": changes, "stats": counters})
+        else:
+            hub.publish("stats", counters)
+    _last_stats, _last_stats_at = counters, time.monotonic()
+    return counters
+
+
+async def publish_stats_loop():
+    """
+    One stats publisher per worker, running while clients are connected.
+    Database load is one counters query per change burst (or interval),
+    however many phones are listening.
+    """
+    while hub.subscribers:
+        try:
+            await asyncio.wait_for(hub.stats_changed.wait(), timeout=stream_stats_interval)
+            await asyncio.sleep(stream_stats_debounce)
+        except asyncio.TimeoutError:
+            pass
+        hub.stats_changed.clear()
+
+        if not hub.subscribers:
+            break
+        try:
+            await refresh_stats()
+        except Exception as e:
+            print(f"Error refreshing stream stats: {e}")
+
+
+def format_sse(message_type: str, data: dict) -> str:
+    return f"event: {message_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def load_snapshot() -> Optional[dict]:
+    """The publisher's latest counters when fresh, else a new read."""
+    if _last_stats is not None and time.monotonic() - _last_stats_at <= stream_stats_interval:
+        return _last_stats
+    try:
+        return await refresh_stats()
+    except Exception as e:
+        print(f"Error loading stream stats snapshot: {e}")
+        return None
+
+
+async def event_stream():
+    global _stats_task
+    # Subscribed inside the generator, so its finally unsubscribes on every
+    # exit (disconnect or cancellation while loading the snapshot included);
+    # before the snapshot, so no change between the two is missed
+    subscriber = hub.subscribe()
+    try:
+        if _stats_task is None or _stats_task.done():
+            _stats_task = asyncio.create_task(publish_stats_loop())
+
+        yield "retry: 3000\n\n"
+        snapshot = await load_snapshot()
+        if snapshot is not None:
+            yield format_sse("stats", snapshot)
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), timeout=stream_heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(message["type"], message.get("data", {}))
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+@router.get("")
+async def stream():
+    """
+    Live feed of event_created, event_undone and stats_delta messages.
+    The first message is a stats snapshot; a resync message means the
+    client fell behind and should refetch /stats/today.
+    """
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/stats")
+async def get_stream_stats():
+    """Connected clients and fan-out counters for this worker."""
+    return hub.stats()
@@ -0,0 +1,69 @@
+"""In-process fan-out hub for the /stream live feed."""
+import asyncio
+import os
+from typing import Optional, Set
+
+# Messages buffered per client; a client that falls further behind has its
+# backlog dropped and receives a single "resync" message instead, so slow
+# phones never hold up publishers or grow memory
+stream_queue_size: int = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+
+
+class Subscriber:
+    """One connected client: a bounded message queue."""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, message: dict) -> None:
+        """Queue a message without blocking; on overflow replace the backlog with a resync."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+
+class StreamHub:
+    """Publishes messages to every connected subscriber of this worker."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: Set[Subscriber] = set()
+        self.stats_changed = asyncio.Event()
+        self.published = 0
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+
+    def publish(self, message_type: str, data: Optional[dict] = None) -> None:
+        """Fan a message out to all subscribers (never blocks)."""
+        if not self.subscribers:
+            return
+        message = {"type": message_type, "data": data or {}}
+        for subscriber in list(self.subscribers):
+            subscriber.offer(message)
+        self.published += 1
+
+    def notify_stats_changed(self) -> None:
+        """Ask the stats publisher to recompute and push a stats-delta."""
+        if self.subscribers:
+            self.stats_changed.set()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "dropped": sum(subscriber.dropped for subscriber in self.subscribers),
+        }
+
+
+hub = StreamHub(stream_queue_size)
@@ -1,61 +1,72 @@
 """Race-safe box ID generation using box_id_counters table."""
-from datetime import datetime
-from app.database import supabase
+import asyncio
+import os
+from datetime import date, datetime
+from typing import List
+from app.repositories import repositories
 
+# Sequence numbers reserved per round trip. Numbers left unused when the
+# process stops are skipped, so IDs stay unique but may have gaps.
+box_id_block_size: int = int(os.getenv("BOX_ID_BLOCK_SIZE", "500"))
 
-def generate_box_id() -> str:
+
+class BoxIdAllocator:
     """
-    Generate a unique box_id in format BX-YYYYMMDD-######
-    Uses PostgreSQL function for atomic counter increment to prevent race conditions.
+    Hands out box IDs from contiguous blocks reserved in box_id_counters
+    (reserve_box_id_block, migration 012). Blocks never overlap across
+    workers because the counter is advanced atomically in the database.
     """
-    today = datetime.now().date()
-    today_str = today.strftime("%Y%m%d")
-    
-    try:
-        # Call PostgreSQL function for atomic increment
-        # This ensures race-safe sequence generation even with concurrent requests
-        result = supabase.rpc('increment_box_id_counter', {'target_date': str(today)}).execute()
-        
-        if result.data is not None:
-            # RPC returns the value directly, but Supabase may wrap it
-            if isinstance(result.data, (list, tuple)) and len(result.data) > 0:
-                next_seq = result.data[0]
-            elif isinstance(result.data, dict) and 'data' in result.data:
-                next_seq = result.data['data']
-            else:
-                next_seq = result.data
-        else:
-            # Fallback: try to get current sequence
-            counter_result = supabase.table("box_id_counters").select("last_seq").eq("date", str(today)).execute()
-            if counter_result.data:
-                next_seq = counter_result.data[0]["last_seq"] + 1
-                supabase.table("box_id_counters").update({
-                    "last_seq": next_seq,
-                    "updated_at": datetime.now().isoformat()
-                }).eq("date", str(today)).execute()
-            else:
-                next_seq = 1
-                supabase.table("box_id_counters").insert({
-                    "date": str(today),
-                    "last_seq": next_seq
-                }).execute()
-        
-        return f"BX-{today_str}-{next_seq:06d}"
-    
-    except Exception as e:
-        # If RPC fails, fallback to upsert approach
-        # This is less race-safe but will work for MVP
-        counter_result = supabase.table("box_id_counters").select("last_seq").eq("date", str(today)).execute()
-        if counter_result.data:
-            next_seq = counter_result.data[0]["last_seq"] + 1
-        else:
-            next_seq = 1
+
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self._lock = asyncio.Lock()
+        self._date = None
+        self._next_seq = 0
+        self._last_seq = -1
+
+    async def _reserve(self, day: date, count: int) -> None:
+        size = max(self.block_size, count)
+        last_seq = await repositories.counters.reserve_box_ids(day, size)
+        if last_seq is None:
+            raise RuntimeError("Failed to reserve box IDs")
         
-        # Upsert for box_id_counters (date is primary key)
-        supabase.table("box_id_counters").upsert({
-            "date": str(today),
-            "last_seq": next_seq,
-            "updated_at": datetime.now().isoformat()
-        }).execute()
+        self._next_seq = int(last_seq) - size + 1
+        self._last_seq = int(last_seq)
+
+    async def allocate(self, count: int = 1) -> List[str]:
+        """Get count new box IDs in format BX-YYYYMMDD-######."""
+        async with self._lock:
+            today = datetime.now().date()
+            if self._date != today:
+                # A new day starts a new sequence; drop what's left of the old block
+                self._date, self._next_seq, self._last_seq = today, 0, -1
+            
+            # Take what the current block has, then reserve the shortfall
+            seqs = list(range(self._next_seq, min(self._last_seq + 1, self._next_seq + count)))
+            self._next_seq += len(seqs)
+            
+            needed = count - len(seqs)
+            if needed:
+                await self._reserve(today, needed)
+                seqs.extend(range(self._next_seq, self._next_seq + needed))
+                self._next_seq += needed
         
-        return f"BX-{today_str}-{next_seq:06d}"
+        today_str = today.strftime("%Y%m%d")
+        return [f"BX-{today_str}-{seq:06d}" for seq in seqs]
+
+
+allocator = BoxIdAllocator(box_id_block_size)
+
+
+async def generate_box_ids(count: int) -> List[str]:
+    """Generate count unique box_ids (one reservation round trip per block)."""
+    return await allocator.allocate(count)
+
+
+async def generate_box_id() -> str:
+    """
+    Generate a unique box_id in format BX-YYYYMMDD-######
+    Uses a block reserved atomically in PostgreSQL, so concurrent requests
+    and workers never get the same sequence number.
+    """
+    return (await allocator.allocate(1))[0]
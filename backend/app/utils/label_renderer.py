@@ -0,0 +1,189 @@
+"""Server-side QR label rendering (single labels and printable sheets)."""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+from app.utils.ttl_cache import TTLCache, MISSING
+
+# Rendering resolution; sheets are A4 with LABEL_COLUMNS x LABEL_ROWS labels
+LABEL_DPI = 200
+SHEET_SIZE = (1654, 2339)  # A4 at 200 dpi
+SHEET_MARGIN = 40
+LABEL_COLUMNS = 3
+LABEL_ROWS = 10
+LABEL_SIZE = (
+    (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // LABEL_COLUMNS,
+    (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // LABEL_ROWS,
+)
+LABELS_PER_SHEET = LABEL_COLUMNS * LABEL_ROWS
+QR_MASK_PATTERN = 4
+
+label_render_workers: int = int(os.getenv("LABEL_RENDER_WORKERS", str(os.cpu_count() or 1)))
+label_cache_size: int = int(os.getenv("LABEL_CACHE_SIZE", "5000"))
+# Fewer uncached labels than this are rendered in a thread; process start-up
+# and pickling would cost more than they save
+label_pool_threshold: int = int(os.getenv("LABEL_POOL_THRESHOLD", "50"))
+
+# Rendered label PNGs keyed by a hash of everything printed on the label,
+# so a label is re-rendered only if its box's product or lot changed
+labels_cache = TTLCache(label_cache_size, 24 * 3600)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# (box_id, product line, lot_code)
+LabelSpec = Tuple[str, str, Optional[str]]
+
+
+def label_key(label: LabelSpec) -> str:
+    return hashlib.sha256("\x1f".join(part or "" for part in label).encode()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _fonts() -> Tuple[ImageFont.FreeTypeFont, ImageFont.FreeTypeFont]:
+    return ImageFont.load_default(size=26), ImageFont.load_default(size=20)
+
+
+def render_label(label: LabelSpec) -> bytes:
+    """Render one box label (QR + text) as a 1-bit PNG."""
+    box_id, product_line, lot_code = label
+    width, height = LABEL_SIZE
+    image = Image.new("1", (width, height), 1)
+    
+    # A fixed mask pattern skips qrcode's mask scoring (about 3/4 of the render
+    # time); any of the eight masks is valid and scans the same
+    qr = qrcode.QRCode(border=4, box_size=4, error_correction=qrcode.constants.ERROR_CORRECT_M, mask_pattern=QR_MASK_PATTERN)
+    qr.add_data(f"BOX:{box_id}")
+    qr.make(fit=True)
+    # Build the QR bitmap straight from the module matrix (dark modules = 0),
+    # scaled by a whole number of pixels per module so modules stay square
+    matrix = qr.get_matrix()
+    modules = bytes(0 if dark else 255 for row in matrix for dark in row)
+    qr_image = Image.frombytes("L", (len(matrix), len(matrix)), modules).convert("1")
+    qr_size = (height - 10) // len(matrix) * len(matrix)
+    image.paste(qr_image.resize((qr_size, qr_size), Image.NEAREST), (5, (height - qr_size) // 2))
+    
+    draw = ImageDraw.Draw(image)
+    text_x = qr_size + 15
+    title_font, body_font = _fonts()
+    draw.text((text_x, 20), box_id, font=title_font, fill=0)
+    draw.text((text_x, 70), product_line[:40], font=body_font, fill=0)
+    if lot_code:
+        draw.text((text_x, 105), f"Lot: {lot_code}"[:40], font=body_font, fill=0)
+    
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def render_label_chunk(labels: List[LabelSpec]) -> List[bytes]:
+    """Process pool task: render a chunk of labels."""
+    return [render_label(label) for label in labels]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: never fork the server process with its threads and sockets
+        _pool = ProcessPoolExecutor(
+            max_workers=label_render_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    """Stop the render workers; the next pooled render starts a fresh pool."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+async def render_labels(labels: List[LabelSpec]) -> List[bytes]:
+    """
+    Get label PNGs for labels, in order. Cached labels are reused; the rest
+    are rendered in parallel across the process pool.
+    """
+    keys = [label_key(label) for label in labels]
+    rendered = {}
+    missing = {}
+    for key, label in zip(keys, labels):
+        png = labels_cache.get(key)
+        if png is MISSING:
+            missing[key] = label
+        else:
+            rendered[key] = png
+    
+    if missing:
+        loop = asyncio.get_running_loop()
+        missing_keys = list(missing)
+        missing_labels = list(missing.values())
+        if len(missing_labels) < label_pool_threshold:
+            results = [await loop.run_in_executor(None, render_label_chunk, missing_labels)]
+        else:
+            chunk_size = -(-len(missing_labels) // label_render_workers)
+            chunks = [missing_labels[i:i + chunk_size] for i in range(0, len(missing_labels), chunk_size)]
+            try:
+                results = await asyncio.gather(*[
+                    loop.run_in_executor(_get_pool(), render_label_chunk, chunk) for chunk in chunks
+                ])
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool on the next request
+                shutdown_pool(wait=False)
+                raise
+        for key, png in zip(missing_keys, (png for chunk in results for png in chunk)):
+            labels_cache.set(key, png)
+            rendered[key] = png
+    
+    return [rendered[key] for key in keys]
+
+
+def compose_sheets(label_pngs: List[bytes]) -> Iterator[Image.Image]:
+    """Lay labels out on A4 sheets, yielding one 1-bit page image at a time."""
+    width, height = LABEL_SIZE
+    for start in range(0, len(label_pngs), LABELS_PER_SHEET):
+        sheet = Image.new("1", SHEET_SIZE, 1)
+        for index, png in enumerate(label_pngs[start:start + LABELS_PER_SHEET]):
+            row, column = divmod(index, LABEL_COLUMNS)
+            sheet.paste(
+                Image.open(io.BytesIO(png)),
+                (SHEET_MARGIN + column * width, SHEET_MARGIN + row * height)
+            )
+        yield sheet
+
+
+def sheets_pdf(label_pngs: List[bytes]) -> bytes:
+    """All sheets as one multi-page PDF."""
+    pages = list(compose_sheets(label_pngs))
+    output = io.BytesIO()
+    pages[0].save(output, format="PDF", save_all=True, append_images=pages[1:], resolution=LABEL_DPI)
+    return output.getvalue()
+
+
+def sheets_png(label_pngs: List[bytes]) -> bytes:
+    """One sheet as a PNG, or every sheet as page-NNN.png files in a ZIP."""
+    pages = []
+    for sheet in compose_sheets(label_pngs):
+        output = io.BytesIO()
+        sheet.save(output, format="PNG", optimize=True, dpi=(LABEL_DPI, LABEL_DPI))
+        pages.append(output.getvalue())
+    if len(pages) == 1:
+        return pages[0]
+    
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as archive:
+        for number, page in enumerate(pages, start=1):
+            archive.writestr(f"page-{number:03d}.png", page)
+    return output.getvalue()
+
+
+def label_cache_stats() -> dict:
+    return labels_cache.stats()
@@ -0,0 +1,44 @@
+"""Warehouse-local date helpers shared by date-based filters."""
+from datetime import date, datetime, timedelta, timezone
+from typing import Tuple
+from zoneinfo import ZoneInfo
+from fastapi import HTTPException
+from app.reference_cache import get_time_zone
+
+
+async def get_local_timezone() -> ZoneInfo:
+    """
+    Get the warehouse time zone (stats_settings.time_zone, migration 019),
+    the same one the database buckets the daily counters by, so "today"
+    and date filters match them.
+    """
+    return ZoneInfo(await get_time_zone())
+
+
+def parse_local_date(value: str) -> date:
+    """Parse a YYYY-MM-DD filter value (a local date)."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+async def get_local_today() -> date:
+    """Get today's date in the warehouse time zone."""
+    return datetime.now(await get_local_timezone()).date()
+
+
+async def local_day_bounds_utc(start_day: date, end_day: date = None) -> Tuple[str, str]:
+    """
+    Get [start, end) UTC ISO strings covering local dates start_day..end_day.
+    PostgreSQL timestamps are stored in UTC, so local day boundaries are
+    converted before querying (each with its own UTC offset across DST).
+    """
+    local_tz = await get_local_timezone()
+    end_day = end_day or start_day
+    start_local = datetime.combine(start_day, datetime.min.time(), tzinfo=local_tz)
+    end_local = datetime.combine(end_day + timedelta(days=1), datetime.min.time(), tzinfo=local_tz)
+    return (
+        start_local.astimezone(timezone.utc).isoformat(),
+        end_local.astimezone(timezone.utc).isoformat(),
+    )
@@ -0,0 +1,129 @@
+"""Keyset (cursor) pagination and NDJSON streaming helpers."""
+import base64
+import json
+import re
+from datetime import datetime
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from uuid import UUID
+
+# Rows fetched per database round trip when streaming NDJSON
+STREAM_PAGE_SIZE = 500
+
+# Header carrying the cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Box IDs a cursor may carry as its tie-breaker (BX-YYYYMMDD-######, or
+# other label formats made of letters, digits, "-", "_" and ".")
+CURSOR_BOX_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,49}")
+
+FetchPage = Callable[[Optional[Tuple[Any, Any]], int], Awaitable[Tuple[List[dict], Optional[Tuple[Any, Any]]]]]
+
+
+def encode_cursor(sort_value: Any, tie_breaker: Any) -> str:
+    """Encode the (sort value, unique id) of the last row into an opaque cursor."""
+    raw = json.dumps([sort_value, tie_breaker], default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, Any]]:
+    """
+    Decode a cursor produced by encode_cursor. Cursors come from clients and
+    their values end up in PostgREST filter strings, so anything but an ISO
+    timestamp or number (or null) followed by a UUID or box ID is rejected.
+    """
+    if not cursor:
+        return None
+    try:
+        sort_value, tie_breaker = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if valid_sort_value(sort_value) and valid_tie_breaker(tie_breaker):
+            return sort_value, tie_breaker
+    except (ValueError, TypeError):
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def valid_sort_value(value: Any) -> bool:
+    if value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)):
+        return True
+    if not isinstance(value, str):
+        return False
+    try:
+        datetime.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+
+def valid_tie_breaker(value: Any) -> bool:
+    if not isinstance(value, str):
+        return False
+    try:
+        UUID(value)
+        return True
+    except ValueError:
+        return CURSOR_BOX_ID.fullmatch(value) is not None
+
+
+def apply_keyset_filter(
+    query: Any,
+    sort_column: str,
+    id_column: str,
+    after: Optional[Tuple[Any, Any]],
+    descending: bool = True
+) -> Any:
+    """
+    Restrict a PostgREST query ordered by (sort_column, id_column), both DESC
+    unless descending=False, to rows strictly after the cursor position.
+    """
+    if not after:
+        return query
+    sort_value, tie_breaker = after
+    op = "lt" if descending else "gt"
+    query.params = query.params.add(
+        "or",
+        f'({sort_column}.{op}."{sort_value}",and({sort_column}.eq."{sort_value}",{id_column}.{op}."{tie_breaker}"))'
+    )
+    return query
+
+
+def split_page(rows: List[dict], limit: int, sort_column: str, id_column: str) -> Tuple[List[dict], Optional[Tuple[Any, Any]]]:
+    """
+    Trim rows fetched with limit + 1 to one page and work out the next cursor
+    position (None when this is the last page).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, (page[-1].get(sort_column), page[-1][id_column])
+
+
+def page_response(items: List[dict], next_position: Optional[Tuple[Any, Any]]) -> JSONResponse:
+    """Return one page as a JSON array, with the next cursor in a header."""
+    headers = {}
+    if next_position:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(*next_position)
+    return JSONResponse(content=jsonable_encoder(items), headers=headers)
+
+
+def ndjson_response(fetch_page: FetchPage, after: Optional[Tuple[Any, Any]], limit: Optional[int]) -> StreamingResponse:
+    """
+    Stream rows as newline-delimited JSON, fetching one page at a time so
+    memory stays flat and the first rows go out before the export finishes.
+    """
+    async def generate():
+        position = after
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_size = STREAM_PAGE_SIZE if remaining is None else min(STREAM_PAGE_SIZE, remaining)
+            items, position = await fetch_page(position, page_size)
+            for item in items:
+                yield json.dumps(item, default=str) + "\n"
+            if remaining is not None:
+                remaining -= len(items)
+            if not position:
+                break
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -0,0 +1,70 @@
+"""Single-flight calls with a short-lived result cache, for hot read endpoints."""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from app.utils.ttl_cache import TTLCache, MISSING
+
+# Seconds a coalesced read's result is reused (0 only shares calls already
+# in flight). Short enough that the data is not meaningfully stale, long
+# enough to absorb dozens of phones polling at the start of a shift
+read_cache_ttl: float = float(os.getenv("READ_CACHE_TTL", "0.3"))
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one computation, and its
+    result answers later calls for `ttl` seconds. The computation runs in
+    its own task, so a caller disconnecting does not cancel it for the
+    others; errors are raised to every caller and not cached. Used from the
+    event loop only.
+    """
+
+    def __init__(self, ttl: float = read_cache_ttl, maxsize: int = 64):
+        self.cache = TTLCache(maxsize, ttl)
+        self.shared = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Get the result for key: cached, in flight, or computed now."""
+        if self.cache.ttl > 0:
+            value = self.cache.get(key)
+            if value is not MISSING:
+                return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, compute))
+            task.add_done_callback(_retrieve_exception)
+            self._inflight[key] = task
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await compute()
+            # Not if clear() ran meanwhile: the result may predate a write
+            if self._inflight.get(key) is task and self.cache.ttl > 0:
+                self.cache.set(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    def clear(self) -> None:
+        """Forget cached results and let later calls start afresh (after a write)."""
+        self.cache.clear()
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["shared"] = self.shared
+        stats["in_flight"] = len(self._inflight)
+        return stats
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    # Every caller may have gone away; don't log "exception never retrieved"
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,95 @@
+"""
+Load benchmark for concurrent POST /events.
+
+Seeds one product and a batch of boxes through the API, then fires IN scans
+at increasing concurrency levels. With a non-blocking data layer the
+requests/second figure should grow with concurrency instead of staying flat.
+
+Usage:
+    python benchmarks/bench_events_concurrency.py --url http://localhost:8000 \
+        --requests 200 --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+async def seed_boxes(client: httpx.AsyncClient, count: int) -> list:
+    """Create a benchmark product and `count` boxes, returning their box_ids."""
+    product = (await client.post("/products", json={
+        "brand": "Bench",
+        "name": f"Load test {uuid.uuid4().hex[:8]}",
+        "size": None
+    })).json()
+
+    box_ids = []
+    for _ in range(count):
+        response = await client.post("/boxes", json={"product_id": product["product_id"]})
+        response.raise_for_status()
+        box_ids.append(response.json()["box_id"])
+    return box_ids
+
+
+async def run_level(client: httpx.AsyncClient, box_ids: list, concurrency: int) -> dict:
+    """Post one IN scan per box with at most `concurrency` requests in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def post_scan(box_id: str):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/events", json={
+                "client_event_id": str(uuid.uuid4()),
+                "event_type": "IN",
+                "box_id": box_id,
+                "mode": "INBOUND",
+                "source_type": "API",
+                "source_id": "bench"
+            })
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(post_scan(box_id) for box_id in box_ids))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(box_ids),
+        "errors": errors,
+        "rps": len(box_ids) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=200, help="scans per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        print(f"Seeding {args.requests * len(args.concurrency)} boxes...")
+        box_ids = await seed_boxes(client, args.requests * len(args.concurrency))
+
+        print(f"{'concurrency':>11} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for i, concurrency in enumerate(args.concurrency):
+            batch = box_ids[i * args.requests:(i + 1) * args.requests]
+            result = await run_level(client, batch, concurrency)
+            print(f"{result['concurrency']:>11} {result['requests']:>8} {result['errors']:>6} "
+                  f"{result['rps']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
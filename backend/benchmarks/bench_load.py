@@ -0,0 +1,303 @@
+"""
+End-to-end load benchmark: replays a realistic mix of scans and reads and
+reports latency percentiles, throughput and database round trips per
+request.
+
+Each virtual phone loops over weighted operations until --duration ends:
+bursts of IN, MOVE and OUT scans, retries of a scan it already sent (same
+client_event_id), undoing one of its scans, and the reads the dashboards
+poll (GET /inventory, /stats/today and /events).
+
+By default the app runs in this process against a local PostgreSQL
+database (STORAGE_BACKEND=postgres), which stands in for Supabase: the
+schema is migrated and seeded with --products/--locations/--boxes if it is
+empty, and --latency-ms adds a simulated network round trip to every
+database call (holding a database thread, like a PostgREST call does).
+With --url, a running server is loaded over HTTP instead. Round trips per
+request are read from the Server-Timing header (SERVER_TIMING=1).
+
+Usage:
+    python benchmarks/bench_load.py --dsn postgresql://localhost/inventory_bench \
+        --clients 16 --duration 30 --latency-ms 20
+    python benchmarks/bench_load.py --url http://localhost:8000 --dsn $DATABASE_URL
+
+The database is needed in both modes to pick boxes and locations for the
+scans. Requires psycopg2 (pip install psycopg2-binary) and httpx. Use a
+scratch database: seeding writes directly to the tables and scans keep
+adding events.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import uuid
+from collections import deque
+
+import httpx
+import psycopg2
+
+from query_plans import apply_migrations, seed
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Operation weights (per phone iteration); scan operations are bursts
+DEFAULT_MIX = "in=20,move=25,out=10,retry=10,undo=3,inventory=12,stats=12,events=8"
+
+# Database round trips in the app's Server-Timing header
+ROUND_TRIPS = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class DelayedQuery:
+    """A query that waits --latency-ms on its database thread before running."""
+
+    def __init__(self, query, latency: float):
+        self.query = query
+        self.latency = latency
+
+    def execute(self):
+        time.sleep(self.latency)
+        return self.query.execute()
+
+
+def add_latency(latency: float):
+    """Delay every database round trip of the in-process app."""
+    from app.repositories import postgres_backend
+
+    run_query = postgres_backend.run_query
+
+    async def delayed_run_query(query):
+        return await run_query(DelayedQuery(query, latency))
+
+    postgres_backend.run_query = delayed_run_query
+
+
+def prepare_database(conn, args) -> dict:
+    """Migrate and seed if needed; return boxes and locations to scan."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('events') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            apply_migrations(conn)
+        cur.execute("SELECT EXISTS (SELECT 1 FROM events)")
+        if not cur.fetchone()[0]:
+            seed(conn, args.boxes, args.events_per_box, args.products, args.locations)
+
+        # Fresh boxes for IN scans (labels printed, not yet received)
+        run = uuid.uuid4().hex[:6].upper()
+        cur.execute("""
+            WITH p AS (SELECT array_agg(product_id) AS ids FROM (SELECT product_id FROM products LIMIT 1000) s)
+            INSERT INTO boxes (box_id, product_id, lot_code)
+            SELECT 'BX-LOAD-' || %s || '-' || lpad(i::TEXT, 6, '0'), p.ids[1 + i %% array_length(p.ids, 1)], 'LOAD'
+            FROM generate_series(1, %s) i, p
+            RETURNING box_id
+        """, (run, args.fresh_boxes))
+        fresh = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT box_id FROM inventory_state WHERE status = 'IN_STOCK' ORDER BY random() LIMIT 5000")
+        in_stock = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT location_code FROM locations WHERE NOT is_system_location ORDER BY random() LIMIT 500")
+        locations = [row[0] for row in cur.fetchall()]
+    return {"fresh": fresh, "in_stock": in_stock, "locations": locations}
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, label: str, seconds: float, ok: bool, trips):
+        entry = self.samples.setdefault(label, {"latencies": [], "errors": 0, "trips": []})
+        entry["latencies"].append(seconds)
+        entry["errors"] += not ok
+        if trips is not None:
+            entry["trips"].append(trips)
+
+
+class Phone:
+    """One virtual scanner: sends requests one at a time, like a handheld does."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, pools: dict, mix: dict, burst: int):
+        self.client = client
+        self.recorder = recorder
+        self.pools = pools
+        self.mix = mix
+        self.burst = burst
+        self.sent = deque(maxlen=50)  # (body, event_id) of this phone's recorded scans
+
+    async def request(self, label: str, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        trips = None
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            ok = response.status_code < 500
+            match = ROUND_TRIPS.search(response.headers.get("server-timing", ""))
+            if match:
+                trips = int(match.group(1))
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.recorder.add(label, time.perf_counter() - started, ok, trips)
+        return response
+
+    async def scan(self, event_type: str, box_id: str, location_code=None):
+        body = {
+            "client_event_id": str(uuid.uuid4()),
+            "event_type": event_type,
+            "box_id": box_id,
+            "location_code": location_code,
+            "mode": {"IN": "INBOUND", "MOVE": "MOVE", "OUT": "OUTBOUND"}[event_type],
+            "source_type": "API",
+            "source_id": "bench-load",
+        }
+        response = await self.request(f"POST /events {event_type}", "POST", "/events", json=body)
+        if response is not None and response.status_code == 200:
+            self.sent.append((body, response.json()["event_id"]))
+        return response
+
+    async def run_op(self, op: str):
+        pools = self.pools
+        if op == "in":
+            for _ in range(self.burst):
+                if not pools["fresh"]:
+                    return
+                box_id = pools["fresh"].pop()
+                response = await self.scan("IN", box_id)
+                if response is not None and response.status_code == 200:
+                    pools["in_stock"].append(box_id)
+        elif op == "move":
+            location = random.choice(pools["locations"])
+            for _ in range(self.burst):
+                await self.scan("MOVE", random.choice(pools["in_stock"]), location)
+        elif op == "out":
+            for _ in range(self.burst):
+                if len(pools["in_stock"]) < 100:
+                    return
+                box_id = pools["in_stock"].pop(random.randrange(len(pools["in_stock"])))
+                await self.scan("OUT", box_id)
+        elif op == "retry":
+            if self.sent:
+                body, _ = random.choice(self.sent)
+                await self.request("POST /events retry", "POST", "/events", json=body)
+        elif op == "undo":
+            if self.sent:
+                _, event_id = self.sent.pop()
+                await self.request("POST /events/{id}/undo", "POST", f"/events/{event_id}/undo")
+        elif op == "inventory":
+            await self.request("GET /inventory", "GET", "/inventory", params={"limit": 50})
+        elif op == "stats":
+            await self.request("GET /stats/today", "GET", "/stats/today")
+        elif op == "events":
+            await self.request("GET /events", "GET", "/events", params={"limit": 50})
+
+    async def run(self, deadline: float):
+        ops, weights = list(self.mix), list(self.mix.values())
+        while time.perf_counter() < deadline:
+            await self.run_op(random.choices(ops, weights)[0])
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p * len(sorted_values)) - 1))]
+
+
+def report(recorder: Recorder, elapsed: float):
+    print(f"\n{'request':<26} {'count':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'db/req':>7}")
+    totals = {"latencies": [], "errors": 0, "trips": []}
+    for label in sorted(recorder.samples):
+        entry = recorder.samples[label]
+        for key in ("latencies", "trips"):
+            totals[key].extend(entry[key])
+        totals["errors"] += entry["errors"]
+        print_row(label, entry, elapsed)
+    print_row("total", totals, elapsed)
+
+
+def print_row(label: str, entry: dict, elapsed: float):
+    latencies = sorted(entry["latencies"])
+    if not latencies:
+        return
+    trips = f"{statistics.mean(entry['trips']):>7.2f}" if entry["trips"] else f"{'-':>7}"
+    print(f"{label:<26} {len(latencies):>7} {entry['errors']:>5} {len(latencies) / elapsed:>8.1f} "
+          f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} "
+          f"{percentile(latencies, 0.99) * 1000:>8.1f} {trips}")
+
+
+async def run_load(args, pools: dict):
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.clients)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits)
+        lifespan = None
+    else:
+        # Configure the app before it is imported
+        os.environ["STORAGE_BACKEND"] = "postgres"
+        os.environ["DATABASE_URL"] = args.dsn
+        sys.path.insert(0, BACKEND_DIR)
+        from app.main import app
+
+        if args.latency_ms:
+            add_latency(args.latency_ms / 1000)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        lifespan = app.router.lifespan_context(app)
+
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            phones = [Phone(client, recorder, pools, mix, args.burst) for _ in range(args.clients)]
+            if args.warm_up:
+                # One untimed pass over the reads fills the caches
+                await asyncio.gather(*(phones[0].run_op(op) for op in ("inventory", "stats", "events")))
+                recorder.samples.clear()
+            started = time.perf_counter()
+            await asyncio.gather(*(phone.run(started + args.duration) for phone in phones))
+            elapsed = time.perf_counter() - started
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    target = args.url or f"in-process, {args.latency_ms:g} ms simulated round-trip latency"
+    print(f"{args.clients} phones for {elapsed:.1f}s against {target}")
+    report(recorder, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", "postgresql://localhost/inventory_bench"))
+    parser.add_argument("--url", help="load a running server instead of the in-process app")
+    parser.add_argument("--products", type=int, default=500, help="products seeded into an empty database")
+    parser.add_argument("--locations", type=int, default=2000)
+    parser.add_argument("--boxes", type=int, default=20000)
+    parser.add_argument("--events-per-box", type=int, default=6)
+    parser.add_argument("--fresh-boxes", type=int, default=5000, help="unreceived boxes created for IN scans")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent phones")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--burst", type=int, default=5, help="scans per IN/MOVE/OUT burst")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--latency-ms", type=float, default=0, help="simulated network latency per round trip")
+    parser.add_argument("--no-warm-up", dest="warm_up", action="store_false")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the operation mix")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    pools = prepare_database(conn, args)
+    conn.close()
+    print(f"{len(pools['fresh'])} fresh boxes, {len(pools['in_stock'])} in stock, {len(pools['locations'])} locations")
+
+    asyncio.run(run_load(args, pools))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Cold-start benchmark: import time, time until the server answers and the
+latency of the first requests after it does.
+
+Each run starts a fresh uvicorn process on a free port (same environment
+and .env as the app), polls /health until it answers, then requests each
+path once (cold) and a few more times (warm). The warm-up started at
+startup (STARTUP_WARM_UP) creates the database client and fills the
+reference cache in the background; compare with --no-warm-up.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5 \
+        --paths /stats/today /locations /products
+
+Run from backend/ with the database configured (SUPABASE_* or
+STORAGE_BACKEND=postgres and DATABASE_URL). Importing alone needs neither.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def measure_import(env: dict) -> float:
+    """Seconds to import app.main in a fresh interpreter."""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def timed_get(client: httpx.Client, path: str) -> float:
+    started = time.perf_counter()
+    response = client.get(path)
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {path} returned {response.status_code}: {response.text[:200]}")
+    return elapsed
+
+
+def measure_server(env: dict, paths: list, repeat: int, timeout: float) -> dict:
+    """Start the server, wait for /health, then time the first and later requests per path."""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"Server exited:\n{server.stderr.read().decode()[-2000:]}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"Server not ready after {timeout}s")
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            result = {"ready": time.perf_counter() - started}
+
+            for path in paths:
+                result[f"first {path}"] = timed_get(client, path)
+            for path in paths:
+                result[f"warm {path}"] = statistics.median(timed_get(client, path) for _ in range(repeat))
+
+            warm_up = client.get("/health").json().get("warm_up") or {}
+            if warm_up.get("seconds") is not None:
+                result["warm-up"] = warm_up["seconds"]
+            if warm_up.get("error"):
+                print(f"  warm-up failed: {warm_up['error']}")
+            return result
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--paths", nargs="+", default=["/stats/today", "/locations", "/products"])
+    parser.add_argument("--repeat", type=int, default=5, help="warm requests per path")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for the server")
+    parser.add_argument("--no-warm-up", action="store_true", help="start with STARTUP_WARM_UP=0")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.no_warm_up:
+        env["STARTUP_WARM_UP"] = "0"
+
+    samples = {}
+    for run in range(args.runs):
+        result = {"import app.main": measure_import(env)}
+        result.update(measure_server(env, args.paths, args.repeat, args.timeout))
+        for name, seconds in result.items():
+            samples.setdefault(name, []).append(seconds)
+        print(f"run {run + 1}: ready in {result['ready'] * 1000:.0f} ms")
+
+    print(f"\n{'':<28} {'median ms':>10} {'max ms':>10}")
+    for name, values in samples.items():
+        print(f"{name:<28} {statistics.median(values) * 1000:>10.1f} {max(values) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
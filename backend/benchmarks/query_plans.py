@@ -0,0 +1,369 @@
+"""
+Query-plan regression check for the hot queries behind each router.
+
+Runs against a local Postgres database: applies supabase/migrations if the
+schema is missing, seeds a realistic volume (products, locations, boxes and
+a few events per box, some reversed or flagged as exceptions) if it is
+empty, then EXPLAINs the SQL each endpoint sends and fails if a query
+reads a table sequentially or does not use the index it was written for.
+Router reads are captured from the PostgreSQL repositories
+(app/repositories/postgres_backend.py, the same statements PostgREST
+builds for the Supabase backend); reads inside SQL functions are listed
+with the function they come from.
+Scans of events partitions are reported under the parent table's index
+names.
+
+Usage:
+    python benchmarks/query_plans.py --dsn postgresql://localhost/inventory_bench \
+        --boxes 50000 --events-per-box 6
+
+Requires psycopg2 (pip install psycopg2-binary). Use a scratch database:
+seeding writes directly to the tables.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MIGRATIONS_DIR = os.path.join(BACKEND_DIR, "supabase", "migrations")
+
+# (name, statement, acceptable indexes[, tables a seq scan is fine on]).
+# A statement is either a call of the PostgreSQL repository a router makes
+# (its SQL is captured from app/repositories/postgres_backend.py, so a
+# router or repository change is checked as written) or, for reads inside
+# SQL functions, the function's query with the migration it comes from.
+# Samples come from sample_params().
+QUERIES = [
+    (
+        "GET /events page",
+        lambda r, p: r.events.feed(None, 101),
+        {"idx_events_time"},
+    ),
+    (
+        "GET /events next page (cursor)",
+        lambda r, p: r.events.feed((p["cursor_time"], p["cursor_id"]), 101),
+        {"idx_events_time"},
+    ),
+    (
+        "GET /events?show_exceptions_only=true",
+        lambda r, p: r.events.feed(None, 101, exceptions_only=True),
+        {"idx_events_exceptions_feed", "idx_events_time"},
+    ),
+    (
+        "GET /events/export page",
+        lambda r, p: r.events.export(p["month_ago"], p["now"], None, 500),
+        {"idx_events_time"},
+    ),
+    (
+        "GET /exceptions page",
+        lambda r, p: r.events.exceptions(None, 101),
+        {"idx_events_exceptions_feed"},
+    ),
+    (
+        "GET /exceptions?exception_type=",
+        lambda r, p: r.events.exceptions(None, 101, p["exception_type"]),
+        {"idx_events_exceptions_feed"},
+    ),
+    (
+        "GET /boxes/{box_id} timeline page",
+        lambda r, p: r.events.box_timeline(p["box_id"], None, 101),
+        {"idx_events_box_timeline", "idx_events_box_type"},
+    ),
+    (
+        "GET /stats/today recent events",
+        lambda r, p: r.events.recent(5),
+        {"idx_events_time"},
+    ),
+    (
+        "GET /stats/today put-away IN times",
+        lambda r, p: r.events.received_times(p["box_ids"]),
+        {"idx_events_box_type"},
+    ),
+    (
+        "GET /stats/today put-away count",
+        lambda r, p: r.inventory.count_in_stock(p["receiving_id"]),
+        {"idx_inventory_state_in_stock_location", "idx_inventory_state_location"},
+    ),
+    (
+        "GET /stats/today put-away preview",
+        lambda r, p: r.inventory.oldest_in_stock(p["receiving_id"], 5),
+        {"idx_inventory_state_in_stock_location", "idx_inventory_state_location"},
+    ),
+    (
+        # product_stock_report (migration 021), GET /products/stock?product_id=
+        "GET /products/stock?product_id=",
+        """SELECT product_id, lot_code, location_id, box_count FROM product_stock
+           WHERE product_id = %(product_id)s""",
+        {"product_stock_pkey"},
+    ),
+    (
+        # record_scan (migration 017), POST /events
+        "record_scan idempotency lookup",
+        "SELECT event_id FROM event_keys WHERE client_event_id = %(client_event_id)s",
+        {"event_keys_pkey"},
+    ),
+    (
+        # record_scan (migration 004), POST /events
+        "record_scan has-IN check",
+        "SELECT EXISTS (SELECT 1 FROM events WHERE box_id = %(box_id)s AND event_type = 'IN')",
+        {"idx_events_box_type", "idx_events_box_timeline"},
+    ),
+    (
+        # undo_event (migration 011), POST /events/{event_id}/undo
+        "undo_event lookup",
+        "SELECT * FROM events WHERE event_id = %(event_id)s",
+        {"events_pkey"},
+    ),
+    (
+        # exception_summary (migrations 008, 019), GET /exceptions/summary
+        "exception_summary (30 days)",
+        """SELECT e.exception_type, COUNT(*) FROM events e
+           JOIN boxes b ON b.box_id = e.box_id
+           WHERE e.exception_type IS NOT NULL AND e.reversed = FALSE
+             AND e.timestamp >= %(month_ago)s AND e.timestamp < %(now)s
+           GROUP BY 1""",
+        {"idx_events_exceptions_feed"},
+        {"boxes"},
+    ),
+    (
+        # search_inventory event filter (migration 015), GET /inventory?event_type=IN&event_date=
+        "search_inventory boxes with an IN today",
+        """SELECT DISTINCT box_id FROM events
+           WHERE event_type = 'IN' AND reversed = FALSE
+             AND timestamp >= %(day_start)s AND timestamp < %(now)s""",
+        {"idx_events_type_time"},
+    ),
+    (
+        # search_box_matches box ID substring (migration 018), GET /inventory?search=
+        "search_box_matches box ID substring",
+        "SELECT box_id FROM boxes WHERE box_id ILIKE search_contains_pattern(%(box_id_fragment)s)",
+        {"idx_boxes_box_id_trgm"},
+    ),
+    (
+        # search_inventory (migration 015), GET /inventory first page
+        "search_inventory newest page",
+        """SELECT * FROM inventory_state
+           ORDER BY last_event_time DESC NULLS LAST, box_id DESC LIMIT 51""",
+        {"idx_inventory_state_last_event"},
+    ),
+    (
+        # rebuild_inventory_state (migration 017), POST /inventory/rebuild
+        "rebuild_inventory_state for a few boxes",
+        """SELECT DISTINCT ON (box_id) box_id, event_type, timestamp FROM events
+           WHERE reversed = FALSE AND box_id = ANY(%(box_ids)s)
+           ORDER BY box_id, timestamp DESC, event_id DESC""",
+        {"idx_events_box_timeline", "idx_events_box_type"},
+    ),
+]
+
+
+class CapturedQuery(Exception):
+    """Raised instead of running a repository's statement, carrying its SQL and parameters."""
+
+    def __init__(self, sql: str, params):
+        super().__init__(sql)
+        self.sql = sql
+        self.params = params
+
+
+def capture_statement(call, params: dict) -> tuple:
+    """SQL and parameters of the statement a repository call sends (nothing is executed)."""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from app.repositories import postgres_backend
+
+    async def capturing_run_query(query):
+        raise CapturedQuery(query.sql, query.params)
+
+    postgres_backend.run_query = capturing_run_query
+    try:
+        asyncio.run(call(postgres_backend.create_repositories(), params))
+    except CapturedQuery as captured:
+        return captured.sql, captured.params
+    raise RuntimeError("the repository call sent no statement")
+
+
+def apply_migrations(conn):
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+        print(f"Applying {os.path.basename(path)}")
+        with conn.cursor() as cur:
+            cur.execute(open(path).read())
+
+
+def seed(conn, boxes: int, events_per_box: int, products: int = 500, locations: int = 2000):
+    """Bulk-load data shaped like production: most boxes received, moved a few times, some shipped."""
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO products (brand, name, size)
+            SELECT 'Brand ' || (i %% 40), 'Product ' || i, (i %% 5 + 1) || 'L'
+            FROM generate_series(1, %s) i
+        """, (products,))
+        # Aisles of 20 racks x 5 shelves
+        cur.execute("""
+            INSERT INTO locations (location_code, zone, aisle, rack, shelf)
+            SELECT 'A' || a || '-' || r || '-' || s, 'A', a::TEXT, r::TEXT, s::TEXT
+            FROM generate_series(0, %s - 1) i,
+                 LATERAL (SELECT i / 100 + 1 AS a, i / 5 %% 20 + 1 AS r, i %% 5 + 1 AS s) l
+            ON CONFLICT (location_code) DO NOTHING
+        """, (locations,))
+        cur.execute("""
+            WITH p AS (SELECT array_agg(product_id) AS ids FROM products)
+            INSERT INTO boxes (box_id, product_id, lot_code, created_at)
+            SELECT 'BX-BENCH-' || lpad(i::TEXT, 7, '0'),
+                   p.ids[1 + i %% array_length(p.ids, 1)],
+                   'LOT' || (i %% 900),
+                   NOW() - (i %% 180) * INTERVAL '1 day'
+            FROM generate_series(1, %s) i, p
+        """, (boxes,))
+        # Event n of each box: IN first, then MOVEs, the last one an OUT for a
+        # third of the boxes; ~2% flagged as exceptions and ~3% reversed
+        cur.execute("""
+            WITH locs AS (SELECT array_agg(location_id) AS ids FROM locations)
+            INSERT INTO events (client_event_id, event_type, box_id, location_id, timestamp, mode,
+                                source_type, exception_type, reversed)
+            SELECT gen_random_uuid(),
+                   CASE WHEN n = 1 THEN 'IN' WHEN n = %(per_box)s AND i %% 3 = 0 THEN 'OUT' ELSE 'MOVE' END,
+                   'BX-BENCH-' || lpad(i::TEXT, 7, '0'),
+                   CASE WHEN n = %(per_box)s AND i %% 3 = 0 THEN NULL ELSE locs.ids[1 + (i * 7 + n) %% array_length(locs.ids, 1)] END,
+                   NOW() - (i %% 180) * INTERVAL '1 day' + n * INTERVAL '1 hour',
+                   CASE WHEN n = 1 THEN 'INBOUND' WHEN n = %(per_box)s AND i %% 3 = 0 THEN 'OUTBOUND' ELSE 'MOVE' END,
+                   'PHONE',
+                   CASE WHEN n = %(per_box)s AND (i * 31 + n) %% 50 = 0 THEN 'OUT_WITHOUT_IN' END,
+                   (i * 17 + n) %% 33 = 0
+            FROM generate_series(1, %(boxes)s) i, generate_series(1, %(per_box)s) n, locs
+        """, {"boxes": boxes, "per_box": events_per_box})
+        cur.execute("SELECT rebuild_inventory_state()")
+        # Monthly partitions, as after the backfill
+        cur.execute("SELECT to_regproc('split_events_history') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("SELECT split_events_history()")
+            while cur.fetchone()[0] is not None:
+                cur.execute("SELECT split_events_history()")
+        cur.execute("ANALYZE")
+    print(f"Seeded {boxes} boxes / {boxes * events_per_box} events in {time.perf_counter() - started:.1f}s")
+
+
+def sample_params(conn) -> dict:
+    with conn.cursor() as cur:
+        cur.execute("SELECT event_id, client_event_id, box_id, timestamp FROM events ORDER BY timestamp DESC OFFSET 500 LIMIT 1")
+        event_id, client_event_id, box_id, cursor_time = cur.fetchone()
+        cur.execute("SELECT array_agg(box_id) FROM (SELECT box_id FROM boxes ORDER BY box_id LIMIT 5 OFFSET 1000) b")
+        box_ids = cur.fetchone()[0]
+        cur.execute("SELECT location_id FROM locations WHERE location_code = 'RECEIVING'")
+        receiving = cur.fetchone()
+        cur.execute("SELECT product_id FROM product_stock LIMIT 1")
+        product = cur.fetchone()
+        cur.execute("SELECT NOW()::TIMESTAMP, date_trunc('day', NOW())::TIMESTAMP, (NOW() - INTERVAL '30 days')::TIMESTAMP")
+        now, day_start, month_ago = cur.fetchone()
+    return {
+        "event_id": event_id,
+        "client_event_id": client_event_id,
+        "box_id": box_id,
+        "box_ids": box_ids,
+        # Middle of a box ID, as when searching for a date
+        "box_id_fragment": box_id[4:-1],
+        "cursor_time": cursor_time,
+        "cursor_id": event_id,
+        "exception_type": "OUT_WITHOUT_IN",
+        "receiving_id": receiving[0] if receiving else None,
+        "product_id": product[0] if product else None,
+        "now": now,
+        "day_start": day_start,
+        "month_ago": month_ago,
+    }
+
+
+def partition_names(conn) -> dict:
+    """Map indexes and tables of partitions to the partitioned index / table they belong to."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            WITH RECURSIVE tree AS (
+                SELECT inhrelid AS child, inhparent AS root FROM pg_inherits
+                WHERE inhparent NOT IN (SELECT inhrelid FROM pg_inherits)
+                UNION ALL
+                SELECT i.inhrelid, t.root FROM pg_inherits i JOIN tree t ON i.inhparent = t.child
+            )
+            SELECT child::regclass::TEXT, root::regclass::TEXT FROM tree
+        """)
+        return dict(cur.fetchall())
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def check_query(conn, sql: str, params, expected: set, allow_seq: set, parents: dict) -> dict:
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(plan_nodes(plan[0]["Plan"]))
+    indexes = {parents.get(node["Index Name"], node["Index Name"]) for node in nodes if "Index Name" in node}
+    # Seq scans of empty partitions (months ahead, the default) cost nothing
+    seq_scans = {
+        parents.get(node["Relation Name"], node["Relation Name"])
+        for node in nodes
+        if node["Node Type"] == "Seq Scan" and node["Actual Rows"] + node.get("Rows Removed by Filter", 0) > 0
+    } - allow_seq
+    problems = []
+    if seq_scans:
+        problems.append("seq scan on " + ", ".join(sorted(seq_scans)))
+    if not indexes & expected:
+        problems.append("expected " + " or ".join(sorted(expected)))
+    return {
+        "indexes": sorted(indexes),
+        "ms": plan[0]["Execution Time"],
+        "problems": problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", "postgresql://localhost/inventory_bench"))
+    parser.add_argument("--boxes", type=int, default=50000)
+    parser.add_argument("--events-per-box", type=int, default=6)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('events') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            apply_migrations(conn)
+        cur.execute("SELECT EXISTS (SELECT 1 FROM events)")
+        if not cur.fetchone()[0]:
+            seed(conn, args.boxes, args.events_per_box)
+
+    params = sample_params(conn)
+    parents = partition_names(conn)
+    failures = 0
+    print(f"{'query':<48} {'result':<6} {'ms':>8}  indexes")
+    for name, statement, expected, *allow_seq in QUERIES:
+        if callable(statement):
+            sql, values = capture_statement(statement, params)
+        else:
+            sql, values = statement, params
+        result = check_query(conn, sql, values, expected, allow_seq[0] if allow_seq else set(), parents)
+        status = "FAIL" if result["problems"] else "ok"
+        failures += bool(result["problems"])
+        print(f"{name:<48} {status:<6} {result['ms']:>8.2f}  {', '.join(result['indexes']) or '-'}")
+        for problem in result["problems"]:
+            print(f"    {problem}")
+
+    print(f"\n{len(QUERIES) - failures}/{len(QUERIES)} queries use their indexes")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
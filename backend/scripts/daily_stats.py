@@ -0,0 +1,79 @@
+"""
+Maintenance of the daily_stats rollup behind the dashboard counters
+(migrations 010 and 019).
+
+    show           print the rollup's time zone and its latest days
+    set-time-zone  bucket the rollup by another IANA time zone (e.g.
+                   Europe/Berlin) and rebuild it from events
+    rebuild        rebuild the rollup from events in the current time zone
+
+The rollup counts each event on its local day in stats_settings.time_zone.
+The API uses the same zone for "today" and for date filters, and picks up a
+change within REFERENCE_CACHE_TTL. A rebuild scans every live event and
+blocks new scans until it commits: run it off-peak. Days whose events were
+archived keep their counters.
+
+Usage:
+    python scripts/daily_stats.py show --dsn postgresql://...
+    python scripts/daily_stats.py set-time-zone Europe/Berlin
+
+Requires psycopg2 (pip install psycopg2-binary).
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+
+def show(conn, days: int):
+    with conn.cursor() as cur:
+        cur.execute("SELECT time_zone FROM stats_settings")
+        print(f"time zone: {cur.fetchone()[0]}")
+        cur.execute("""
+            SELECT day, event_type, event_count, box_count, exception_count
+            FROM daily_stats
+            WHERE day > (SELECT MAX(day) FROM daily_stats) - %s
+            ORDER BY day DESC, event_type
+        """, (days,))
+        rows = cur.fetchall()
+    print(f"{'day':<12} {'type':<6} {'events':>8} {'boxes':>8} {'exceptions':>11}")
+    for day, event_type, events, boxes, exceptions in rows:
+        print(f"{day:%Y-%m-%d}   {event_type:<6} {events:>8} {boxes:>8} {exceptions:>11}")
+
+
+def rebuild(conn, time_zone=None):
+    started = time.perf_counter()
+    with conn, conn.cursor() as cur:
+        try:
+            cur.execute("SELECT rebuild_daily_stats(%s)", (time_zone,))
+        except psycopg2.errors.InvalidParameterValue as e:
+            sys.exit(f"{time_zone}: {e.diag.message_primary}")
+        cur.execute("SELECT time_zone FROM stats_settings")
+        time_zone = cur.fetchone()[0]
+    print(f"rebuilt daily_stats in {time_zone} in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["show", "set-time-zone", "rebuild"])
+    parser.add_argument("time_zone", nargs="?", help="IANA time zone name (set-time-zone)")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", "postgresql://localhost/inventory"))
+    parser.add_argument("--days", type=int, default=7, help="days shown")
+    args = parser.parse_args()
+
+    if args.command == "set-time-zone" and not args.time_zone:
+        parser.error("set-time-zone needs a time zone, e.g. Europe/Berlin")
+
+    conn = psycopg2.connect(args.dsn)
+    if args.command == "show":
+        show(conn, args.days)
+    elif args.command == "set-time-zone":
+        rebuild(conn, args.time_zone)
+    else:
+        rebuild(conn)
+
+
+if __name__ == "__main__":
+    main()
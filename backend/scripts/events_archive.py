@@ -0,0 +1,194 @@
+"""
+Maintenance of the monthly events partitions (migration 017).
+
+    partitions  create the monthly partitions for the coming months
+    backfill    split events_history (the table as it was before 017) into
+                monthly partitions, oldest month first
+    archive     export finished months older than --keep-months to
+                compressed files in --dir, then drop their partitions
+    list        show the partitions and the archived months
+
+Archiving a month locks its partition against writes, copies it to
+events-YYYY-MM.csv.gz (or .parquet with --format parquet, which needs
+pyarrow), re-reads the file to check the row count and only then drops the
+partition, in one transaction. The files are what GET /events/export reads
+archived months from: point EVENTS_ARCHIVE_DIR of the API at the same
+directory.
+
+Usage:
+    python scripts/events_archive.py backfill --dsn postgresql://...
+    python scripts/events_archive.py partitions --months-ahead 3
+    python scripts/events_archive.py archive --keep-months 12 --dir archive/events
+
+Run partitions (and archive) monthly, e.g. from cron. The backfill moves one
+month per transaction and holds an exclusive lock on events while it does:
+run it off-peak.
+Requires psycopg2 (pip install psycopg2-binary).
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2 import sql
+
+# Rows fetched per round trip when writing Parquet
+PARQUET_BATCH_SIZE = 10000
+
+
+def list_partitions(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT partition_name, range_start, range_end, is_default, estimated_rows FROM event_partitions()")
+        partitions = cur.fetchall()
+        cur.execute("SELECT range_start, file_name, row_count, archived_at FROM event_archives ORDER BY range_start")
+        archives = cur.fetchall()
+    print(f"{'partition':<18} {'from':<12} {'to':<12} {'rows (est.)':>12}")
+    for name, start, end, is_default, rows in partitions:
+        start = "DEFAULT" if is_default else (f"{start:%Y-%m-%d}" if start else "MINVALUE")
+        end = f"{end:%Y-%m-%d}" if end else ""
+        print(f"{name:<18} {start:<12} {end:<12} {rows:>12}")
+    for start, file_name, rows, archived_at in archives:
+        print(f"archived {start:%Y-%m}: {file_name} ({rows} rows, {archived_at:%Y-%m-%d})")
+
+
+def ensure_partitions(conn, months_ahead: int):
+    with conn.cursor() as cur:
+        cur.execute("SELECT ensure_event_partitions(%s)", (months_ahead,))
+        created = cur.fetchone()[0]
+    conn.commit()
+    print(f"Created {', '.join(created)}" if created else "Partitions already exist")
+
+
+def backfill(conn):
+    while True:
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute("SELECT split_events_history()")
+            month = cur.fetchone()[0]
+        conn.commit()
+        if month is None:
+            print("events_history is fully split")
+            return
+        print(f"Moved {month:%Y-%m} into its own partition in {time.perf_counter() - started:.1f}s")
+
+
+def write_csv(cur, partition: str, path: str) -> int:
+    """COPY the partition into a gzipped CSV file and return the rows read back from it."""
+    copy = sql.SQL("COPY (SELECT * FROM {} ORDER BY timestamp, event_id) TO STDOUT WITH (FORMAT csv, HEADER)")
+    with gzip.open(path, "wb") as f:
+        cur.copy_expert(copy.format(sql.Identifier(partition)), f)
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        return sum(1 for _ in csv.DictReader(f))
+
+
+def write_parquet(conn, partition: str, path: str) -> int:
+    """Write the partition to a Parquet file and return the row count stored in it."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with conn.cursor(name="archive") as cur:
+        cur.execute(sql.SQL("SELECT * FROM {} ORDER BY timestamp, event_id").format(sql.Identifier(partition)))
+        rows = cur.fetchmany(PARQUET_BATCH_SIZE)
+        columns = [column.name for column in cur.description]
+        # Everything but the timestamp and the reversed flag is text (UUIDs included)
+        types = {"timestamp": pa.timestamp("us"), "reversed": pa.bool_()}
+        schema = pa.schema([(column, types.get(column, pa.string())) for column in columns])
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            while rows:
+                writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=schema))
+                rows = cur.fetchmany(PARQUET_BATCH_SIZE)
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive(conn, keep_months: int, directory: str, file_format: str):
+    os.makedirs(directory, exist_ok=True)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT partition_name, range_start FROM event_partitions()
+            WHERE NOT is_default
+              AND range_start IS NOT NULL
+              AND range_end <= date_trunc('month', NOW()) - make_interval(months => %s)
+            ORDER BY range_start
+        """, (keep_months,))
+        cold = cur.fetchall()
+    conn.commit()
+    if not cold:
+        print(f"No finished partitions older than {keep_months} months")
+        return
+
+    for partition, month in cold:
+        started = time.perf_counter()
+        file_name = f"events-{month:%Y-%m}.{file_format}"
+        path = os.path.join(directory, file_name)
+        partial = path + ".partial"
+        try:
+            with conn.cursor() as cur:
+                # Nothing may change the month between the export and the drop
+                cur.execute(sql.SQL("LOCK TABLE {} IN SHARE MODE").format(sql.Identifier(partition)))
+                cur.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(partition)))
+                expected = cur.fetchone()[0]
+                if file_format == "parquet":
+                    written = write_parquet(conn, partition, partial)
+                else:
+                    written = write_csv(cur, partition, partial)
+                if written != expected:
+                    raise RuntimeError(f"{file_name} holds {written} rows, {partition} has {expected}")
+                with open(partial, "rb") as f:
+                    os.fsync(f.fileno())
+                os.replace(partial, path)
+                cur.execute(
+                    "SELECT archive_event_partition(%s, %s, %s, %s, %s)",
+                    (partition, file_name, file_format, expected, sha256(path))
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            for leftover in (partial, path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        size = os.path.getsize(path)
+        print(f"Archived {partition}: {expected} rows -> {path} ({size / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["partitions", "backfill", "archive", "list"])
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", "postgresql://localhost/inventory"))
+    parser.add_argument("--months-ahead", type=int, default=3)
+    parser.add_argument("--keep-months", type=int, default=12, help="finished months kept in the database")
+    parser.add_argument("--dir", default=os.getenv("EVENTS_ARCHIVE_DIR", "archive/events"))
+    parser.add_argument("--format", choices=["csv.gz", "parquet"], default="csv.gz")
+    args = parser.parse_args()
+
+    if args.command == "archive" and args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            sys.exit("--format parquet requires pyarrow (pip install pyarrow)")
+
+    conn = psycopg2.connect(args.dsn)
+    if args.command == "partitions":
+        ensure_partitions(conn, args.months_ahead)
+    elif args.command == "backfill":
+        backfill(conn)
+    elif args.command == "archive":
+        archive(conn, args.keep_months, args.dir, args.format)
+    else:
+        list_partitions(conn)
+
+
+if __name__ == "__main__":
+    main()
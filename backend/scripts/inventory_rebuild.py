@@ -0,0 +1,47 @@
+"""
+Rebuild the inventory_state projection from the events log (migrations 011
+and 017), for the whole warehouse or for some boxes.
+
+POST /inventory/rebuild only takes a list of boxes: a full rebuild scans
+every live event and outlasts the API's DB_QUERY_TIMEOUT. This runs it on a
+direct connection without a statement timeout. It locks every box until it
+commits, so scans wait for it: run it off-peak.
+
+Usage:
+    python scripts/inventory_rebuild.py --dsn postgresql://...
+    python scripts/inventory_rebuild.py BOX-000123 BOX-000124
+
+Requires psycopg2 (pip install psycopg2-binary).
+"""
+import argparse
+import os
+import time
+
+import psycopg2
+
+
+def rebuild(conn, box_ids=None):
+    started = time.perf_counter()
+    with conn, conn.cursor() as cur:
+        cur.execute("SET LOCAL statement_timeout = 0")
+        cur.execute("SELECT rebuild_inventory_state(%s::varchar[])", (box_ids,))
+        result = cur.fetchone()[0]
+    scope = f"{len(box_ids)} box(es)" if box_ids else "all boxes"
+    print(
+        f"rebuilt inventory_state for {scope} in {time.perf_counter() - started:.1f}s: "
+        f"{result['updated']} updated, {result['removed']} removed"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("box_ids", nargs="*", help="boxes to rebuild (default: all)")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", "postgresql://localhost/inventory"))
+    args = parser.parse_args()
+
+    box_ids = list(dict.fromkeys(b[4:] if b.startswith("BOX:") else b for b in args.box_ids))
+    rebuild(psycopg2.connect(args.dsn), box_ids or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+-- Single-round-trip scan ingestion
+-- record_scan performs idempotency, rules T1-T3, the event insert and the
+-- inventory_state upsert in one transaction, and returns everything the
+-- API needs to build an EventResponse.
+
+CREATE OR REPLACE FUNCTION record_scan(
+    p_client_event_id UUID,
+    p_event_type VARCHAR,
+    p_box_id VARCHAR,
+    p_location_code VARCHAR,
+    p_mode VARCHAR,
+    p_source_type VARCHAR DEFAULT 'PHONE',
+    p_source_id VARCHAR DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_existing events%ROWTYPE;
+    v_box RECORD;
+    v_location_id UUID;
+    v_status VARCHAR;
+    v_current_location_id UUID;
+    v_exception_type VARCHAR;
+    v_warning TEXT;
+    v_changed BOOLEAN := TRUE;
+    v_message TEXT := 'Event created successfully';
+    v_event_id UUID;
+    v_timestamp TIMESTAMP;
+BEGIN
+    -- Box and product (also serializes concurrent scans of the same box)
+    SELECT b.box_id, b.lot_code, p.brand, p.name, p.size
+    INTO v_box
+    FROM boxes b
+    JOIN products p ON p.product_id = b.product_id
+    WHERE b.box_id = p_box_id
+    FOR UPDATE OF b;
+
+    -- Idempotency: a retried scan returns the stored event
+    SELECT * INTO v_existing FROM events WHERE client_event_id = p_client_event_id;
+    IF FOUND THEN
+        SELECT b.box_id, b.lot_code, p.brand, p.name, p.size
+        INTO v_box
+        FROM boxes b
+        JOIN products p ON p.product_id = b.product_id
+        WHERE b.box_id = v_existing.box_id;
+
+        RETURN jsonb_build_object(
+            'success', TRUE,
+            'message', 'Event already processed',
+            'event_id', v_existing.event_id,
+            'warning', NULL,
+            'exception_type', v_existing.exception_type,
+            'is_duplicate', TRUE,
+            'changed', FALSE,
+            'box_id', v_existing.box_id,
+            'product', jsonb_build_object('brand', v_box.brand, 'name', v_box.name, 'size', v_box.size),
+            'lot_code', v_box.lot_code
+        );
+    END IF;
+
+    IF v_box.box_id IS NULL THEN
+        RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'Unknown box. Create label first.');
+    END IF;
+
+    -- Resolve location_code
+    IF p_location_code IS NOT NULL AND p_location_code <> '' THEN
+        SELECT location_id INTO v_location_id FROM locations WHERE location_code = p_location_code;
+        IF v_location_id IS NULL THEN
+            RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'Location not found: ' || p_location_code);
+        END IF;
+    END IF;
+
+    -- T1: Mode matches event_type
+    IF (p_mode = 'INBOUND' AND p_event_type <> 'IN')
+        OR (p_mode = 'OUTBOUND' AND p_event_type <> 'OUT')
+        OR (p_mode = 'MOVE' AND p_event_type <> 'MOVE') THEN
+        RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'Mode does not match event type');
+    END IF;
+
+    -- T2: MOVE requires location_code
+    IF p_event_type = 'MOVE' AND v_location_id IS NULL THEN
+        RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'MOVE event requires location_code');
+    END IF;
+
+    SELECT status, current_location_id
+    INTO v_status, v_current_location_id
+    FROM inventory_state
+    WHERE box_id = p_box_id;
+
+    -- T3: MOVE only if IN_STOCK
+    IF p_event_type = 'MOVE' AND v_status = 'OUT_OF_WAREHOUSE' THEN
+        RETURN jsonb_build_object(
+            'success', FALSE,
+            'status_code', 400,
+            'error', 'Cannot move box that is out of warehouse. Please receive box first (INBOUND mode).',
+            'exception_type', 'MOVE_WHEN_OUT'
+        );
+    END IF;
+
+    -- T3: OUT without IN warning
+    IF p_event_type = 'OUT' AND NOT EXISTS (
+        SELECT 1 FROM events WHERE box_id = p_box_id AND event_type = 'IN'
+    ) THEN
+        v_exception_type := 'OUT_WITHOUT_IN';
+        v_warning := 'Box was never received (no IN event found)';
+    END IF;
+
+    -- T3: IN defaults to RECEIVING
+    IF p_event_type = 'IN' AND v_location_id IS NULL THEN
+        SELECT location_id INTO v_location_id FROM locations WHERE location_code = 'RECEIVING' LIMIT 1;
+    END IF;
+
+    IF p_event_type = 'MOVE' AND v_current_location_id = v_location_id THEN
+        v_changed := FALSE;
+        v_message := 'Box already at this location';
+    END IF;
+
+    INSERT INTO events (
+        client_event_id, event_type, box_id, location_id, mode,
+        source_type, source_id, exception_type, warning
+    )
+    VALUES (
+        p_client_event_id, p_event_type, p_box_id, v_location_id, p_mode,
+        COALESCE(p_source_type, 'PHONE'), p_source_id, v_exception_type, v_warning
+    )
+    RETURNING event_id, timestamp INTO v_event_id, v_timestamp;
+
+    INSERT INTO inventory_state (box_id, status, current_location_id, last_event_time, last_event_type)
+    VALUES (
+        p_box_id,
+        CASE WHEN p_event_type = 'OUT' THEN 'OUT_OF_WAREHOUSE' ELSE 'IN_STOCK' END,
+        CASE WHEN p_event_type = 'OUT' THEN NULL ELSE v_location_id END,
+        v_timestamp,
+        p_event_type
+    )
+    ON CONFLICT (box_id) DO UPDATE
+    SET status = EXCLUDED.status,
+        current_location_id = CASE
+            WHEN EXCLUDED.status = 'OUT_OF_WAREHOUSE' THEN NULL
+            ELSE COALESCE(EXCLUDED.current_location_id, inventory_state.current_location_id)
+        END,
+        last_event_time = EXCLUDED.last_event_time,
+        last_event_type = EXCLUDED.last_event_type;
+
+    RETURN jsonb_build_object(
+        'success', TRUE,
+        'message', v_message,
+        'event_id', v_event_id,
+        'warning', v_warning,
+        'exception_type', v_exception_type,
+        'is_duplicate', FALSE,
+        'changed', v_changed,
+        'box_id', p_box_id,
+        'product', jsonb_build_object('brand', v_box.brand, 'name', v_box.name, 'size', v_box.size),
+        'lot_code', v_box.lot_code
+    );
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,255 @@
+-- Batch scan ingestion for offline phone queues and station uploads
+-- record_scans applies the same rules as record_scan to an ordered JSON
+-- array of scans. Reference data, duplicates and current inventory state
+-- are loaded in bulk, rules are evaluated in order per box in memory, and
+-- events / inventory_state are written with one INSERT each.
+
+CREATE OR REPLACE FUNCTION record_scans(p_scans JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_item RECORD;
+    v_cid UUID;
+    v_cid_key TEXT;
+    v_event_type VARCHAR;
+    v_box_id VARCHAR;
+    v_location_code VARCHAR;
+    v_mode VARCHAR;
+    v_box JSONB;
+    v_box_state JSONB;
+    v_location_id UUID;
+    v_current_location_id UUID;
+    v_exception_type VARCHAR;
+    v_warning TEXT;
+    v_changed BOOLEAN;
+    v_message TEXT;
+    v_error TEXT;
+    v_event_id UUID;
+    v_timestamp TIMESTAMP;
+    v_now TIMESTAMP := LOCALTIMESTAMP;
+    v_receiving_id UUID;
+    v_boxes JSONB;
+    v_locations JSONB;
+    v_state JSONB;
+    v_existing JSONB;
+    v_accepted JSONB := '{}'::JSONB;
+    v_results JSONB[] := '{}';
+    a_event_id UUID[] := '{}';
+    a_client_event_id UUID[] := '{}';
+    a_event_type VARCHAR[] := '{}';
+    a_box_id VARCHAR[] := '{}';
+    a_location_id UUID[] := '{}';
+    a_timestamp TIMESTAMP[] := '{}';
+    a_mode VARCHAR[] := '{}';
+    a_source_type VARCHAR[] := '{}';
+    a_source_id VARCHAR[] := '{}';
+    a_exception_type VARCHAR[] := '{}';
+    a_warning TEXT[] := '{}';
+BEGIN
+    -- Lock every box in the batch, in a stable order to avoid deadlocks
+    PERFORM 1
+    FROM boxes
+    WHERE box_id IN (SELECT DISTINCT s->>'box_id' FROM jsonb_array_elements(p_scans) s)
+    ORDER BY box_id
+    FOR UPDATE;
+
+    -- Bulk idempotency: scans already stored, keyed by client_event_id
+    SELECT COALESCE(jsonb_object_agg(e.client_event_id::TEXT, jsonb_build_object(
+        'success', TRUE,
+        'message', 'Event already processed',
+        'event_id', e.event_id,
+        'warning', NULL,
+        'exception_type', e.exception_type,
+        'is_duplicate', TRUE,
+        'changed', FALSE,
+        'box_id', e.box_id,
+        'product', jsonb_build_object('brand', p.brand, 'name', p.name, 'size', p.size),
+        'lot_code', b.lot_code
+    )), '{}'::JSONB)
+    INTO v_existing
+    FROM events e
+    JOIN boxes b ON b.box_id = e.box_id
+    JOIN products p ON p.product_id = b.product_id
+    WHERE e.client_event_id IN (
+        SELECT (s->>'client_event_id')::UUID FROM jsonb_array_elements(p_scans) s
+    );
+
+    -- Boxes with product info
+    SELECT COALESCE(jsonb_object_agg(b.box_id, jsonb_build_object(
+        'lot_code', b.lot_code,
+        'product', jsonb_build_object('brand', p.brand, 'name', p.name, 'size', p.size)
+    )), '{}'::JSONB)
+    INTO v_boxes
+    FROM boxes b
+    JOIN products p ON p.product_id = b.product_id
+    WHERE b.box_id IN (SELECT DISTINCT s->>'box_id' FROM jsonb_array_elements(p_scans) s);
+
+    -- Current state of those boxes, including whether they were ever received
+    SELECT COALESCE(jsonb_object_agg(b.box_id, jsonb_build_object(
+        'status', i.status,
+        'location_id', i.current_location_id,
+        'has_in', EXISTS (SELECT 1 FROM events e WHERE e.box_id = b.box_id AND e.event_type = 'IN')
+    )), '{}'::JSONB)
+    INTO v_state
+    FROM boxes b
+    LEFT JOIN inventory_state i ON i.box_id = b.box_id
+    WHERE b.box_id IN (SELECT DISTINCT s->>'box_id' FROM jsonb_array_elements(p_scans) s);
+
+    -- Locations referenced by the batch
+    SELECT COALESCE(jsonb_object_agg(l.location_code, l.location_id), '{}'::JSONB)
+    INTO v_locations
+    FROM locations l
+    WHERE l.location_code IN (
+        SELECT DISTINCT s->>'location_code' FROM jsonb_array_elements(p_scans) s
+    );
+
+    SELECT location_id INTO v_receiving_id FROM locations WHERE location_code = 'RECEIVING' LIMIT 1;
+
+    FOR v_item IN
+        SELECT value, ordinality FROM jsonb_array_elements(p_scans) WITH ORDINALITY ORDER BY ordinality
+    LOOP
+        v_cid := (v_item.value->>'client_event_id')::UUID;
+        v_cid_key := v_cid::TEXT;
+        v_event_type := v_item.value->>'event_type';
+        v_box_id := v_item.value->>'box_id';
+        v_location_code := NULLIF(v_item.value->>'location_code', '');
+        v_mode := v_item.value->>'mode';
+        v_error := NULL;
+        v_location_id := NULL;
+        v_exception_type := NULL;
+        v_warning := NULL;
+        v_changed := TRUE;
+        v_message := 'Event created successfully';
+
+        -- Idempotency: already stored, or accepted earlier in this batch
+        IF v_existing ? v_cid_key THEN
+            v_results := v_results || (v_existing->v_cid_key || jsonb_build_object('client_event_id', v_cid));
+            CONTINUE;
+        END IF;
+        IF v_accepted ? v_cid_key THEN
+            v_results := v_results || (
+                v_results[(v_accepted->>v_cid_key)::INTEGER]
+                || jsonb_build_object('message', 'Event already processed', 'is_duplicate', TRUE, 'changed', FALSE, 'warning', NULL)
+            );
+            CONTINUE;
+        END IF;
+
+        v_box := v_boxes->v_box_id;
+        v_box_state := v_state->v_box_id;
+
+        IF v_box IS NULL THEN
+            v_error := 'Unknown box. Create label first.';
+        ELSIF v_location_code IS NOT NULL AND NOT v_locations ? v_location_code THEN
+            v_error := 'Location not found: ' || v_location_code;
+        ELSIF (v_mode = 'INBOUND' AND v_event_type <> 'IN')
+            OR (v_mode = 'OUTBOUND' AND v_event_type <> 'OUT')
+            OR (v_mode = 'MOVE' AND v_event_type <> 'MOVE') THEN
+            v_error := 'Mode does not match event type';
+        ELSIF v_event_type = 'MOVE' AND v_location_code IS NULL THEN
+            v_error := 'MOVE event requires location_code';
+        ELSIF v_event_type = 'MOVE' AND v_box_state->>'status' = 'OUT_OF_WAREHOUSE' THEN
+            v_error := 'Cannot move box that is out of warehouse. Please receive box first (INBOUND mode).';
+            v_exception_type := 'MOVE_WHEN_OUT';
+        END IF;
+
+        IF v_error IS NOT NULL THEN
+            v_results := v_results || jsonb_build_object(
+                'client_event_id', v_cid,
+                'success', FALSE,
+                'status_code', 400,
+                'error', v_error,
+                'exception_type', v_exception_type
+            );
+            CONTINUE;
+        END IF;
+
+        IF v_location_code IS NOT NULL THEN
+            v_location_id := (v_locations->>v_location_code)::UUID;
+        END IF;
+
+        IF v_event_type = 'OUT' AND NOT (v_box_state->>'has_in')::BOOLEAN THEN
+            v_exception_type := 'OUT_WITHOUT_IN';
+            v_warning := 'Box was never received (no IN event found)';
+        END IF;
+
+        IF v_event_type = 'IN' AND v_location_id IS NULL THEN
+            v_location_id := v_receiving_id;
+        END IF;
+
+        v_current_location_id := (v_box_state->>'location_id')::UUID;
+        IF v_event_type = 'MOVE' AND v_current_location_id = v_location_id THEN
+            v_changed := FALSE;
+            v_message := 'Box already at this location';
+        END IF;
+
+        -- Keep events of one batch strictly ordered by timestamp
+        v_event_id := gen_random_uuid();
+        v_timestamp := v_now + (v_item.ordinality * INTERVAL '1 microsecond');
+
+        a_event_id := a_event_id || v_event_id;
+        a_client_event_id := a_client_event_id || v_cid;
+        a_event_type := a_event_type || v_event_type;
+        a_box_id := a_box_id || v_box_id;
+        a_location_id := a_location_id || v_location_id;
+        a_timestamp := a_timestamp || v_timestamp;
+        a_mode := a_mode || v_mode;
+        a_source_type := a_source_type || COALESCE(v_item.value->>'source_type', 'PHONE')::VARCHAR;
+        a_source_id := a_source_id || (v_item.value->>'source_id')::VARCHAR;
+        a_exception_type := a_exception_type || v_exception_type;
+        a_warning := a_warning || v_warning;
+
+        -- Fold the scan into the box's in-memory state
+        v_state := jsonb_set(v_state, ARRAY[v_box_id], jsonb_build_object(
+            'status', CASE WHEN v_event_type = 'OUT' THEN 'OUT_OF_WAREHOUSE' ELSE 'IN_STOCK' END,
+            'location_id', CASE
+                WHEN v_event_type = 'OUT' THEN NULL
+                ELSE COALESCE(v_location_id, v_current_location_id)
+            END,
+            'has_in', (v_box_state->>'has_in')::BOOLEAN OR v_event_type = 'IN',
+            'last_event_time', v_timestamp,
+            'last_event_type', v_event_type
+        ));
+
+        v_results := v_results || jsonb_build_object(
+            'client_event_id', v_cid,
+            'success', TRUE,
+            'message', v_message,
+            'event_id', v_event_id,
+            'warning', v_warning,
+            'exception_type', v_exception_type,
+            'is_duplicate', FALSE,
+            'changed', v_changed,
+            'box_id', v_box_id,
+            'product', v_box->'product',
+            'lot_code', v_box->'lot_code'
+        );
+        v_accepted := v_accepted || jsonb_build_object(v_cid_key, cardinality(v_results));
+    END LOOP;
+
+    INSERT INTO events (
+        event_id, client_event_id, event_type, box_id, location_id, timestamp,
+        mode, source_type, source_id, exception_type, warning
+    )
+    SELECT *
+    FROM unnest(
+        a_event_id, a_client_event_id, a_event_type, a_box_id, a_location_id, a_timestamp,
+        a_mode, a_source_type, a_source_id, a_exception_type, a_warning
+    );
+
+    INSERT INTO inventory_state (box_id, status, current_location_id, last_event_time, last_event_type)
+    SELECT
+        key,
+        value->>'status',
+        (value->>'location_id')::UUID,
+        (value->>'last_event_time')::TIMESTAMP,
+        value->>'last_event_type'
+    FROM jsonb_each(v_state)
+    WHERE value ? 'last_event_type'
+    ON CONFLICT (box_id) DO UPDATE
+    SET status = EXCLUDED.status,
+        current_location_id = EXCLUDED.current_location_id,
+        last_event_time = EXCLUDED.last_event_time,
+        last_event_type = EXCLUDED.last_event_type;
+
+    RETURN to_jsonb(v_results);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,64 @@
+-- Set-based inventory listing
+-- inventory_view joins each inventory_state row with its box, product and
+-- current location; search_inventory applies every GET /inventory filter
+-- in SQL so the endpoint costs one query regardless of inventory size.
+
+CREATE OR REPLACE VIEW inventory_view AS
+SELECT
+    i.box_id,
+    i.status,
+    i.current_location_id,
+    i.last_event_time,
+    i.last_event_type,
+    b.lot_code,
+    b.product_id,
+    p.brand,
+    p.name,
+    p.size,
+    CASE WHEN l.location_id IS NULL THEN NULL ELSE to_jsonb(l) END AS current_location
+FROM inventory_state i
+JOIN boxes b ON b.box_id = i.box_id
+JOIN products p ON p.product_id = b.product_id
+LEFT JOIN locations l ON l.location_id = i.current_location_id;
+
+CREATE OR REPLACE FUNCTION search_inventory(
+    p_status VARCHAR DEFAULT NULL,
+    p_location_id UUID DEFAULT NULL,
+    p_search TEXT DEFAULT NULL,
+    p_event_type VARCHAR DEFAULT NULL,
+    p_event_from TIMESTAMP DEFAULT NULL,
+    p_event_to TIMESTAMP DEFAULT NULL,
+    p_date_from TIMESTAMP DEFAULT NULL,
+    p_date_to TIMESTAMP DEFAULT NULL
+)
+RETURNS SETOF inventory_view AS $$
+    WITH params AS (
+        -- Escape LIKE wildcards so the search is a plain substring match
+        SELECT '%' || replace(replace(replace(p_search, '\', '\\'), '%', '\%'), '_', '\_') || '%' AS pattern
+    )
+    SELECT v.*
+    FROM inventory_view v, params
+    WHERE (p_status IS NULL OR v.status = p_status)
+      AND (p_location_id IS NULL OR v.current_location_id = p_location_id)
+      AND (p_date_from IS NULL OR v.last_event_time >= p_date_from)
+      AND (p_date_to IS NULL OR v.last_event_time < p_date_to)
+      AND (
+          p_search IS NULL
+          OR v.box_id ILIKE params.pattern
+          OR v.brand ILIKE params.pattern
+          OR v.name ILIKE params.pattern
+      )
+      AND (
+          p_event_type IS NULL
+          OR EXISTS (
+              SELECT 1
+              FROM events e
+              WHERE e.box_id = v.box_id
+                AND e.event_type = p_event_type
+                AND e.reversed = FALSE
+                AND e.timestamp >= p_event_from
+                AND e.timestamp < p_event_to
+          )
+      )
+    ORDER BY v.last_event_time DESC NULLS LAST, v.box_id;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,67 @@
+-- Keyset pagination for GET /inventory
+-- search_inventory gains a (last_event_time, box_id) cursor and a page
+-- size. Rows are ordered newest first; boxes that never had an event sort
+-- last.
+
+DROP FUNCTION IF EXISTS search_inventory(VARCHAR, UUID, TEXT, VARCHAR, TIMESTAMP, TIMESTAMP, TIMESTAMP, TIMESTAMP);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_state_last_event
+ON inventory_state(last_event_time DESC NULLS LAST, box_id DESC);
+
+CREATE OR REPLACE FUNCTION search_inventory(
+    p_status VARCHAR DEFAULT NULL,
+    p_location_id UUID DEFAULT NULL,
+    p_search TEXT DEFAULT NULL,
+    p_event_type VARCHAR DEFAULT NULL,
+    p_event_from TIMESTAMP DEFAULT NULL,
+    p_event_to TIMESTAMP DEFAULT NULL,
+    p_date_from TIMESTAMP DEFAULT NULL,
+    p_date_to TIMESTAMP DEFAULT NULL,
+    p_after_time TIMESTAMP DEFAULT NULL,
+    p_after_box_id VARCHAR DEFAULT NULL,
+    p_limit INTEGER DEFAULT NULL
+)
+RETURNS SETOF inventory_view AS $$
+    WITH params AS (
+        -- Escape LIKE wildcards so the search is a plain substring match
+        SELECT '%' || replace(replace(replace(p_search, '\', '\\'), '%', '\%'), '_', '\_') || '%' AS pattern
+    )
+    SELECT v.*
+    FROM inventory_view v, params
+    WHERE (p_status IS NULL OR v.status = p_status)
+      AND (p_location_id IS NULL OR v.current_location_id = p_location_id)
+      AND (p_date_from IS NULL OR v.last_event_time >= p_date_from)
+      AND (p_date_to IS NULL OR v.last_event_time < p_date_to)
+      AND (
+          p_search IS NULL
+          OR v.box_id ILIKE params.pattern
+          OR v.brand ILIKE params.pattern
+          OR v.name ILIKE params.pattern
+      )
+      AND (
+          p_event_type IS NULL
+          OR EXISTS (
+              SELECT 1
+              FROM events e
+              WHERE e.box_id = v.box_id
+                AND e.event_type = p_event_type
+                AND e.reversed = FALSE
+                AND e.timestamp >= p_event_from
+                AND e.timestamp < p_event_to
+          )
+      )
+      -- Rows after the cursor in (last_event_time DESC NULLS LAST, box_id DESC) order
+      AND (
+          p_after_box_id IS NULL
+          OR (
+              p_after_time IS NOT NULL
+              AND (
+                  (v.last_event_time, v.box_id) < (p_after_time, p_after_box_id)
+                  OR v.last_event_time IS NULL
+              )
+          )
+          OR (p_after_time IS NULL AND v.last_event_time IS NULL AND v.box_id < p_after_box_id)
+      )
+    ORDER BY v.last_event_time DESC NULLS LAST, v.box_id DESC
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,65 @@
+-- Aggregated exception counts for the supervisor screen
+-- exception_summary returns counts grouped by exception_type, local day,
+-- product and source in a single GROUPING SETS query.
+
+CREATE OR REPLACE FUNCTION exception_summary(
+    p_from TIMESTAMP,
+    p_to TIMESTAMP,
+    p_utc_offset_minutes INTEGER DEFAULT 0,
+    p_exception_type VARCHAR DEFAULT NULL
+)
+RETURNS JSONB AS $$
+    WITH base AS (
+        SELECT
+            e.exception_type,
+            (e.timestamp + make_interval(mins => p_utc_offset_minutes))::DATE AS day,
+            b.product_id,
+            e.source_type
+        FROM events e
+        JOIN boxes b ON b.box_id = e.box_id
+        WHERE e.exception_type IS NOT NULL
+          AND e.reversed = FALSE
+          AND e.timestamp >= p_from
+          AND e.timestamp < p_to
+          AND (p_exception_type IS NULL OR e.exception_type = p_exception_type)
+    ),
+    grouped AS (
+        -- GROUPING() bitmask: 7 = by type, 11 = by day, 13 = by product, 14 = by source, 15 = total
+        SELECT
+            exception_type,
+            day,
+            product_id,
+            source_type,
+            GROUPING(exception_type, day, product_id, source_type) AS grouping_set,
+            COUNT(*) AS count
+        FROM base
+        GROUP BY GROUPING SETS ((exception_type), (day), (product_id), (source_type), ())
+    )
+    SELECT jsonb_build_object(
+        'total', COALESCE((SELECT count FROM grouped WHERE grouping_set = 15), 0),
+        'by_type', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('exception_type', exception_type, 'count', count) ORDER BY count DESC, exception_type)
+            FROM grouped WHERE grouping_set = 7
+        ), '[]'::JSONB),
+        'by_day', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('day', day, 'count', count) ORDER BY day)
+            FROM grouped WHERE grouping_set = 11
+        ), '[]'::JSONB),
+        'by_product', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'product_id', g.product_id,
+                'brand', p.brand,
+                'name', p.name,
+                'size', p.size,
+                'count', g.count
+            ) ORDER BY g.count DESC, p.brand, p.name)
+            FROM grouped g
+            JOIN products p ON p.product_id = g.product_id
+            WHERE g.grouping_set = 13
+        ), '[]'::JSONB),
+        'by_source', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('source_type', source_type, 'count', count) ORDER BY count DESC, source_type)
+            FROM grouped WHERE grouping_set = 14
+        ), '[]'::JSONB)
+    );
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,7 @@
+-- Box timeline paging
+-- GET /boxes/{box_id} reads a box's events in (timestamp, event_id) order
+-- one page at a time; this index serves each page as a short range scan
+-- instead of sorting the box's whole history.
+
+CREATE INDEX IF NOT EXISTS idx_events_box_timeline
+ON events(box_id, timestamp, event_id);
@@ -0,0 +1,209 @@
+-- Materialized daily stats for the dashboard
+-- daily_stats keeps, per local day and event type, the number of events,
+-- distinct boxes and exceptions (reversed events excluded).
+-- daily_box_activity holds the per-box event counts behind the distinct
+-- box numbers. Both are maintained by statement-level triggers on events
+-- (insert, and reversed being set or cleared), so /stats/today and
+-- /stats/day/{date} read a handful of rows instead of scanning events.
+-- Deleting events (e.g. archiving old history) deliberately leaves the
+-- rollup untouched.
+
+CREATE TABLE IF NOT EXISTS stats_settings (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    utc_offset_minutes INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO stats_settings (id, utc_offset_minutes) VALUES (TRUE, 0)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day DATE NOT NULL,
+    event_type VARCHAR(10) NOT NULL,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    box_count INTEGER NOT NULL DEFAULT 0,
+    exception_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, event_type)
+);
+
+CREATE TABLE IF NOT EXISTS daily_box_activity (
+    day DATE NOT NULL,
+    event_type VARCHAR(10) NOT NULL,
+    box_id VARCHAR(50) NOT NULL,
+    event_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, event_type, box_id)
+);
+
+-- Local day an event timestamp (stored in UTC) falls on
+CREATE OR REPLACE FUNCTION stats_local_day(p_timestamp TIMESTAMP, p_utc_offset_minutes INTEGER)
+RETURNS DATE AS $$
+    SELECT (p_timestamp + make_interval(mins => p_utc_offset_minutes))::DATE;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Apply signed per-(day, event_type, box_id) deltas:
+-- [{day, event_type, box_id, events, exceptions}, ...]
+CREATE OR REPLACE FUNCTION apply_daily_stats_delta(p_delta JSONB)
+RETURNS VOID AS $$
+    WITH delta AS (
+        SELECT *
+        FROM jsonb_to_recordset(p_delta)
+            AS d(day DATE, event_type VARCHAR, box_id VARCHAR, events INTEGER, exceptions INTEGER)
+        WHERE events <> 0 OR exceptions <> 0
+    ),
+    activity AS (
+        INSERT INTO daily_box_activity AS a (day, event_type, box_id, event_count)
+        SELECT day, event_type, box_id, events FROM delta
+        ON CONFLICT (day, event_type, box_id) DO UPDATE
+        SET event_count = a.event_count + EXCLUDED.event_count
+        RETURNING a.day, a.event_type, a.box_id, a.event_count
+    ),
+    per_type AS (
+        -- A box is counted while it has at least one event that day
+        SELECT
+            d.day,
+            d.event_type,
+            SUM(d.events) AS events,
+            SUM(d.exceptions) AS exceptions,
+            SUM((a.event_count > 0)::INTEGER - (a.event_count - d.events > 0)::INTEGER) AS boxes
+        FROM delta d
+        JOIN activity a USING (day, event_type, box_id)
+        GROUP BY d.day, d.event_type
+    )
+    INSERT INTO daily_stats AS s (day, event_type, event_count, box_count, exception_count)
+    SELECT day, event_type, events, boxes, exceptions FROM per_type
+    ON CONFLICT (day, event_type) DO UPDATE
+    SET event_count = s.event_count + EXCLUDED.event_count,
+        box_count = s.box_count + EXCLUDED.box_count,
+        exception_count = s.exception_count + EXCLUDED.exception_count;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION daily_stats_on_insert()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_offset INTEGER;
+    v_delta JSONB;
+BEGIN
+    SELECT utc_offset_minutes INTO v_offset FROM stats_settings;
+
+    SELECT jsonb_agg(d) INTO v_delta
+    FROM (
+        SELECT
+            stats_local_day(timestamp, v_offset) AS day,
+            event_type,
+            box_id,
+            COUNT(*) AS events,
+            COUNT(exception_type) AS exceptions
+        FROM new_events
+        WHERE NOT COALESCE(reversed, FALSE)
+        GROUP BY 1, 2, 3
+    ) d;
+
+    IF v_delta IS NOT NULL THEN
+        PERFORM apply_daily_stats_delta(v_delta);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION daily_stats_on_reverse()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_offset INTEGER;
+    v_delta JSONB;
+BEGIN
+    SELECT utc_offset_minutes INTO v_offset FROM stats_settings;
+
+    -- Undo subtracts the event; clearing reversed adds it back
+    SELECT jsonb_agg(d) INTO v_delta
+    FROM (
+        SELECT
+            stats_local_day(n.timestamp, v_offset) AS day,
+            n.event_type,
+            n.box_id,
+            SUM(CASE WHEN n.reversed THEN -1 ELSE 1 END) AS events,
+            SUM(CASE WHEN n.exception_type IS NULL THEN 0 WHEN n.reversed THEN -1 ELSE 1 END) AS exceptions
+        FROM new_events n
+        JOIN old_events o ON o.event_id = n.event_id
+        WHERE COALESCE(n.reversed, FALSE) IS DISTINCT FROM COALESCE(o.reversed, FALSE)
+        GROUP BY 1, 2, 3
+    ) d;
+
+    IF v_delta IS NOT NULL THEN
+        PERFORM apply_daily_stats_delta(v_delta);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_daily_stats_insert ON events;
+CREATE TRIGGER trg_daily_stats_insert
+AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT EXECUTE FUNCTION daily_stats_on_insert();
+
+DROP TRIGGER IF EXISTS trg_daily_stats_reverse ON events;
+CREATE TRIGGER trg_daily_stats_reverse
+AFTER UPDATE ON events
+REFERENCING OLD TABLE AS old_events NEW TABLE AS new_events
+FOR EACH STATEMENT EXECUTE FUNCTION daily_stats_on_reverse();
+
+-- Recompute the whole rollup from events for a (new) timezone offset
+CREATE OR REPLACE FUNCTION rebuild_daily_stats(p_utc_offset_minutes INTEGER DEFAULT NULL)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE stats_settings
+    SET utc_offset_minutes = COALESCE(p_utc_offset_minutes, utc_offset_minutes);
+
+    DELETE FROM daily_box_activity;
+    DELETE FROM daily_stats;
+
+    INSERT INTO daily_box_activity (day, event_type, box_id, event_count)
+    SELECT stats_local_day(e.timestamp, s.utc_offset_minutes), e.event_type, e.box_id, COUNT(*)
+    FROM events e, stats_settings s
+    WHERE e.reversed = FALSE
+    GROUP BY 1, 2, 3;
+
+    INSERT INTO daily_stats (day, event_type, event_count, box_count, exception_count)
+    SELECT stats_local_day(e.timestamp, s.utc_offset_minutes), e.event_type,
+           COUNT(*), COUNT(DISTINCT e.box_id), COUNT(e.exception_type)
+    FROM events e, stats_settings s
+    WHERE e.reversed = FALSE
+    GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Counters for one local day. The API passes its timezone offset; if it
+-- differs from the one the rollup was built with, the rollup is rebuilt
+-- once (first deploy, or the server moved timezone).
+CREATE OR REPLACE FUNCTION get_daily_stats(p_day DATE, p_utc_offset_minutes INTEGER DEFAULT 0)
+RETURNS JSONB AS $$
+DECLARE
+    v_offset INTEGER;
+    v_result JSONB;
+BEGIN
+    SELECT utc_offset_minutes INTO v_offset FROM stats_settings;
+    IF v_offset IS DISTINCT FROM p_utc_offset_minutes THEN
+        -- Serialize concurrent rebuilds, then re-check
+        SELECT utc_offset_minutes INTO v_offset FROM stats_settings FOR UPDATE;
+        IF v_offset IS DISTINCT FROM p_utc_offset_minutes THEN
+            PERFORM rebuild_daily_stats(p_utc_offset_minutes);
+        END IF;
+    END IF;
+
+    SELECT jsonb_build_object(
+        'day', p_day,
+        'received', COALESCE(SUM(box_count) FILTER (WHERE event_type = 'IN'), 0),
+        'moved', COALESCE(SUM(box_count) FILTER (WHERE event_type = 'MOVE'), 0),
+        'shipped', COALESCE(SUM(box_count) FILTER (WHERE event_type = 'OUT'), 0),
+        'exceptions', COALESCE(SUM(exception_count), 0),
+        'events', COALESCE(jsonb_object_agg(event_type, event_count) FILTER (WHERE event_type IS NOT NULL), '{}'::JSONB)
+    )
+    INTO v_result
+    FROM daily_stats
+    WHERE day = p_day;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Build the rollup for events recorded before this migration
+SELECT rebuild_daily_stats();
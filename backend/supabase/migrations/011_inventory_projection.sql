@@ -0,0 +1,117 @@
+-- inventory_state as a projection of the events log
+-- rebuild_inventory_state folds the non-reversed events of one box, a set
+-- of boxes, or every box (p_box_ids NULL) into inventory_state with one
+-- set-based read and one write, using the same rules as record_scan:
+--   * status is OUT_OF_WAREHOUSE after an OUT, IN_STOCK after IN / MOVE
+--   * an OUT clears the location; an event with a location sets it; an
+--     event without one keeps the previous location
+-- Boxes left without events lose their inventory_state row, like a box
+-- that was never scanned.
+
+CREATE OR REPLACE FUNCTION rebuild_inventory_state(p_box_ids VARCHAR[] DEFAULT NULL)
+RETURNS JSONB AS $$
+DECLARE
+    v_updated INTEGER;
+    v_removed INTEGER;
+BEGIN
+    -- Serialize with scans of the same boxes, in a stable order to avoid deadlocks
+    PERFORM 1
+    FROM boxes
+    WHERE p_box_ids IS NULL OR box_id = ANY(p_box_ids)
+    ORDER BY box_id
+    FOR UPDATE;
+
+    WITH live AS (
+        SELECT box_id, event_id, event_type, location_id, timestamp
+        FROM events
+        WHERE reversed = FALSE
+          AND (p_box_ids IS NULL OR box_id = ANY(p_box_ids))
+    ),
+    last_event AS (
+        SELECT DISTINCT ON (box_id) box_id, event_type, timestamp
+        FROM live
+        ORDER BY box_id, timestamp DESC, event_id DESC
+    ),
+    -- The latest event that set or cleared the location decides it
+    last_location AS (
+        SELECT DISTINCT ON (box_id)
+            box_id,
+            CASE WHEN event_type = 'OUT' THEN NULL ELSE location_id END AS location_id
+        FROM live
+        WHERE event_type = 'OUT' OR location_id IS NOT NULL
+        ORDER BY box_id, timestamp DESC, event_id DESC
+    )
+    INSERT INTO inventory_state (box_id, status, current_location_id, last_event_time, last_event_type)
+    SELECT
+        l.box_id,
+        CASE WHEN l.event_type = 'OUT' THEN 'OUT_OF_WAREHOUSE' ELSE 'IN_STOCK' END,
+        loc.location_id,
+        l.timestamp,
+        l.event_type
+    FROM last_event l
+    LEFT JOIN last_location loc ON loc.box_id = l.box_id
+    ON CONFLICT (box_id) DO UPDATE
+    SET status = EXCLUDED.status,
+        current_location_id = EXCLUDED.current_location_id,
+        last_event_time = EXCLUDED.last_event_time,
+        last_event_type = EXCLUDED.last_event_type
+    WHERE (inventory_state.status, inventory_state.current_location_id, inventory_state.last_event_time, inventory_state.last_event_type)
+        IS DISTINCT FROM
+        (EXCLUDED.status, EXCLUDED.current_location_id, EXCLUDED.last_event_time, EXCLUDED.last_event_type);
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+
+    DELETE FROM inventory_state i
+    WHERE (p_box_ids IS NULL OR i.box_id = ANY(p_box_ids))
+      AND NOT EXISTS (
+          SELECT 1 FROM events e WHERE e.box_id = i.box_id AND e.reversed = FALSE
+      );
+    GET DIAGNOSTICS v_removed = ROW_COUNT;
+
+    RETURN jsonb_build_object('updated', v_updated, 'removed', v_removed);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Undo in one round trip: reverse the event, re-project its box and
+-- return what the API needs for the response.
+CREATE OR REPLACE FUNCTION undo_event(p_event_id UUID)
+RETURNS JSONB AS $$
+DECLARE
+    v_event events%ROWTYPE;
+    v_result JSONB;
+BEGIN
+    SELECT * INTO v_event FROM events WHERE event_id = p_event_id;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('success', FALSE, 'status_code', 404, 'error', 'Event not found');
+    END IF;
+
+    -- Lock the box first (same order as record_scan), then re-check
+    PERFORM 1 FROM boxes WHERE box_id = v_event.box_id FOR UPDATE;
+    SELECT * INTO v_event FROM events WHERE event_id = p_event_id FOR UPDATE;
+
+    IF v_event.reversed THEN
+        RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'Event already reversed');
+    END IF;
+
+    UPDATE events SET reversed = TRUE WHERE event_id = p_event_id;
+
+    PERFORM rebuild_inventory_state(ARRAY[v_event.box_id]);
+
+    SELECT jsonb_build_object(
+        'success', TRUE,
+        'message', 'Event undone successfully',
+        'box_id', b.box_id,
+        'product', jsonb_build_object('brand', p.brand, 'name', p.name, 'size', p.size),
+        'lot_code', b.lot_code,
+        'status', COALESCE(i.status, 'OUT_OF_WAREHOUSE'),
+        'current_location', to_jsonb(l)
+    )
+    INTO v_result
+    FROM boxes b
+    JOIN products p ON p.product_id = b.product_id
+    LEFT JOIN inventory_state i ON i.box_id = b.box_id
+    LEFT JOIN locations l ON l.location_id = i.current_location_id
+    WHERE b.box_id = v_event.box_id;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
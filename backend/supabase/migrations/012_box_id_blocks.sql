@@ -0,0 +1,24 @@
+-- Block reservation for box IDs
+-- reserve_box_id_block atomically advances a day's counter by p_block_size
+-- and returns the last sequence number of the reserved block; the API hands
+-- out [last - p_block_size + 1, last] locally without further round trips.
+
+CREATE OR REPLACE FUNCTION reserve_box_id_block(target_date DATE, p_block_size INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    last_seq_reserved INTEGER;
+BEGIN
+    IF p_block_size IS NULL OR p_block_size < 1 THEN
+        RAISE EXCEPTION 'p_block_size must be at least 1';
+    END IF;
+
+    INSERT INTO box_id_counters (date, last_seq, updated_at)
+    VALUES (target_date, p_block_size, NOW())
+    ON CONFLICT (date) DO UPDATE
+    SET last_seq = box_id_counters.last_seq + p_block_size,
+        updated_at = NOW()
+    RETURNING last_seq INTO last_seq_reserved;
+
+    RETURN last_seq_reserved;
+END;
+$$ LANGUAGE plpgsql;
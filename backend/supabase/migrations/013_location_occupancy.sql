@@ -0,0 +1,56 @@
+-- Occupancy for every location in one grouped query (floor map / heatmap)
+-- location_occupancy returns, per location, the number of boxes in stock
+-- there, how many distinct products they hold and when the longest-standing
+-- box arrived. Empty locations are included unless p_include_empty is FALSE.
+
+CREATE OR REPLACE FUNCTION location_occupancy(
+    p_zone VARCHAR DEFAULT NULL,
+    p_aisle VARCHAR DEFAULT NULL,
+    p_include_empty BOOLEAN DEFAULT TRUE
+)
+RETURNS TABLE (
+    location_id UUID,
+    location_code VARCHAR,
+    zone VARCHAR,
+    aisle VARCHAR,
+    rack VARCHAR,
+    shelf VARCHAR,
+    is_system_location BOOLEAN,
+    box_count BIGINT,
+    product_count BIGINT,
+    oldest_arrival TIMESTAMP
+) AS $$
+    WITH occupancy AS (
+        SELECT
+            i.current_location_id,
+            COUNT(*) AS box_count,
+            COUNT(DISTINCT b.product_id) AS product_count,
+            MIN(i.last_event_time) AS oldest_arrival
+        FROM inventory_state i
+        JOIN boxes b ON b.box_id = i.box_id
+        WHERE i.status = 'IN_STOCK'
+          AND i.current_location_id IS NOT NULL
+        GROUP BY i.current_location_id
+    )
+    SELECT
+        l.location_id,
+        l.location_code,
+        l.zone,
+        l.aisle,
+        l.rack,
+        l.shelf,
+        l.is_system_location,
+        COALESCE(o.box_count, 0),
+        COALESCE(o.product_count, 0),
+        o.oldest_arrival
+    FROM locations l
+    LEFT JOIN occupancy o ON o.current_location_id = l.location_id
+    WHERE (p_zone IS NULL OR l.zone = p_zone)
+      AND (p_aisle IS NULL OR l.aisle = p_aisle)
+      AND (p_include_empty OR o.box_count IS NOT NULL)
+    ORDER BY l.zone, l.aisle, l.rack, l.shelf, l.location_code;
+$$ LANGUAGE sql STABLE;
+
+CREATE INDEX IF NOT EXISTS idx_inventory_state_in_stock_location
+ON inventory_state(current_location_id) INCLUDE (last_event_time)
+WHERE status = 'IN_STOCK';
@@ -0,0 +1,123 @@
+-- Per-product stock projection
+-- product_stock counts IN_STOCK boxes per (product, lot, location). It is
+-- kept up to date incrementally by statement-level triggers on
+-- inventory_state, so every path that changes a box's state (record_scan,
+-- record_scans, undo, rebuild_inventory_state) is covered. A missing lot is
+-- stored as '' and a missing location as the nil UUID so both can be part
+-- of the primary key.
+
+CREATE TABLE IF NOT EXISTS product_stock (
+    product_id UUID NOT NULL REFERENCES products(product_id),
+    lot_code VARCHAR NOT NULL DEFAULT '',
+    location_id UUID NOT NULL DEFAULT '00000000-0000-0000-0000-000000000000',
+    box_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_id, lot_code, location_id)
+);
+
+-- Apply signed box count deltas: [{product_id, lot_code, location_id, boxes}, ...]
+CREATE OR REPLACE FUNCTION apply_product_stock_delta(p_delta JSONB)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO product_stock AS s (product_id, lot_code, location_id, box_count)
+    SELECT product_id, lot_code, location_id, SUM(boxes)
+    FROM jsonb_to_recordset(p_delta)
+        AS d(product_id UUID, lot_code VARCHAR, location_id UUID, boxes INTEGER)
+    GROUP BY product_id, lot_code, location_id
+    HAVING SUM(boxes) <> 0
+    ON CONFLICT (product_id, lot_code, location_id) DO UPDATE
+    SET box_count = s.box_count + EXCLUDED.box_count;
+
+    -- Drop emptied rows so reads only ever see locations holding stock
+    DELETE FROM product_stock s
+    USING jsonb_to_recordset(p_delta)
+        AS d(product_id UUID, lot_code VARCHAR, location_id UUID, boxes INTEGER)
+    WHERE s.box_count = 0
+      AND s.product_id = d.product_id
+      AND s.lot_code = d.lot_code
+      AND s.location_id = d.location_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Signed contributions of a set of inventory_state rows (+1 or -1 per IN_STOCK box)
+CREATE OR REPLACE FUNCTION product_stock_rows(p_rows JSONB, p_sign INTEGER)
+RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'product_id', b.product_id,
+        'lot_code', COALESCE(b.lot_code, ''),
+        'location_id', COALESCE(r.current_location_id, '00000000-0000-0000-0000-000000000000'::UUID),
+        'boxes', p_sign
+    )), '[]'::JSONB)
+    FROM jsonb_to_recordset(p_rows) AS r(box_id VARCHAR, status VARCHAR, current_location_id UUID)
+    JOIN boxes b ON b.box_id = r.box_id
+    WHERE r.status = 'IN_STOCK';
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION product_stock_on_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM apply_product_stock_delta(
+        product_stock_rows((SELECT jsonb_agg(to_jsonb(n)) FROM new_state n), 1)
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_stock_on_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM apply_product_stock_delta(
+        product_stock_rows((SELECT jsonb_agg(to_jsonb(o)) FROM old_state o), -1)
+        || product_stock_rows((SELECT jsonb_agg(to_jsonb(n)) FROM new_state n), 1)
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_stock_on_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM apply_product_stock_delta(
+        product_stock_rows((SELECT jsonb_agg(to_jsonb(o)) FROM old_state o), -1)
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_product_stock_insert ON inventory_state;
+CREATE TRIGGER trg_product_stock_insert
+AFTER INSERT ON inventory_state
+REFERENCING NEW TABLE AS new_state
+FOR EACH STATEMENT EXECUTE FUNCTION product_stock_on_insert();
+
+DROP TRIGGER IF EXISTS trg_product_stock_update ON inventory_state;
+CREATE TRIGGER trg_product_stock_update
+AFTER UPDATE ON inventory_state
+REFERENCING OLD TABLE AS old_state NEW TABLE AS new_state
+FOR EACH STATEMENT EXECUTE FUNCTION product_stock_on_update();
+
+DROP TRIGGER IF EXISTS trg_product_stock_delete ON inventory_state;
+CREATE TRIGGER trg_product_stock_delete
+AFTER DELETE ON inventory_state
+REFERENCING OLD TABLE AS old_state
+FOR EACH STATEMENT EXECUTE FUNCTION product_stock_on_delete();
+
+-- Recompute the projection from inventory_state (backfill / repair)
+CREATE OR REPLACE FUNCTION rebuild_product_stock()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE product_stock IN EXCLUSIVE MODE;
+    DELETE FROM product_stock;
+    INSERT INTO product_stock (product_id, lot_code, location_id, box_count)
+    SELECT
+        b.product_id,
+        COALESCE(b.lot_code, ''),
+        COALESCE(i.current_location_id, '00000000-0000-0000-0000-000000000000'::UUID),
+        COUNT(*)
+    FROM inventory_state i
+    JOIN boxes b ON b.box_id = i.box_id
+    WHERE i.status = 'IN_STOCK'
+    GROUP BY 1, 2, 3;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_product_stock();
@@ -0,0 +1,269 @@
+-- Indexed search over products, boxes and lots
+-- Products are matched word-by-word on a tsvector of brand, name and size
+-- (every typed word is a prefix: "coca 33" finds "Coca-Cola 330ml"). Box IDs
+-- are matched by prefix or suffix ("BX-2026..." or the trailing sequence
+-- number "000142") and lot codes by case-insensitive prefix, each through a
+-- btree pattern index. Nothing here needs an extension.
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+GENERATED ALWAYS AS (
+    to_tsvector('simple', brand || ' ' || name || ' ' || COALESCE(size, ''))
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_boxes_box_id_prefix ON boxes (box_id text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_boxes_box_id_suffix ON boxes (reverse(box_id) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_boxes_lot_code_prefix ON boxes (lower(lot_code) text_pattern_ops, product_id);
+
+-- Upper bound for prefix ranges: x ~>=~ p AND x ~<~ search_prefix_end(p)
+-- is "x starts with p" in a form the text_pattern_ops indexes can use even
+-- when p is a function argument rather than a literal
+CREATE OR REPLACE FUNCTION search_prefix_end(p_prefix TEXT)
+RETURNS TEXT AS $$
+    SELECT p_prefix || chr(1114111);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- "Coca-Co 33" -> 'coca':* & 'co':* & '33':* (NULL when there are no words)
+CREATE OR REPLACE FUNCTION search_tsquery(p_query TEXT)
+RETURNS TSQUERY AS $$
+    SELECT to_tsquery('simple', string_agg(quote_literal(term) || ':*', ' & '))
+    FROM regexp_split_to_table(lower(p_query), '[^[:alnum:]]+') AS term
+    WHERE term <> '';
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Box IDs as typed or scanned: trimmed, upper case, without the QR prefix
+CREATE OR REPLACE FUNCTION search_box_id(p_query TEXT)
+RETURNS TEXT AS $$
+    SELECT regexp_replace(upper(trim(p_query)), '^BOX:', '');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION search_products(p_query TEXT, p_limit INTEGER DEFAULT 10)
+RETURNS TABLE (
+    product_id UUID,
+    brand VARCHAR,
+    name VARCHAR,
+    size VARCHAR,
+    created_at TIMESTAMP,
+    rank REAL
+) AS $$
+    WITH params AS (
+        SELECT search_tsquery(p_query) AS tsq, lower(trim(p_query)) AS prefix
+    )
+    SELECT
+        p.product_id,
+        p.brand,
+        p.name,
+        p.size,
+        p.created_at,
+        -- Whole-string prefix matches on brand or "brand name" first
+        (ts_rank(p.search_vector, params.tsq)
+            + CASE
+                WHEN starts_with(lower(p.brand || ' ' || p.name), params.prefix) THEN 2
+                WHEN starts_with(lower(p.name), params.prefix) THEN 1
+                ELSE 0
+            END)::REAL AS rank
+    FROM products p, params
+    WHERE p.search_vector @@ params.tsq
+    ORDER BY rank DESC, p.brand, p.name
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION search_boxes(p_query TEXT, p_limit INTEGER DEFAULT 10)
+RETURNS TABLE (
+    box_id VARCHAR,
+    product_id UUID,
+    brand VARCHAR,
+    name VARCHAR,
+    lot_code VARCHAR,
+    status VARCHAR,
+    location_code VARCHAR,
+    rank INTEGER
+) AS $$
+    WITH matches AS (
+        (
+            SELECT b.box_id, CASE WHEN b.box_id = search_box_id(p_query) THEN 3 ELSE 2 END AS rank
+            FROM boxes b
+            WHERE b.box_id ~>=~ search_box_id(p_query)
+              AND b.box_id ~<~ search_prefix_end(search_box_id(p_query))
+            -- Newest first, read backwards from idx_boxes_box_id_prefix
+            ORDER BY b.box_id USING ~>~
+            LIMIT p_limit
+        )
+        UNION ALL
+        (
+            SELECT b.box_id, 1
+            FROM boxes b
+            WHERE reverse(b.box_id) ~>=~ reverse(search_box_id(p_query))
+              AND reverse(b.box_id) ~<~ search_prefix_end(reverse(search_box_id(p_query)))
+              AND NOT starts_with(b.box_id, search_box_id(p_query))
+            ORDER BY reverse(b.box_id)
+            LIMIT p_limit
+        )
+    ),
+    ranked AS (
+        SELECT box_id, rank
+        FROM matches
+        ORDER BY rank DESC, box_id DESC
+        LIMIT p_limit
+    )
+    SELECT
+        r.box_id,
+        b.product_id,
+        p.brand,
+        p.name,
+        b.lot_code,
+        i.status,
+        l.location_code,
+        r.rank
+    FROM ranked r
+    JOIN boxes b ON b.box_id = r.box_id
+    JOIN products p ON p.product_id = b.product_id
+    LEFT JOIN inventory_state i ON i.box_id = r.box_id
+    LEFT JOIN locations l ON l.location_id = i.current_location_id
+    ORDER BY r.rank DESC, r.box_id DESC;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION search_lots(p_query TEXT, p_limit INTEGER DEFAULT 10)
+RETURNS TABLE (
+    lot_code VARCHAR,
+    product_id UUID,
+    brand VARCHAR,
+    name VARCHAR,
+    in_stock BIGINT
+) AS $$
+    WITH lots AS (
+        SELECT DISTINCT lower(b.lot_code) AS lot_key, b.product_id
+        FROM boxes b
+        WHERE lower(b.lot_code) ~>=~ lower(trim(p_query))
+          AND lower(b.lot_code) ~<~ search_prefix_end(lower(trim(p_query)))
+        ORDER BY 1, 2
+        LIMIT p_limit
+    )
+    SELECT
+        (SELECT b.lot_code FROM boxes b WHERE lower(b.lot_code) = lots.lot_key AND b.product_id = lots.product_id LIMIT 1),
+        lots.product_id,
+        p.brand,
+        p.name,
+        COALESCE((
+            SELECT SUM(s.box_count)
+            FROM product_stock s
+            WHERE s.product_id = lots.product_id AND lower(s.lot_code) = lots.lot_key
+        ), 0)
+    FROM lots
+    JOIN products p ON p.product_id = lots.product_id
+    ORDER BY lots.lot_key, p.brand, p.name;
+$$ LANGUAGE sql STABLE;
+
+-- Typeahead: the best products, boxes and lots for a query in one call
+CREATE OR REPLACE FUNCTION search_catalog(p_query TEXT, p_limit INTEGER DEFAULT 10)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'products', COALESCE((SELECT jsonb_agg(to_jsonb(s)) FROM search_products(p_query, p_limit) s), '[]'::JSONB),
+        'boxes', COALESCE((SELECT jsonb_agg(to_jsonb(s)) FROM search_boxes(p_query, p_limit) s), '[]'::JSONB),
+        'lots', COALESCE((SELECT jsonb_agg(to_jsonb(s)) FROM search_lots(p_query, p_limit) s), '[]'::JSONB)
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Box IDs matching a search by box ID prefix/suffix, lot prefix or product words
+CREATE OR REPLACE FUNCTION search_box_matches(p_query TEXT)
+RETURNS TABLE (box_id VARCHAR) AS $$
+    SELECT b.box_id
+    FROM boxes b
+    WHERE b.box_id ~>=~ search_box_id(p_query)
+      AND b.box_id ~<~ search_prefix_end(search_box_id(p_query))
+    UNION
+    SELECT b.box_id
+    FROM boxes b
+    WHERE reverse(b.box_id) ~>=~ reverse(search_box_id(p_query))
+      AND reverse(b.box_id) ~<~ search_prefix_end(reverse(search_box_id(p_query)))
+    UNION
+    SELECT b.box_id
+    FROM boxes b
+    WHERE lower(b.lot_code) ~>=~ lower(trim(p_query))
+      AND lower(b.lot_code) ~<~ search_prefix_end(lower(trim(p_query)))
+    UNION
+    SELECT b.box_id
+    FROM products p
+    JOIN boxes b ON b.product_id = p.product_id
+    WHERE p.search_vector @@ search_tsquery(p_query);
+$$ LANGUAGE sql STABLE;
+
+-- GET /inventory?search= uses the same indexed matching. A search matching
+-- few boxes (a box ID, a lot) is driven from the match set; one matching
+-- many ("coca") is checked row by row while walking the newest-first index,
+-- which finds a page long before the match set could be built. The query
+-- is run through EXECUTE so each call is planned for its actual filters.
+CREATE OR REPLACE FUNCTION search_inventory(
+    p_status VARCHAR DEFAULT NULL,
+    p_location_id UUID DEFAULT NULL,
+    p_search TEXT DEFAULT NULL,
+    p_event_type VARCHAR DEFAULT NULL,
+    p_event_from TIMESTAMP DEFAULT NULL,
+    p_event_to TIMESTAMP DEFAULT NULL,
+    p_date_from TIMESTAMP DEFAULT NULL,
+    p_date_to TIMESTAMP DEFAULT NULL,
+    p_after_time TIMESTAMP DEFAULT NULL,
+    p_after_box_id VARCHAR DEFAULT NULL,
+    p_limit INTEGER DEFAULT NULL
+)
+RETURNS SETOF inventory_view AS $$
+DECLARE
+    v_search_filter TEXT := '';
+    v_matches INTEGER;
+BEGIN
+    IF p_search IS NOT NULL THEN
+        SELECT COUNT(*) INTO v_matches
+        FROM (SELECT 1 FROM search_box_matches(p_search) LIMIT 1000) m;
+
+        IF v_matches < 1000 THEN
+            v_search_filter := 'AND v.box_id IN (SELECT box_id FROM search_box_matches($3))';
+        ELSE
+            v_search_filter := $filter$AND (
+                starts_with(v.box_id, search_box_id($3))
+                OR starts_with(reverse(v.box_id), reverse(search_box_id($3)))
+                OR starts_with(lower(v.lot_code), lower(trim($3)))
+                OR v.product_id IN (SELECT product_id FROM products WHERE search_vector @@ search_tsquery($3))
+            )$filter$;
+        END IF;
+    END IF;
+
+    -- $1..$11 are the arguments in declaration order (see USING)
+    RETURN QUERY EXECUTE format($query$
+    SELECT v.*
+    FROM inventory_view v
+    WHERE ($1 IS NULL OR v.status = $1)
+      AND ($2 IS NULL OR v.current_location_id = $2)
+      AND ($7 IS NULL OR v.last_event_time >= $7)
+      AND ($8 IS NULL OR v.last_event_time < $8)
+      %s
+      AND (
+          $4 IS NULL
+          OR EXISTS (
+              SELECT 1
+              FROM events e
+              WHERE e.box_id = v.box_id
+                AND e.event_type = $4
+                AND e.reversed = FALSE
+                AND e.timestamp >= $5
+                AND e.timestamp < $6
+          )
+      )
+      -- Rows after the cursor in (last_event_time DESC NULLS LAST, box_id DESC) order
+      AND (
+          $10 IS NULL
+          OR (
+              $9 IS NOT NULL
+              AND (
+                  (v.last_event_time, v.box_id) < ($9, $10)
+                  OR v.last_event_time IS NULL
+              )
+          )
+          OR ($9 IS NULL AND v.last_event_time IS NULL AND v.box_id < $10)
+      )
+    ORDER BY v.last_event_time DESC NULLS LAST, v.box_id DESC
+    LIMIT $11
+    $query$, v_search_filter)
+    USING p_status, p_location_id, p_search, p_event_type, p_event_from, p_event_to,
+        p_date_from, p_date_to, p_after_time, p_after_box_id, p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
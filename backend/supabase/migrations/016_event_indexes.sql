@@ -0,0 +1,61 @@
+-- Indexes for the hot event queries
+-- Replaces the single-column events indexes from 001/003 with composite and
+-- partial ones shaped like the queries the API actually runs. Checked by
+-- benchmarks/query_plans.py.
+
+-- client_event_id is the idempotency key. 001 declares it UNIQUE (its
+-- constraint index serves every lookup), so the extra plain index is only
+-- write overhead. The constraint is added here for databases created
+-- without it.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'events'::regclass
+          AND i.indisunique
+          AND i.indnatts = 1
+          AND a.attname = 'client_event_id'
+    ) THEN
+        ALTER TABLE events ADD CONSTRAINT events_client_event_id_key UNIQUE (client_event_id);
+    END IF;
+END;
+$$;
+DROP INDEX IF EXISTS idx_events_client_event_id;
+
+-- GET /events and the dashboard's recent events:
+-- reversed = FALSE ORDER BY timestamp DESC, event_id DESC LIMIT n
+CREATE INDEX IF NOT EXISTS idx_events_live_feed
+ON events(timestamp, event_id)
+WHERE reversed = FALSE;
+
+-- GET /exceptions, newest first, and the exception summary's date range.
+-- Only OUT_WITHOUT_IN is stored today, so an exception_type filter is
+-- applied while walking this index rather than given its own.
+CREATE INDEX IF NOT EXISTS idx_events_exceptions_feed
+ON events(timestamp, event_id)
+WHERE exception_type IS NOT NULL;
+
+-- "Boxes with an IN/MOVE/OUT today" (GET /inventory?event_type_today=):
+-- event_type = ? AND reversed = FALSE AND timestamp in [from, to)
+CREATE INDEX IF NOT EXISTS idx_events_type_time
+ON events(event_type, timestamp)
+INCLUDE (box_id)
+WHERE reversed = FALSE;
+
+-- Per-box lookups by type: the put-away preview's IN times, record_scan's
+-- "was this box ever received" check and the inventory event_type filter
+CREATE INDEX IF NOT EXISTS idx_events_box_type
+ON events(box_id, event_type, timestamp)
+INCLUDE (reversed);
+
+-- Superseded: box_id is the leading column of idx_events_box_timeline (009)
+-- and idx_events_box_type; every timestamp-ordered read filters on reversed
+-- or exception_type, which are now partial index predicates
+DROP INDEX IF EXISTS idx_events_box_id;
+DROP INDEX IF EXISTS idx_events_timestamp;
+DROP INDEX IF EXISTS idx_events_reversed;
+DROP INDEX IF EXISTS idx_events_exception_type;
+
+ANALYZE events;
@@ -0,0 +1,851 @@
+-- Monthly range partitioning of events, with archival of cold months
+-- events becomes a table partitioned by RANGE (timestamp): one partition per
+-- calendar month (events_YYYY_MM), a default partition for anything outside
+-- them, and events_history. events_history is the pre-partitioning table
+-- itself, attached as the partition for everything up to the end of the
+-- month this migration ran, so the migration does not copy the log.
+-- split_events_history() is the backfill: it moves the oldest month out
+-- of events_history into its own partition, one month per call, and drops
+-- events_history once it is empty (scripts/events_archive.py backfill).
+-- ensure_event_partitions() creates the coming months ahead of time, and
+-- archive_event_partition() drops a cold month once scripts/events_archive.py
+-- has exported it to a compressed file (listed in event_archives, served by
+-- GET /events/export).
+--
+-- A partitioned table can only enforce uniqueness on keys that include the
+-- partition column, so the primary key becomes (event_id, timestamp) and
+-- client_event_id uniqueness moves to event_keys, filled by a trigger.
+-- Keys outlive archived partitions: record_scan and record_scans look them
+-- up there, so a retry of a scan that has since been archived is answered
+-- as a duplicate rather than recorded twice.
+--
+-- Archived events no longer count for rules that look back at history (an
+-- OUT of a box received before the archive horizon is flagged OUT_WITHOUT_IN),
+-- and undoing the only later event of such a box clears its inventory state
+-- instead of restoring it from the archive.
+
+-- Idempotency keys of every event ever recorded
+CREATE TABLE IF NOT EXISTS event_keys (
+    client_event_id UUID PRIMARY KEY,
+    event_id UUID NOT NULL
+);
+
+-- Months exported to files and dropped from the database
+CREATE TABLE IF NOT EXISTS event_archives (
+    range_start TIMESTAMP PRIMARY KEY,
+    range_end TIMESTAMP NOT NULL,
+    file_name VARCHAR NOT NULL,
+    format VARCHAR NOT NULL CHECK (format IN ('csv.gz', 'parquet')),
+    row_count BIGINT NOT NULL,
+    sha256 VARCHAR NOT NULL,
+    archived_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Convert the plain table (skipped when events is already partitioned)
+DO $$
+DECLARE
+    v_index RECORD;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'events'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    -- The partition key cannot be NULL (record_scan always sets it)
+    ALTER TABLE events ALTER COLUMN timestamp SET NOT NULL;
+
+    INSERT INTO event_keys (client_event_id, event_id)
+    SELECT client_event_id, event_id FROM events
+    ON CONFLICT (client_event_id) DO NOTHING;
+
+    ALTER TABLE events RENAME TO events_history;
+    DROP TRIGGER IF EXISTS trg_daily_stats_insert ON events_history;
+    DROP TRIGGER IF EXISTS trg_daily_stats_reverse ON events_history;
+    ALTER TABLE events_history DROP CONSTRAINT IF EXISTS events_pkey;
+    ALTER TABLE events_history DROP CONSTRAINT IF EXISTS events_client_event_id_key;
+    -- Foreign keys are declared on the parent and cloned into every partition
+    ALTER TABLE events_history DROP CONSTRAINT IF EXISTS events_box_id_fkey;
+    ALTER TABLE events_history DROP CONSTRAINT IF EXISTS events_location_id_fkey;
+    -- Replaced by idx_events_time below
+    DROP INDEX IF EXISTS idx_events_live_feed;
+
+    -- Index names are per schema: free them for the parent's indexes, which
+    -- adopt these (same definition) instead of rebuilding them
+    FOR v_index IN
+        SELECT indexname FROM pg_indexes
+        WHERE tablename = 'events_history' AND indexname LIKE 'idx_events_%'
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I',
+            v_index.indexname, replace(v_index.indexname, 'idx_events_', 'events_history_'));
+    END LOOP;
+
+    CREATE TABLE events (LIKE events_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    PARTITION BY RANGE (timestamp);
+
+    ALTER TABLE events ADD PRIMARY KEY (event_id, timestamp);
+    ALTER TABLE events ADD CONSTRAINT events_box_id_fkey
+        FOREIGN KEY (box_id) REFERENCES boxes(box_id) ON DELETE RESTRICT;
+    ALTER TABLE events ADD CONSTRAINT events_location_id_fkey
+        FOREIGN KEY (location_id) REFERENCES locations(location_id) ON DELETE SET NULL;
+
+    -- The indexes of 009 and 016. The live feed (reversed = FALSE, newest
+    -- first) walks idx_events_time instead of its own partial index:
+    -- reversed events are rare, and GET /events/export needs every event
+    -- of a time range in order.
+    CREATE INDEX idx_events_time ON events(timestamp, event_id);
+    CREATE INDEX idx_events_box_timeline ON events(box_id, timestamp, event_id);
+    CREATE INDEX idx_events_exceptions_feed ON events(timestamp, event_id) WHERE exception_type IS NOT NULL;
+    CREATE INDEX idx_events_type_time ON events(event_type, timestamp) INCLUDE (box_id) WHERE reversed = FALSE;
+    CREATE INDEX idx_events_box_type ON events(box_id, event_type, timestamp) INCLUDE (reversed);
+    -- record_scan's idempotency lookup (one probe per partition)
+    CREATE INDEX idx_events_client_event_id ON events(client_event_id);
+
+    -- Up to the end of the month of the newest row (this month at least)
+    EXECUTE format(
+        'ALTER TABLE events ATTACH PARTITION events_history FOR VALUES FROM (MINVALUE) TO (%L)',
+        (SELECT date_trunc('month', GREATEST(MAX(timestamp), NOW())) + INTERVAL '1 month' FROM events_history)::TIMESTAMP
+    );
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION event_keys_on_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- A reused client_event_id fails the statement with a unique violation,
+    -- as the UNIQUE constraint on events did
+    INSERT INTO event_keys (client_event_id, event_id)
+    SELECT client_event_id, event_id FROM new_events;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_event_keys_insert ON events;
+CREATE TRIGGER trg_event_keys_insert
+AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT EXECUTE FUNCTION event_keys_on_insert();
+
+-- The daily_stats triggers of 010, now on the partitioned table. Rows moved
+-- between partitions by the functions below are written to the partitions
+-- directly, which fires none of these.
+DROP TRIGGER IF EXISTS trg_daily_stats_insert ON events;
+CREATE TRIGGER trg_daily_stats_insert
+AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT EXECUTE FUNCTION daily_stats_on_insert();
+
+DROP TRIGGER IF EXISTS trg_daily_stats_reverse ON events;
+CREATE TRIGGER trg_daily_stats_reverse
+AFTER UPDATE ON events
+REFERENCING OLD TABLE AS old_events NEW TABLE AS new_events
+FOR EACH STATEMENT EXECUTE FUNCTION daily_stats_on_reverse();
+
+-- Partitions of events with their bounds (NULL for MINVALUE and the default)
+CREATE OR REPLACE FUNCTION event_partitions()
+RETURNS TABLE (
+    partition_name TEXT,
+    range_start TIMESTAMP,
+    range_end TIMESTAMP,
+    is_default BOOLEAN,
+    estimated_rows BIGINT
+) AS $$
+    SELECT
+        c.relname::TEXT,
+        (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \(''([^'']+)''\)'))[1]::TIMESTAMP,
+        (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \(''([^'']+)''\)'))[1]::TIMESTAMP,
+        pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT',
+        GREATEST(c.reltuples, 0)::BIGINT
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'events'::regclass
+    ORDER BY 4, 3 NULLS FIRST;
+$$ LANGUAGE sql STABLE;
+
+-- events_2026_10 for October 2026
+CREATE OR REPLACE FUNCTION event_partition_name(p_month TIMESTAMP)
+RETURNS TEXT AS $$
+    SELECT 'events_' || to_char(p_month, 'YYYY_MM');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Everything before this was archived (NULL while nothing is)
+CREATE OR REPLACE FUNCTION events_archived_before()
+RETURNS TIMESTAMP AS $$
+    SELECT MAX(range_end) FROM event_archives;
+$$ LANGUAGE sql STABLE;
+
+-- Create the monthly partitions from the current month through
+-- p_months_ahead months ahead, plus any month whose rows landed in the
+-- default partition (moved into the new partition). Returns the partitions
+-- created.
+CREATE OR REPLACE FUNCTION ensure_event_partitions(p_months_ahead INTEGER DEFAULT 3)
+RETURNS TEXT[] AS $$
+DECLARE
+    v_month TIMESTAMP;
+    v_last TIMESTAMP := date_trunc('month', NOW())::TIMESTAMP + make_interval(months => p_months_ahead);
+    v_name TEXT;
+    v_created TEXT[] := '{}';
+BEGIN
+    CREATE TABLE IF NOT EXISTS events_default PARTITION OF events DEFAULT;
+
+    SELECT LEAST(date_trunc('month', MIN(timestamp)), date_trunc('month', NOW()))::TIMESTAMP
+    INTO v_month
+    FROM events_default;
+
+    WHILE v_month <= v_last LOOP
+        v_name := event_partition_name(v_month);
+        IF NOT EXISTS (
+            SELECT 1 FROM event_partitions() p
+            WHERE NOT p.is_default
+              AND COALESCE(p.range_start, '-infinity') < v_month + INTERVAL '1 month'
+              AND p.range_end > v_month
+        ) THEN
+            EXECUTE format('CREATE TABLE %I (LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM events_default WHERE timestamp >= $1 AND timestamp < $2 RETURNING *)
+                 INSERT INTO %I SELECT * FROM moved ORDER BY timestamp, event_id',
+                v_name
+            ) USING v_month, v_month + INTERVAL '1 month';
+            EXECUTE format('ALTER TABLE events ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_month, v_month + INTERVAL '1 month');
+            v_created := v_created || v_name;
+        END IF;
+        v_month := v_month + INTERVAL '1 month';
+    END LOOP;
+
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill step: move the oldest month of events_history into its own
+-- partition. Returns that month, or NULL once events_history is gone.
+-- Holds an exclusive lock on events while it runs (one month's rows).
+CREATE OR REPLACE FUNCTION split_events_history()
+RETURNS TIMESTAMP AS $$
+DECLARE
+    v_end TIMESTAMP;
+    v_month TIMESTAMP;
+    v_next TIMESTAMP;
+    v_name TEXT;
+BEGIN
+    SELECT range_end INTO v_end FROM event_partitions() WHERE partition_name = 'events_history';
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT date_trunc('month', MIN(timestamp))::TIMESTAMP INTO v_month FROM events_history;
+    ALTER TABLE events DETACH PARTITION events_history;
+    IF v_month IS NULL THEN
+        DROP TABLE events_history;
+        RETURN NULL;
+    END IF;
+
+    v_next := v_month + INTERVAL '1 month';
+    v_name := event_partition_name(v_month);
+    EXECUTE format('CREATE TABLE %I (LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM events_history WHERE timestamp < $1 RETURNING *)
+         INSERT INTO %I SELECT * FROM moved ORDER BY timestamp, event_id',
+        v_name
+    ) USING v_next;
+    EXECUTE format('ALTER TABLE events ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        v_name, v_month, v_next);
+
+    IF v_next < v_end THEN
+        EXECUTE format('ALTER TABLE events ATTACH PARTITION events_history FOR VALUES FROM (%L) TO (%L)',
+            v_next, v_end);
+    ELSE
+        DROP TABLE events_history;
+    END IF;
+
+    RETURN v_month;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop a cold monthly partition once its rows are safely in an archive file.
+-- Only the oldest partition of a finished month can go, and only if it still
+-- holds exactly p_row_count rows (what was written to the file).
+CREATE OR REPLACE FUNCTION archive_event_partition(
+    p_partition_name TEXT,
+    p_file_name TEXT,
+    p_format TEXT,
+    p_row_count BIGINT,
+    p_sha256 TEXT
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_partition RECORD;
+    v_rows BIGINT;
+BEGIN
+    SELECT * INTO v_partition FROM event_partitions() WHERE partition_name = p_partition_name;
+    IF NOT FOUND OR v_partition.is_default OR v_partition.range_start IS NULL THEN
+        RAISE EXCEPTION 'Not a monthly events partition: %', p_partition_name;
+    END IF;
+    IF v_partition.range_end > date_trunc('month', NOW()) THEN
+        RAISE EXCEPTION 'Partition % is not finished yet', p_partition_name;
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM event_partitions() p
+        WHERE NOT p.is_default
+          AND COALESCE(p.range_start, '-infinity') < v_partition.range_start
+    ) THEN
+        RAISE EXCEPTION 'Older partitions must be archived first (run the backfill if events_history exists)';
+    END IF;
+
+    EXECUTE format('SELECT COUNT(*) FROM %I', p_partition_name) INTO v_rows;
+    IF v_rows <> p_row_count THEN
+        RAISE EXCEPTION 'Partition % has % rows, archive has %', p_partition_name, v_rows, p_row_count;
+    END IF;
+
+    INSERT INTO event_archives (range_start, range_end, file_name, format, row_count, sha256)
+    VALUES (v_partition.range_start, v_partition.range_end, p_file_name, p_format, p_row_count, p_sha256);
+    EXECUTE format('DROP TABLE %I', p_partition_name);
+
+    RETURN jsonb_build_object(
+        'partition', p_partition_name,
+        'range_start', v_partition.range_start,
+        'range_end', v_partition.range_end,
+        'row_count', v_rows
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- GET /events/export: every event (reversed ones included) in [p_from, p_to)
+-- in (timestamp, event_id) order, after the cursor position if one is given
+CREATE OR REPLACE FUNCTION export_events(
+    p_from TIMESTAMP,
+    p_to TIMESTAMP,
+    p_after_time TIMESTAMP DEFAULT NULL,
+    p_after_event_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 500
+)
+RETURNS SETOF events AS $$
+    SELECT e.*
+    FROM events e
+    WHERE e.timestamp >= GREATEST(p_from, p_after_time)
+      AND e.timestamp < p_to
+      AND (p_after_time IS NULL OR (e.timestamp, e.event_id) > (p_after_time, p_after_event_id))
+    ORDER BY e.timestamp, e.event_id
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- 010's rebuild, leaving the days up to the archive horizon alone: their
+-- events are gone, so the counters kept from when they were live stay
+CREATE OR REPLACE FUNCTION rebuild_daily_stats(p_utc_offset_minutes INTEGER DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    v_kept_until DATE;
+BEGIN
+    UPDATE stats_settings
+    SET utc_offset_minutes = COALESCE(p_utc_offset_minutes, utc_offset_minutes);
+
+    SELECT COALESCE(stats_local_day(events_archived_before(), utc_offset_minutes), '-infinity')
+    INTO v_kept_until
+    FROM stats_settings;
+
+    DELETE FROM daily_box_activity WHERE day > v_kept_until;
+    DELETE FROM daily_stats WHERE day > v_kept_until;
+
+    INSERT INTO daily_box_activity (day, event_type, box_id, event_count)
+    SELECT stats_local_day(e.timestamp, s.utc_offset_minutes), e.event_type, e.box_id, COUNT(*)
+    FROM events e, stats_settings s
+    WHERE e.reversed = FALSE
+      AND stats_local_day(e.timestamp, s.utc_offset_minutes) > v_kept_until
+    GROUP BY 1, 2, 3;
+
+    INSERT INTO daily_stats (day, event_type, event_count, box_count, exception_count)
+    SELECT stats_local_day(e.timestamp, s.utc_offset_minutes), e.event_type,
+           COUNT(*), COUNT(DISTINCT e.box_id), COUNT(e.exception_type)
+    FROM events e, stats_settings s
+    WHERE e.reversed = FALSE
+      AND stats_local_day(e.timestamp, s.utc_offset_minutes) > v_kept_until
+    GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 011's rebuild, except that a box whose last event was archived keeps its
+-- inventory_state row: it has no live events left, but it was not unscanned
+CREATE OR REPLACE FUNCTION rebuild_inventory_state(p_box_ids VARCHAR[] DEFAULT NULL)
+RETURNS JSONB AS $$
+DECLARE
+    v_updated INTEGER;
+    v_removed INTEGER;
+BEGIN
+    -- Serialize with scans of the same boxes, in a stable order to avoid deadlocks
+    PERFORM 1
+    FROM boxes
+    WHERE p_box_ids IS NULL OR box_id = ANY(p_box_ids)
+    ORDER BY box_id
+    FOR UPDATE;
+
+    WITH live AS (
+        SELECT box_id, event_id, event_type, location_id, timestamp
+        FROM events
+        WHERE reversed = FALSE
+          AND (p_box_ids IS NULL OR box_id = ANY(p_box_ids))
+    ),
+    last_event AS (
+        SELECT DISTINCT ON (box_id) box_id, event_type, timestamp
+        FROM live
+        ORDER BY box_id, timestamp DESC, event_id DESC
+    ),
+    -- The latest event that set or cleared the location decides it
+    last_location AS (
+        SELECT DISTINCT ON (box_id)
+            box_id,
+            CASE WHEN event_type = 'OUT' THEN NULL ELSE location_id END AS location_id
+        FROM live
+        WHERE event_type = 'OUT' OR location_id IS NOT NULL
+        ORDER BY box_id, timestamp DESC, event_id DESC
+    )
+    INSERT INTO inventory_state (box_id, status, current_location_id, last_event_time, last_event_type)
+    SELECT
+        l.box_id,
+        CASE WHEN l.event_type = 'OUT' THEN 'OUT_OF_WAREHOUSE' ELSE 'IN_STOCK' END,
+        loc.location_id,
+        l.timestamp,
+        l.event_type
+    FROM last_event l
+    LEFT JOIN last_location loc ON loc.box_id = l.box_id
+    ON CONFLICT (box_id) DO UPDATE
+    SET status = EXCLUDED.status,
+        current_location_id = EXCLUDED.current_location_id,
+        last_event_time = EXCLUDED.last_event_time,
+        last_event_type = EXCLUDED.last_event_type
+    WHERE (inventory_state.status, inventory_state.current_location_id, inventory_state.last_event_time, inventory_state.last_event_type)
+        IS DISTINCT FROM
+        (EXCLUDED.status, EXCLUDED.current_location_id, EXCLUDED.last_event_time, EXCLUDED.last_event_type);
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+
+    DELETE FROM inventory_state i
+    WHERE (p_box_ids IS NULL OR i.box_id = ANY(p_box_ids))
+      AND NOT EXISTS (
+          SELECT 1 FROM events e WHERE e.box_id = i.box_id AND e.reversed = FALSE
+      )
+      AND NOT COALESCE(i.last_event_time < events_archived_before(), FALSE);
+    GET DIAGNOSTICS v_removed = ROW_COUNT;
+
+    RETURN jsonb_build_object('updated', v_updated, 'removed', v_removed);
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_event_partitions(3);
+
+ANALYZE events;
+
+-- 004's record_scan, except that the idempotency key is looked up in
+-- event_keys: a retry of a scan whose month was archived is answered as a
+-- duplicate instead of failing on the event_keys unique violation
+CREATE OR REPLACE FUNCTION record_scan(
+    p_client_event_id UUID,
+    p_event_type VARCHAR,
+    p_box_id VARCHAR,
+    p_location_code VARCHAR,
+    p_mode VARCHAR,
+    p_source_type VARCHAR DEFAULT 'PHONE',
+    p_source_id VARCHAR DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_existing events%ROWTYPE;
+    v_key_event_id UUID;
+    v_box RECORD;
+    v_location_id UUID;
+    v_status VARCHAR;
+    v_current_location_id UUID;
+    v_exception_type VARCHAR;
+    v_warning TEXT;
+    v_changed BOOLEAN := TRUE;
+    v_message TEXT := 'Event created successfully';
+    v_event_id UUID;
+    v_timestamp TIMESTAMP;
+BEGIN
+    -- Box and product (also serializes concurrent scans of the same box)
+    SELECT b.box_id, b.lot_code, p.brand, p.name, p.size
+    INTO v_box
+    FROM boxes b
+    JOIN products p ON p.product_id = b.product_id
+    WHERE b.box_id = p_box_id
+    FOR UPDATE OF b;
+
+    -- Idempotency: a retried scan returns the stored event. Its key stays in
+    -- event_keys after the event is archived; the box then comes from the retry
+    SELECT event_id INTO v_key_event_id FROM event_keys WHERE client_event_id = p_client_event_id;
+    IF FOUND THEN
+        SELECT * INTO v_existing FROM events WHERE event_id = v_key_event_id;
+
+        SELECT b.box_id, b.lot_code, p.brand, p.name, p.size
+        INTO v_box
+        FROM boxes b
+        JOIN products p ON p.product_id = b.product_id
+        WHERE b.box_id = COALESCE(v_existing.box_id, p_box_id);
+
+        RETURN jsonb_build_object(
+            'success', TRUE,
+            'message', 'Event already processed',
+            'event_id', v_key_event_id,
+            'warning', NULL,
+            'exception_type', v_existing.exception_type,
+            'is_duplicate', TRUE,
+            'changed', FALSE,
+            'box_id', COALESCE(v_existing.box_id, p_box_id),
+            'product', jsonb_build_object('brand', v_box.brand, 'name', v_box.name, 'size', v_box.size),
+            'lot_code', v_box.lot_code
+        );
+    END IF;
+
+    IF v_box.box_id IS NULL THEN
+        RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'Unknown box. Create label first.');
+    END IF;
+
+    -- Resolve location_code
+    IF p_location_code IS NOT NULL AND p_location_code <> '' THEN
+        SELECT location_id INTO v_location_id FROM locations WHERE location_code = p_location_code;
+        IF v_location_id IS NULL THEN
+            RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'Location not found: ' || p_location_code);
+        END IF;
+    END IF;
+
+    -- T1: Mode matches event_type
+    IF (p_mode = 'INBOUND' AND p_event_type <> 'IN')
+        OR (p_mode = 'OUTBOUND' AND p_event_type <> 'OUT')
+        OR (p_mode = 'MOVE' AND p_event_type <> 'MOVE') THEN
+        RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'Mode does not match event type');
+    END IF;
+
+    -- T2: MOVE requires location_code
+    IF p_event_type = 'MOVE' AND v_location_id IS NULL THEN
+        RETURN jsonb_build_object('success', FALSE, 'status_code', 400, 'error', 'MOVE event requires location_code');
+    END IF;
+
+    SELECT status, current_location_id
+    INTO v_status, v_current_location_id
+    FROM inventory_state
+    WHERE box_id = p_box_id;
+
+    -- T3: MOVE only if IN_STOCK
+    IF p_event_type = 'MOVE' AND v_status = 'OUT_OF_WAREHOUSE' THEN
+        RETURN jsonb_build_object(
+            'success', FALSE,
+            'status_code', 400,
+            'error', 'Cannot move box that is out of warehouse. Please receive box first (INBOUND mode).',
+            'exception_type', 'MOVE_WHEN_OUT'
+        );
+    END IF;
+
+    -- T3: OUT without IN warning
+    IF p_event_type = 'OUT' AND NOT EXISTS (
+        SELECT 1 FROM events WHERE box_id = p_box_id AND event_type = 'IN'
+    ) THEN
+        v_exception_type := 'OUT_WITHOUT_IN';
+        v_warning := 'Box was never received (no IN event found)';
+    END IF;
+
+    -- T3: IN defaults to RECEIVING
+    IF p_event_type = 'IN' AND v_location_id IS NULL THEN
+        SELECT location_id INTO v_location_id FROM locations WHERE location_code = 'RECEIVING' LIMIT 1;
+    END IF;
+
+    IF p_event_type = 'MOVE' AND v_current_location_id = v_location_id THEN
+        v_changed := FALSE;
+        v_message := 'Box already at this location';
+    END IF;
+
+    INSERT INTO events (
+        client_event_id, event_type, box_id, location_id, mode,
+        source_type, source_id, exception_type, warning
+    )
+    VALUES (
+        p_client_event_id, p_event_type, p_box_id, v_location_id, p_mode,
+        COALESCE(p_source_type, 'PHONE'), p_source_id, v_exception_type, v_warning
+    )
+    RETURNING event_id, timestamp INTO v_event_id, v_timestamp;
+
+    INSERT INTO inventory_state (box_id, status, current_location_id, last_event_time, last_event_type)
+    VALUES (
+        p_box_id,
+        CASE WHEN p_event_type = 'OUT' THEN 'OUT_OF_WAREHOUSE' ELSE 'IN_STOCK' END,
+        CASE WHEN p_event_type = 'OUT' THEN NULL ELSE v_location_id END,
+        v_timestamp,
+        p_event_type
+    )
+    ON CONFLICT (box_id) DO UPDATE
+    SET status = EXCLUDED.status,
+        current_location_id = CASE
+            WHEN EXCLUDED.status = 'OUT_OF_WAREHOUSE' THEN NULL
+            ELSE COALESCE(EXCLUDED.current_location_id, inventory_state.current_location_id)
+        END,
+        last_event_time = EXCLUDED.last_event_time,
+        last_event_type = EXCLUDED.last_event_type;
+
+    RETURN jsonb_build_object(
+        'success', TRUE,
+        'message', v_message,
+        'event_id', v_event_id,
+        'warning', v_warning,
+        'exception_type', v_exception_type,
+        'is_duplicate', FALSE,
+        'changed', v_changed,
+        'box_id', p_box_id,
+        'product', jsonb_build_object('brand', v_box.brand, 'name', v_box.name, 'size', v_box.size),
+        'lot_code', v_box.lot_code
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- 005's record_scans, with its bulk idempotency lookup in event_keys too
+CREATE OR REPLACE FUNCTION record_scans(p_scans JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_item RECORD;
+    v_cid UUID;
+    v_cid_key TEXT;
+    v_event_type VARCHAR;
+    v_box_id VARCHAR;
+    v_location_code VARCHAR;
+    v_mode VARCHAR;
+    v_box JSONB;
+    v_box_state JSONB;
+    v_location_id UUID;
+    v_current_location_id UUID;
+    v_exception_type VARCHAR;
+    v_warning TEXT;
+    v_changed BOOLEAN;
+    v_message TEXT;
+    v_error TEXT;
+    v_event_id UUID;
+    v_timestamp TIMESTAMP;
+    v_now TIMESTAMP := LOCALTIMESTAMP;
+    v_receiving_id UUID;
+    v_boxes JSONB;
+    v_locations JSONB;
+    v_state JSONB;
+    v_existing JSONB;
+    v_accepted JSONB := '{}'::JSONB;
+    v_results JSONB[] := '{}';
+    a_event_id UUID[] := '{}';
+    a_client_event_id UUID[] := '{}';
+    a_event_type VARCHAR[] := '{}';
+    a_box_id VARCHAR[] := '{}';
+    a_location_id UUID[] := '{}';
+    a_timestamp TIMESTAMP[] := '{}';
+    a_mode VARCHAR[] := '{}';
+    a_source_type VARCHAR[] := '{}';
+    a_source_id VARCHAR[] := '{}';
+    a_exception_type VARCHAR[] := '{}';
+    a_warning TEXT[] := '{}';
+BEGIN
+    -- Lock every box in the batch, in a stable order to avoid deadlocks
+    PERFORM 1
+    FROM boxes
+    WHERE box_id IN (SELECT DISTINCT s->>'box_id' FROM jsonb_array_elements(p_scans) s)
+    ORDER BY box_id
+    FOR UPDATE;
+
+    -- Bulk idempotency: scans already stored, keyed by client_event_id in
+    -- event_keys (archived events answer with the box the retry names)
+    SELECT COALESCE(jsonb_object_agg(e.client_event_id::TEXT, jsonb_build_object(
+        'success', TRUE,
+        'message', 'Event already processed',
+        'event_id', e.event_id,
+        'warning', NULL,
+        'exception_type', e.exception_type,
+        'is_duplicate', TRUE,
+        'changed', FALSE,
+        'box_id', e.box_id,
+        'product', jsonb_build_object('brand', p.brand, 'name', p.name, 'size', p.size),
+        'lot_code', b.lot_code
+    )), '{}'::JSONB)
+    INTO v_existing
+    FROM (
+        SELECT DISTINCT ON (k.client_event_id)
+            k.client_event_id,
+            k.event_id,
+            e.exception_type,
+            COALESCE(e.box_id, s->>'box_id') AS box_id
+        FROM jsonb_array_elements(p_scans) s
+        JOIN event_keys k ON k.client_event_id = (s->>'client_event_id')::UUID
+        LEFT JOIN events e ON e.event_id = k.event_id
+        ORDER BY k.client_event_id
+    ) e
+    LEFT JOIN boxes b ON b.box_id = e.box_id
+    LEFT JOIN products p ON p.product_id = b.product_id;
+
+    -- Boxes with product info
+    SELECT COALESCE(jsonb_object_agg(b.box_id, jsonb_build_object(
+        'lot_code', b.lot_code,
+        'product', jsonb_build_object('brand', p.brand, 'name', p.name, 'size', p.size)
+    )), '{}'::JSONB)
+    INTO v_boxes
+    FROM boxes b
+    JOIN products p ON p.product_id = b.product_id
+    WHERE b.box_id IN (SELECT DISTINCT s->>'box_id' FROM jsonb_array_elements(p_scans) s);
+
+    -- Current state of those boxes, including whether they were ever received
+    SELECT COALESCE(jsonb_object_agg(b.box_id, jsonb_build_object(
+        'status', i.status,
+        'location_id', i.current_location_id,
+        'has_in', EXISTS (SELECT 1 FROM events e WHERE e.box_id = b.box_id AND e.event_type = 'IN')
+    )), '{}'::JSONB)
+    INTO v_state
+    FROM boxes b
+    LEFT JOIN inventory_state i ON i.box_id = b.box_id
+    WHERE b.box_id IN (SELECT DISTINCT s->>'box_id' FROM jsonb_array_elements(p_scans) s);
+
+    -- Locations referenced by the batch
+    SELECT COALESCE(jsonb_object_agg(l.location_code, l.location_id), '{}'::JSONB)
+    INTO v_locations
+    FROM locations l
+    WHERE l.location_code IN (
+        SELECT DISTINCT s->>'location_code' FROM jsonb_array_elements(p_scans) s
+    );
+
+    SELECT location_id INTO v_receiving_id FROM locations WHERE location_code = 'RECEIVING' LIMIT 1;
+
+    FOR v_item IN
+        SELECT value, ordinality FROM jsonb_array_elements(p_scans) WITH ORDINALITY ORDER BY ordinality
+    LOOP
+        v_cid := (v_item.value->>'client_event_id')::UUID;
+        v_cid_key := v_cid::TEXT;
+        v_event_type := v_item.value->>'event_type';
+        v_box_id := v_item.value->>'box_id';
+        v_location_code := NULLIF(v_item.value->>'location_code', '');
+        v_mode := v_item.value->>'mode';
+        v_error := NULL;
+        v_location_id := NULL;
+        v_exception_type := NULL;
+        v_warning := NULL;
+        v_changed := TRUE;
+        v_message := 'Event created successfully';
+
+        -- Idempotency: already stored, or accepted earlier in this batch
+        IF v_existing ? v_cid_key THEN
+            v_results := v_results || (v_existing->v_cid_key || jsonb_build_object('client_event_id', v_cid));
+            CONTINUE;
+        END IF;
+        IF v_accepted ? v_cid_key THEN
+            v_results := v_results || (
+                v_results[(v_accepted->>v_cid_key)::INTEGER]
+                || jsonb_build_object('message', 'Event already processed', 'is_duplicate', TRUE, 'changed', FALSE, 'warning', NULL)
+            );
+            CONTINUE;
+        END IF;
+
+        v_box := v_boxes->v_box_id;
+        v_box_state := v_state->v_box_id;
+
+        IF v_box IS NULL THEN
+            v_error := 'Unknown box. Create label first.';
+        ELSIF v_location_code IS NOT NULL AND NOT v_locations ? v_location_code THEN
+            v_error := 'Location not found: ' || v_location_code;
+        ELSIF (v_mode = 'INBOUND' AND v_event_type <> 'IN')
+            OR (v_mode = 'OUTBOUND' AND v_event_type <> 'OUT')
+            OR (v_mode = 'MOVE' AND v_event_type <> 'MOVE') THEN
+            v_error := 'Mode does not match event type';
+        ELSIF v_event_type = 'MOVE' AND v_location_code IS NULL THEN
+            v_error := 'MOVE event requires location_code';
+        ELSIF v_event_type = 'MOVE' AND v_box_state->>'status' = 'OUT_OF_WAREHOUSE' THEN
+            v_error := 'Cannot move box that is out of warehouse. Please receive box first (INBOUND mode).';
+            v_exception_type := 'MOVE_WHEN_OUT';
+        END IF;
+
+        IF v_error IS NOT NULL THEN
+            v_results := v_results || jsonb_build_object(
+                'client_event_id', v_cid,
+                'success', FALSE,
+                'status_code', 400,
+                'error', v_error,
+                'exception_type', v_exception_type
+            );
+            CONTINUE;
+        END IF;
+
+        IF v_location_code IS NOT NULL THEN
+            v_location_id := (v_locations->>v_location_code)::UUID;
+        END IF;
+
+        IF v_event_type = 'OUT' AND NOT (v_box_state->>'has_in')::BOOLEAN THEN
+            v_exception_type := 'OUT_WITHOUT_IN';
+            v_warning := 'Box was never received (no IN event found)';
+        END IF;
+
+        IF v_event_type = 'IN' AND v_location_id IS NULL THEN
+            v_location_id := v_receiving_id;
+        END IF;
+
+        v_current_location_id := (v_box_state->>'location_id')::UUID;
+        IF v_event_type = 'MOVE' AND v_current_location_id = v_location_id THEN
+            v_changed := FALSE;
+            v_message := 'Box already at this location';
+        END IF;
+
+        -- Keep events of one batch strictly ordered by timestamp
+        v_event_id := gen_random_uuid();
+        v_timestamp := v_now + (v_item.ordinality * INTERVAL '1 microsecond');
+
+        a_event_id := a_event_id || v_event_id;
+        a_client_event_id := a_client_event_id || v_cid;
+        a_event_type := a_event_type || v_event_type;
+        a_box_id := a_box_id || v_box_id;
+        a_location_id := a_location_id || v_location_id;
+        a_timestamp := a_timestamp || v_timestamp;
+        a_mode := a_mode || v_mode;
+        a_source_type := a_source_type || COALESCE(v_item.value->>'source_type', 'PHONE')::VARCHAR;
+        a_source_id := a_source_id || (v_item.value->>'source_id')::VARCHAR;
+        a_exception_type := a_exception_type || v_exception_type;
+        a_warning := a_warning || v_warning;
+
+        -- Fold the scan into the box's in-memory state
+        v_state := jsonb_set(v_state, ARRAY[v_box_id], jsonb_build_object(
+            'status', CASE WHEN v_event_type = 'OUT' THEN 'OUT_OF_WAREHOUSE' ELSE 'IN_STOCK' END,
+            'location_id', CASE
+                WHEN v_event_type = 'OUT' THEN NULL
+                ELSE COALESCE(v_location_id, v_current_location_id)
+            END,
+            'has_in', (v_box_state->>'has_in')::BOOLEAN OR v_event_type = 'IN',
+            'last_event_time', v_timestamp,
+            'last_event_type', v_event_type
+        ));
+
+        v_results := v_results || jsonb_build_object(
+            'client_event_id', v_cid,
+            'success', TRUE,
+            'message', v_message,
+            'event_id', v_event_id,
+            'warning', v_warning,
+            'exception_type', v_exception_type,
+            'is_duplicate', FALSE,
+            'changed', v_changed,
+            'box_id', v_box_id,
+            'product', v_box->'product',
+            'lot_code', v_box->'lot_code'
+        );
+        v_accepted := v_accepted || jsonb_build_object(v_cid_key, cardinality(v_results));
+    END LOOP;
+
+    INSERT INTO events (
+        event_id, client_event_id, event_type, box_id, location_id, timestamp,
+        mode, source_type, source_id, exception_type, warning
+    )
+    SELECT *
+    FROM unnest(
+        a_event_id, a_client_event_id, a_event_type, a_box_id, a_location_id, a_timestamp,
+        a_mode, a_source_type, a_source_id, a_exception_type, a_warning
+    );
+
+    INSERT INTO inventory_state (box_id, status, current_location_id, last_event_time, last_event_type)
+    SELECT
+        key,
+        value->>'status',
+        (value->>'location_id')::UUID,
+        (value->>'last_event_time')::TIMESTAMP,
+        value->>'last_event_type'
+    FROM jsonb_each(v_state)
+    WHERE value ? 'last_event_type'
+    ON CONFLICT (box_id) DO UPDATE
+    SET status = EXCLUDED.status,
+        current_location_id = EXCLUDED.current_location_id,
+        last_event_time = EXCLUDED.last_event_time,
+        last_event_type = EXCLUDED.last_event_type;
+
+    RETURN to_jsonb(v_results);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,199 @@
+-- Substring search for box IDs, brands and product names
+-- Migration 015 only matched box IDs by prefix or suffix and products by
+-- word prefix. Before it, GET /inventory?search= matched any substring of
+-- the box ID, brand or name (case-insensitive), and operators rely on that.
+-- A date ("20261018") finds the boxes created that day
+-- (BX-YYYYMMDD-######), and "ola" finds "Coca-Cola". Substring matches are
+-- added back through pg_trgm GIN indexes, which serve ILIKE '%...%'. The
+-- prefix, suffix, lot and word matches of migration 015 stay as they were.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_boxes_box_id_trgm ON boxes USING GIN (box_id gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_brand_trgm ON products USING GIN (brand gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name gin_trgm_ops);
+
+-- ILIKE pattern matching p_query anywhere: "%query%", with LIKE's
+-- wildcards and escape character in the query taken literally
+CREATE OR REPLACE FUNCTION search_contains_pattern(p_query TEXT)
+RETURNS TEXT AS $$
+    SELECT '%' || regexp_replace(trim(p_query), '([\\%_])', '\\\1', 'g') || '%';
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION search_boxes(p_query TEXT, p_limit INTEGER DEFAULT 10)
+RETURNS TABLE (
+    box_id VARCHAR,
+    product_id UUID,
+    brand VARCHAR,
+    name VARCHAR,
+    lot_code VARCHAR,
+    status VARCHAR,
+    location_code VARCHAR,
+    rank INTEGER
+) AS $$
+    WITH matches AS (
+        (
+            SELECT b.box_id, CASE WHEN b.box_id = search_box_id(p_query) THEN 3 ELSE 2 END AS rank
+            FROM boxes b
+            WHERE b.box_id ~>=~ search_box_id(p_query)
+              AND b.box_id ~<~ search_prefix_end(search_box_id(p_query))
+            -- Newest first, read backwards from idx_boxes_box_id_prefix
+            ORDER BY b.box_id USING ~>~
+            LIMIT p_limit
+        )
+        UNION ALL
+        (
+            SELECT b.box_id, 1
+            FROM boxes b
+            WHERE reverse(b.box_id) ~>=~ reverse(search_box_id(p_query))
+              AND reverse(b.box_id) ~<~ search_prefix_end(reverse(search_box_id(p_query)))
+              AND NOT starts_with(b.box_id, search_box_id(p_query))
+            ORDER BY reverse(b.box_id)
+            LIMIT p_limit
+        )
+        UNION ALL
+        (
+            -- Anywhere else in the ID, e.g. the date segment (idx_boxes_box_id_trgm)
+            SELECT b.box_id, 0
+            FROM boxes b
+            WHERE b.box_id ILIKE search_contains_pattern(search_box_id(p_query))
+              AND NOT starts_with(b.box_id, search_box_id(p_query))
+              AND NOT starts_with(reverse(b.box_id), reverse(search_box_id(p_query)))
+            ORDER BY b.box_id DESC
+            LIMIT p_limit
+        )
+    ),
+    ranked AS (
+        SELECT box_id, rank
+        FROM matches
+        ORDER BY rank DESC, box_id DESC
+        LIMIT p_limit
+    )
+    SELECT
+        r.box_id,
+        b.product_id,
+        p.brand,
+        p.name,
+        b.lot_code,
+        i.status,
+        l.location_code,
+        r.rank
+    FROM ranked r
+    JOIN boxes b ON b.box_id = r.box_id
+    JOIN products p ON p.product_id = b.product_id
+    LEFT JOIN inventory_state i ON i.box_id = r.box_id
+    LEFT JOIN locations l ON l.location_id = i.current_location_id
+    ORDER BY r.rank DESC, r.box_id DESC;
+$$ LANGUAGE sql STABLE;
+
+-- Box IDs matching a search: box ID prefix, suffix or substring, lot
+-- prefix, product words, or a substring of the brand or name
+CREATE OR REPLACE FUNCTION search_box_matches(p_query TEXT)
+RETURNS TABLE (box_id VARCHAR) AS $$
+    SELECT b.box_id
+    FROM boxes b
+    WHERE b.box_id ~>=~ search_box_id(p_query)
+      AND b.box_id ~<~ search_prefix_end(search_box_id(p_query))
+    UNION
+    SELECT b.box_id
+    FROM boxes b
+    WHERE reverse(b.box_id) ~>=~ reverse(search_box_id(p_query))
+      AND reverse(b.box_id) ~<~ search_prefix_end(reverse(search_box_id(p_query)))
+    UNION
+    SELECT b.box_id
+    FROM boxes b
+    WHERE b.box_id ILIKE search_contains_pattern(search_box_id(p_query))
+    UNION
+    SELECT b.box_id
+    FROM boxes b
+    WHERE lower(b.lot_code) ~>=~ lower(trim(p_query))
+      AND lower(b.lot_code) ~<~ search_prefix_end(lower(trim(p_query)))
+    UNION
+    SELECT b.box_id
+    FROM products p
+    JOIN boxes b ON b.product_id = p.product_id
+    WHERE p.search_vector @@ search_tsquery(p_query)
+       OR p.brand ILIKE search_contains_pattern(p_query)
+       OR p.name ILIKE search_contains_pattern(p_query);
+$$ LANGUAGE sql STABLE;
+
+-- Same as migration 015, with the substring matches in the row-by-row
+-- filter used for searches matching many boxes
+CREATE OR REPLACE FUNCTION search_inventory(
+    p_status VARCHAR DEFAULT NULL,
+    p_location_id UUID DEFAULT NULL,
+    p_search TEXT DEFAULT NULL,
+    p_event_type VARCHAR DEFAULT NULL,
+    p_event_from TIMESTAMP DEFAULT NULL,
+    p_event_to TIMESTAMP DEFAULT NULL,
+    p_date_from TIMESTAMP DEFAULT NULL,
+    p_date_to TIMESTAMP DEFAULT NULL,
+    p_after_time TIMESTAMP DEFAULT NULL,
+    p_after_box_id VARCHAR DEFAULT NULL,
+    p_limit INTEGER DEFAULT NULL
+)
+RETURNS SETOF inventory_view AS $$
+DECLARE
+    v_search_filter TEXT := '';
+    v_matches INTEGER;
+BEGIN
+    IF p_search IS NOT NULL THEN
+        SELECT COUNT(*) INTO v_matches
+        FROM (SELECT 1 FROM search_box_matches(p_search) LIMIT 1000) m;
+
+        IF v_matches < 1000 THEN
+            v_search_filter := 'AND v.box_id IN (SELECT box_id FROM search_box_matches($3))';
+        ELSE
+            v_search_filter := $filter$AND (
+                v.box_id ILIKE search_contains_pattern(search_box_id($3))
+                OR starts_with(lower(v.lot_code), lower(trim($3)))
+                OR v.product_id IN (
+                    SELECT product_id FROM products
+                    WHERE search_vector @@ search_tsquery($3)
+                       OR brand ILIKE search_contains_pattern($3)
+                       OR name ILIKE search_contains_pattern($3)
+                )
+            )$filter$;
+        END IF;
+    END IF;
+
+    -- $1..$11 are the arguments in declaration order (see USING)
+    RETURN QUERY EXECUTE format($query$
+    SELECT v.*
+    FROM inventory_view v
+    WHERE ($1 IS NULL OR v.status = $1)
+      AND ($2 IS NULL OR v.current_location_id = $2)
+      AND ($7 IS NULL OR v.last_event_time >= $7)
+      AND ($8 IS NULL OR v.last_event_time < $8)
+      %s
+      AND (
+          $4 IS NULL
+          OR EXISTS (
+              SELECT 1
+              FROM events e
+              WHERE e.box_id = v.box_id
+                AND e.event_type = $4
+                AND e.reversed = FALSE
+                AND e.timestamp >= $5
+                AND e.timestamp < $6
+          )
+      )
+      -- Rows after the cursor in (last_event_time DESC NULLS LAST, box_id DESC) order
+      AND (
+          $10 IS NULL
+          OR (
+              $9 IS NOT NULL
+              AND (
+                  (v.last_event_time, v.box_id) < ($9, $10)
+                  OR v.last_event_time IS NULL
+              )
+          )
+          OR ($9 IS NULL AND v.last_event_time IS NULL AND v.box_id < $10)
+      )
+    ORDER BY v.last_event_time DESC NULLS LAST, v.box_id DESC
+    LIMIT $11
+    $query$, v_search_filter)
+    USING p_status, p_location_id, p_search, p_event_type, p_event_from, p_event_to,
+        p_date_from, p_date_to, p_after_time, p_after_box_id, p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
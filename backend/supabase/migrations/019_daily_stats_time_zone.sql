@@ -0,0 +1,219 @@
+-- Daily stats bucketed by a fixed time zone instead of a UTC offset
+-- Migration 010 keyed daily_stats on the API's current UTC offset, and
+-- get_daily_stats rebuilt the whole rollup whenever the offset it was
+-- called with changed: at every DST switch, inside a dashboard request, and
+-- re-bucketing past days with the new offset (a summer day read in winter
+-- was off by an hour). The rollup is now bucketed by the IANA time zone in
+-- stats_settings.time_zone, converted with AT TIME ZONE, so DST is applied
+-- per event and an event's day never changes. get_daily_stats only reads.
+--
+-- time_zone is the one warehouse time zone: the API reads it for "today"
+-- and for local date filters, and exception_summary buckets its days by it
+-- instead of taking a UTC offset. It starts as the database's TimeZone
+-- setting. If the warehouse is elsewhere (Supabase databases run in UTC),
+-- set it once with
+--     python scripts/daily_stats.py set-time-zone Europe/Berlin
+-- which rebuilds the rollup in one transaction.
+
+ALTER TABLE stats_settings ADD COLUMN IF NOT EXISTS time_zone TEXT;
+
+UPDATE stats_settings SET time_zone = current_setting('TimeZone') WHERE time_zone IS NULL;
+
+ALTER TABLE stats_settings ALTER COLUMN time_zone SET DEFAULT 'UTC';
+ALTER TABLE stats_settings ALTER COLUMN time_zone SET NOT NULL;
+
+-- Local day in p_time_zone of an event timestamp (stored in UTC)
+CREATE OR REPLACE FUNCTION stats_local_day(p_timestamp TIMESTAMP, p_time_zone TEXT)
+RETURNS DATE AS $$
+    SELECT ((p_timestamp AT TIME ZONE 'UTC') AT TIME ZONE p_time_zone)::DATE;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION daily_stats_on_insert()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_time_zone TEXT;
+    v_delta JSONB;
+BEGIN
+    SELECT time_zone INTO v_time_zone FROM stats_settings;
+
+    SELECT jsonb_agg(d) INTO v_delta
+    FROM (
+        SELECT
+            stats_local_day(timestamp, v_time_zone) AS day,
+            event_type,
+            box_id,
+            COUNT(*) AS events,
+            COUNT(exception_type) AS exceptions
+        FROM new_events
+        WHERE NOT COALESCE(reversed, FALSE)
+        GROUP BY 1, 2, 3
+    ) d;
+
+    IF v_delta IS NOT NULL THEN
+        PERFORM apply_daily_stats_delta(v_delta);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION daily_stats_on_reverse()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_time_zone TEXT;
+    v_delta JSONB;
+BEGIN
+    SELECT time_zone INTO v_time_zone FROM stats_settings;
+
+    -- Undo subtracts the event; clearing reversed adds it back
+    SELECT jsonb_agg(d) INTO v_delta
+    FROM (
+        SELECT
+            stats_local_day(n.timestamp, v_time_zone) AS day,
+            n.event_type,
+            n.box_id,
+            SUM(CASE WHEN n.reversed THEN -1 ELSE 1 END) AS events,
+            SUM(CASE WHEN n.exception_type IS NULL THEN 0 WHEN n.reversed THEN -1 ELSE 1 END) AS exceptions
+        FROM new_events n
+        JOIN old_events o ON o.event_id = n.event_id
+        WHERE COALESCE(n.reversed, FALSE) IS DISTINCT FROM COALESCE(o.reversed, FALSE)
+        GROUP BY 1, 2, 3
+    ) d;
+
+    IF v_delta IS NOT NULL THEN
+        PERFORM apply_daily_stats_delta(v_delta);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP FUNCTION IF EXISTS get_daily_stats(DATE, INTEGER);
+DROP FUNCTION IF EXISTS rebuild_daily_stats(INTEGER);
+DROP FUNCTION IF EXISTS stats_local_day(TIMESTAMP, INTEGER);
+ALTER TABLE stats_settings DROP COLUMN IF EXISTS utc_offset_minutes;
+
+-- Recompute the rollup from events, optionally for a new time zone. Scans
+-- every live event and holds off scans until it commits: run from a
+-- migration or scripts/daily_stats.py, never from a request. As in 017,
+-- the days up to the archive horizon keep their counters, since their
+-- events are gone.
+CREATE OR REPLACE FUNCTION rebuild_daily_stats(p_time_zone TEXT DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    v_time_zone TEXT;
+    v_kept_until DATE;
+BEGIN
+    -- Scans in flight finish first; later ones wait and use the new zone
+    LOCK TABLE events IN SHARE MODE;
+
+    UPDATE stats_settings
+    SET time_zone = COALESCE(p_time_zone, time_zone)
+    RETURNING time_zone INTO v_time_zone;
+
+    -- Reject unknown zone names before deleting anything
+    PERFORM now() AT TIME ZONE v_time_zone;
+
+    v_kept_until := COALESCE(stats_local_day(events_archived_before(), v_time_zone), '-infinity');
+
+    DELETE FROM daily_box_activity WHERE day > v_kept_until;
+    DELETE FROM daily_stats WHERE day > v_kept_until;
+
+    INSERT INTO daily_box_activity (day, event_type, box_id, event_count)
+    SELECT stats_local_day(e.timestamp, v_time_zone), e.event_type, e.box_id, COUNT(*)
+    FROM events e
+    WHERE e.reversed = FALSE
+      AND stats_local_day(e.timestamp, v_time_zone) > v_kept_until
+    GROUP BY 1, 2, 3;
+
+    INSERT INTO daily_stats (day, event_type, event_count, box_count, exception_count)
+    SELECT stats_local_day(e.timestamp, v_time_zone), e.event_type,
+           COUNT(*), COUNT(DISTINCT e.box_id), COUNT(e.exception_type)
+    FROM events e
+    WHERE e.reversed = FALSE
+      AND stats_local_day(e.timestamp, v_time_zone) > v_kept_until
+    GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Counters for one local day (in stats_settings.time_zone): reads the
+-- day's rows of the rollup, nothing else
+CREATE OR REPLACE FUNCTION get_daily_stats(p_day DATE)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'day', p_day,
+        'received', COALESCE(SUM(box_count) FILTER (WHERE event_type = 'IN'), 0),
+        'moved', COALESCE(SUM(box_count) FILTER (WHERE event_type = 'MOVE'), 0),
+        'shipped', COALESCE(SUM(box_count) FILTER (WHERE event_type = 'OUT'), 0),
+        'exceptions', COALESCE(SUM(exception_count), 0),
+        'events', COALESCE(jsonb_object_agg(event_type, event_count) FILTER (WHERE event_type IS NOT NULL), '{}'::JSONB)
+    )
+    FROM daily_stats
+    WHERE day = p_day;
+$$ LANGUAGE sql STABLE;
+
+-- Re-bucket the days built with 010's UTC offset
+SELECT rebuild_daily_stats();
+
+-- 008's exception_summary, with days in stats_settings.time_zone
+DROP FUNCTION IF EXISTS exception_summary(TIMESTAMP, TIMESTAMP, INTEGER, VARCHAR);
+
+CREATE OR REPLACE FUNCTION exception_summary(
+    p_from TIMESTAMP,
+    p_to TIMESTAMP,
+    p_exception_type VARCHAR DEFAULT NULL
+)
+RETURNS JSONB AS $$
+    WITH base AS (
+        SELECT
+            e.exception_type,
+            stats_local_day(e.timestamp, s.time_zone) AS day,
+            b.product_id,
+            e.source_type
+        FROM events e
+        JOIN boxes b ON b.box_id = e.box_id
+        CROSS JOIN stats_settings s
+        WHERE e.exception_type IS NOT NULL
+          AND e.reversed = FALSE
+          AND e.timestamp >= p_from
+          AND e.timestamp < p_to
+          AND (p_exception_type IS NULL OR e.exception_type = p_exception_type)
+    ),
+    grouped AS (
+        -- GROUPING() bitmask: 7 = by type, 11 = by day, 13 = by product, 14 = by source, 15 = total
+        SELECT
+            exception_type,
+            day,
+            product_id,
+            source_type,
+            GROUPING(exception_type, day, product_id, source_type) AS grouping_set,
+            COUNT(*) AS count
+        FROM base
+        GROUP BY GROUPING SETS ((exception_type), (day), (product_id), (source_type), ())
+    )
+    SELECT jsonb_build_object(
+        'total', COALESCE((SELECT count FROM grouped WHERE grouping_set = 15), 0),
+        'by_type', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('exception_type', exception_type, 'count', count) ORDER BY count DESC, exception_type)
+            FROM grouped WHERE grouping_set = 7
+        ), '[]'::JSONB),
+        'by_day', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('day', day, 'count', count) ORDER BY day)
+            FROM grouped WHERE grouping_set = 11
+        ), '[]'::JSONB),
+        'by_product', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'product_id', g.product_id,
+                'brand', p.brand,
+                'name', p.name,
+                'size', p.size,
+                'count', g.count
+            ) ORDER BY g.count DESC, p.brand, p.name)
+            FROM grouped g
+            JOIN products p ON p.product_id = g.product_id
+            WHERE g.grouping_set = 13
+        ), '[]'::JSONB),
+        'by_source', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('source_type', source_type, 'count', count) ORDER BY count DESC, source_type)
+            FROM grouped WHERE grouping_set = 14
+        ), '[]'::JSONB)
+    );
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,23 @@
+-- Warehouse-wide occupancy as one JSON value
+-- GET /locations/occupancy read location_occupancy (migration 013) as a
+-- set of rows and summed it in the API. PostgREST caps every response,
+-- RPC results included, at db-max-rows (1000 on Supabase), so a warehouse
+-- with more locations got a truncated list and wrong totals without any
+-- error. location_occupancy_report computes the totals in SQL and returns
+-- them with the per-location rows as a single JSONB value, which the cap
+-- does not apply to.
+
+CREATE OR REPLACE FUNCTION location_occupancy_report(
+    p_zone VARCHAR DEFAULT NULL,
+    p_aisle VARCHAR DEFAULT NULL,
+    p_include_empty BOOLEAN DEFAULT TRUE
+)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_locations', COUNT(*),
+        'occupied_locations', COUNT(*) FILTER (WHERE o.box_count > 0),
+        'total_boxes', COALESCE(SUM(o.box_count), 0),
+        'locations', COALESCE(jsonb_agg(to_jsonb(o) ORDER BY o.zone, o.aisle, o.rack, o.shelf, o.location_code), '[]'::JSONB)
+    )
+    FROM location_occupancy(p_zone, p_aisle, p_include_empty) o;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,73 @@
+-- Product stock totals computed in SQL, returned as one JSON value
+-- GET /products/stock read product_stock (migration 014) row by row and
+-- summed it in the API. Without a product filter that is the whole
+-- projection, which PostgREST cuts off at db-max-rows (1000 on Supabase)
+-- without an error, so the totals came out wrong. product_stock_report
+-- groups by product, lot and location in the database and returns the
+-- response body as a single JSONB value.
+
+CREATE OR REPLACE FUNCTION product_stock_report(
+    p_product_id UUID DEFAULT NULL,
+    p_lot_code VARCHAR DEFAULT NULL
+)
+RETURNS JSONB AS $$
+    WITH stock AS (
+        SELECT s.product_id, s.lot_code, s.location_id, s.box_count
+        FROM product_stock s
+        WHERE (p_product_id IS NULL OR s.product_id = p_product_id)
+          AND (p_lot_code IS NULL OR s.lot_code = p_lot_code)
+    ),
+    by_lot AS (
+        SELECT
+            product_id,
+            SUM(box_count) AS in_stock,
+            jsonb_agg(jsonb_build_object(
+                'lot_code', NULLIF(lot_code, ''),
+                'box_count', box_count
+            ) ORDER BY lot_code) AS lots
+        FROM (
+            SELECT product_id, lot_code, SUM(box_count) AS box_count
+            FROM stock
+            GROUP BY product_id, lot_code
+        ) l
+        GROUP BY product_id
+    ),
+    by_location AS (
+        SELECT
+            s.product_id,
+            jsonb_agg(jsonb_build_object(
+                'location_id', l.location_id,
+                'location_code', l.location_code,
+                'box_count', s.box_count
+            ) ORDER BY COALESCE(l.location_code, '')) AS locations
+        FROM (
+            SELECT product_id, location_id, SUM(box_count) AS box_count
+            FROM stock
+            GROUP BY product_id, location_id
+        ) s
+        -- The nil UUID (no location) matches no row and comes out as null
+        LEFT JOIN locations l ON l.location_id = s.location_id
+        GROUP BY s.product_id
+    ),
+    entries AS (
+        SELECT
+            p.product_id,
+            p.brand,
+            p.name,
+            p.size,
+            COALESCE(bl.in_stock, 0) AS in_stock,
+            COALESCE(bl.lots, '[]'::JSONB) AS by_lot,
+            COALESCE(bloc.locations, '[]'::JSONB) AS by_location
+        FROM products p
+        LEFT JOIN by_lot bl ON bl.product_id = p.product_id
+        LEFT JOIN by_location bloc ON bloc.product_id = p.product_id
+        WHERE (p_product_id IS NULL OR p.product_id = p_product_id)
+          -- A requested product is listed even with no stock
+          AND (bl.product_id IS NOT NULL OR p.product_id = p_product_id)
+    )
+    SELECT jsonb_build_object(
+        'total_boxes', COALESCE(SUM(in_stock), 0),
+        'products', COALESCE(jsonb_agg(to_jsonb(e) ORDER BY COALESCE(e.brand, ''), COALESCE(e.name, '')), '[]'::JSONB)
+    )
+    FROM entries e;
+$$ LANGUAGE sql STABLE;
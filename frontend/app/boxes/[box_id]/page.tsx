@@ -18,6 +18,7 @@ export default function BoxDetailsPage() {
   const boxId = params.box_id as string;
   const [box, setBox] = useState<BoxDetails | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     if (boxId) {
@@ -37,6 +38,19 @@ export default function BoxDetailsPage() {
     }
   };
 
+  const loadMoreEvents = async () => {
+    if (!box?.next_since) return;
+    try {
+      setLoadingMore(true);
+      const data = await getBox(boxId, { since: box.next_since });
+      setBox({ ...box, events: [...box.events, ...data.events], next_since: data.next_since });
+    } catch (error: any) {
+      toast.error('Failed to load more events');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return (
       <PageTransition>
@@ -198,7 +212,7 @@ export default function BoxDetailsPage() {
               <Clock className="w-5 h-5 text-slate-600" />
               Complete Event History
             </h2>
-            <span className="text-sm text-slate-600 font-semibold">{box.events.length} event{box.events.length !== 1 ? 's' : ''}</span>
+            <span className="text-sm text-slate-600 font-semibold">{box.events.length}{box.next_since ? '+' : ''} event{box.events.length !== 1 ? 's' : ''}</span>
       </div>
 
           <motion.div
@@ -213,7 +227,7 @@ export default function BoxDetailsPage() {
               </div>
               <div className="flex-1">
                 <p className="font-semibold mb-2 text-blue-900">Event history:</p>
-                <p className="text-sm text-blue-800">This shows the complete audit trail of all events for this box, from creation to current status. Events are shown in chronological order (newest first).</p>
+                <p className="text-sm text-blue-800">This shows the complete audit trail of all events for this box, from creation to current status. Events are shown newest first.</p>
               </div>
             </div>
           </motion.div>
@@ -273,6 +287,15 @@ export default function BoxDetailsPage() {
               ))
           )}
         </div>
+          {box.next_since && (
+            <button
+              onClick={loadMoreEvents}
+              disabled={loadingMore}
+              className="mt-6 w-full px-4 py-2.5 bg-slate-100 text-slate-700 rounded-xl hover:bg-slate-200 transition-colors text-sm font-semibold disabled:opacity-50"
+            >
+              {loadingMore ? 'Loading...' : 'Load older events'}
+            </button>
+          )}
         </motion.div>
       </div>
     </PageTransition>
@@ -1,7 +1,6 @@
 'use client';
 
-import { useEffect, useState } from 'react';
-import { getStatsToday } from '@/lib/api';
+import { useLiveStats } from '@/lib/stream';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Package, ArrowRight } from 'lucide-react';
 import { cn } from '@/lib/utils';
@@ -11,32 +10,8 @@ interface PriorityActionsProps {
 }
 
 export default function PriorityActions({ onStartMove }: PriorityActionsProps) {
-  const [toPutAway, setToPutAway] = useState<number | null>(null);
-  const [loading, setLoading] = useState(true);
-
-  const fetchStats = async () => {
-    try {
-      const statsData = await getStatsToday();
-      setToPutAway(statsData.to_put_away);
-      setLoading(false);
-    } catch (error) {
-      console.error('Failed to fetch stats:', error);
-      setLoading(false);
-    }
-  };
-
-  useEffect(() => {
-    fetchStats();
-
-    // Auto-refresh every 9 seconds
-    const interval = setInterval(() => {
-      fetchStats();
-    }, 9000);
-
-    return () => {
-      clearInterval(interval);
-    };
-  }, []);
+  const { stats, loading } = useLiveStats();
+  const toPutAway = stats?.to_put_away ?? null;
 
   // Only show when there are boxes to put away
   if (loading || !toPutAway || toPutAway === 0) {
@@ -2,7 +2,7 @@
 
 import { useEffect, useState } from 'react';
 import { useRouter } from 'next/navigation';
-import { getStatsToday } from '@/lib/api';
+import { useLiveStats } from '@/lib/stream';
 import { motion } from 'framer-motion';
 import { Download, Truck, Package, AlertTriangle, Clock } from 'lucide-react';
 import { cn } from '@/lib/utils';
@@ -13,39 +13,14 @@ interface TodayMetricsProps {
 
 export default function TodayMetrics({ onWaitingClick }: TodayMetricsProps) {
   const router = useRouter();
-  const [stats, setStats] = useState<{
-    received_today: number;
-    shipped_today: number;
-    to_put_away: number;
-    exceptions_today: number;
-  } | null>(null);
-  const [lastSuccessAt, setLastSuccessAt] = useState<Date | null>(null);
-  const [loading, setLoading] = useState(true);
-
-  const fetchStats = async () => {
-    try {
-      const statsData = await getStatsToday();
-      setStats({
-        received_today: statsData.received_today,
-        shipped_today: statsData.shipped_today,
-        to_put_away: statsData.to_put_away,
-        exceptions_today: statsData.exceptions_today,
-      });
-      setLastSuccessAt(new Date());
-      setLoading(false);
-    } catch (error) {
-      console.error('Failed to fetch stats:', error);
-      setLoading(false);
-    }
-  };
+  const { stats, lastSuccessAt, loading } = useLiveStats();
+  const [, setNow] = useState(0);
 
   useEffect(() => {
-    fetchStats();
-
-    // Auto-refresh every 9 seconds
+    // Stats are pushed over /stream; only re-render so "Last synced" stays accurate
     const interval = setInterval(() => {
-      fetchStats();
-    }, 9000);
+      setNow(Date.now());
+    }, 10000);
 
     return () => {
       clearInterval(interval);
@@ -29,8 +29,11 @@ export const createBox = async (data: { product_id: string; lot_code?: string })
   return response.data;
 };
 
-export const getBox = async (box_id: string): Promise<BoxDetails> => {
-  const response = await api.get(`/boxes/${box_id}`);
+export const getBox = async (box_id: string, params?: {
+  since?: string;
+  limit?: number;
+}): Promise<BoxDetails> => {
+  const response = await api.get(`/boxes/${box_id}`, { params });
   return response.data;
 };
 
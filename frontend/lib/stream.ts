@@ -0,0 +1,96 @@
+/** Live feed (/stream) client: one shared Server-Sent Events connection per page */
+import { useEffect, useState } from 'react';
+import { getStatsToday } from './api';
+
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+
+export type StreamMessageType = 'stats' | 'stats_delta' | 'event_created' | 'event_undone' | 'resync';
+type StreamListener = (type: StreamMessageType, data: any) => void;
+
+const MESSAGE_TYPES: StreamMessageType[] = ['stats', 'stats_delta', 'event_created', 'event_undone', 'resync'];
+
+let source: EventSource | null = null;
+const listeners = new Set<StreamListener>();
+
+export const isStreamSupported = () => typeof window !== 'undefined' && 'EventSource' in window;
+
+export const subscribeToStream = (listener: StreamListener): (() => void) => {
+  listeners.add(listener);
+
+  if (!source && isStreamSupported()) {
+    source = new EventSource(`${API_BASE_URL}/stream`);
+    MESSAGE_TYPES.forEach((type) => {
+      source!.addEventListener(type, (event) => {
+        const raw = (event as MessageEvent).data;
+        const data = raw ? JSON.parse(raw) : {};
+        listeners.forEach((notify) => notify(type, data));
+      });
+    });
+  }
+
+  return () => {
+    listeners.delete(listener);
+    // Close the connection once nothing on the page is listening
+    if (listeners.size === 0 && source) {
+      source.close();
+      source = null;
+    }
+  };
+};
+
+export interface LiveStats {
+  received_today: number;
+  to_put_away: number;
+  moved_today: number;
+  shipped_today: number;
+  exceptions_today: number;
+}
+
+// Used only where EventSource is unavailable
+const FALLBACK_POLL_MS = 9000;
+
+/** Today's counters, pushed by the server instead of polled. */
+export const useLiveStats = () => {
+  const [stats, setStats] = useState<LiveStats | null>(null);
+  const [lastSuccessAt, setLastSuccessAt] = useState<Date | null>(null);
+  const [loading, setLoading] = useState(true);
+
+  useEffect(() => {
+    const fetchStats = async () => {
+      try {
+        const statsData = await getStatsToday();
+        setStats({
+          received_today: statsData.received_today,
+          to_put_away: statsData.to_put_away,
+          moved_today: statsData.moved_today,
+          shipped_today: statsData.shipped_today,
+          exceptions_today: statsData.exceptions_today,
+        });
+        setLastSuccessAt(new Date());
+      } catch (error) {
+        console.error('Failed to fetch stats:', error);
+      } finally {
+        setLoading(false);
+      }
+    };
+
+    if (!isStreamSupported()) {
+      fetchStats();
+      const interval = setInterval(fetchStats, FALLBACK_POLL_MS);
+      return () => clearInterval(interval);
+    }
+
+    // The stream opens with a stats snapshot (and again after reconnecting)
+    return subscribeToStream((type, data) => {
+      if (type === 'stats' || type === 'stats_delta') {
+        setStats(type === 'stats' ? data : data.stats);
+        setLastSuccessAt(new Date());
+        setLoading(false);
+      } else if (type === 'resync') {
+        fetchStats();
+      }
+    });
+  }, []);
+
+  return { stats, lastSuccessAt, loading };
+};
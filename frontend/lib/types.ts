@@ -61,4 +61,5 @@ export interface BoxDetails {
   status: string;
   current_location?: Location;
   events: any[];
+  next_since?: string | null;
 }